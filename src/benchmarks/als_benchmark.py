@@ -0,0 +1,66 @@
+r"""ALSRecommenderとNMFRecommenderの学習時間と精度を比較するベンチマーク
+
+ALSRecommenderはスレッド数ごとに学習時間を計測する。NMFRecommenderは欠損値を0とみなして
+scikit-learnのNMFで分解する。どちらも同じ因子数で学習し、同じ上位の選択で推薦する。
+
+    python -m src.benchmarks.als_benchmark --data-path data/ml-10m/ml-10M100K \
+        --factors 10 --threads 1 2 4
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.jobs.train import Train
+from src.models.als_recommender import ALSRecommender
+from src.models.nmf_recommender import NMFRecommender
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--factors", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=15)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    train = Train()
+
+    runs = [
+        (
+            f"als_threads{num_threads}",
+            ALSRecommender(),
+            {
+                "factors": args.factors,
+                "iterations": args.iterations,
+                "num_threads": num_threads,
+            },
+        )
+        for num_threads in args.threads
+    ]
+    runs.append(("nmf", NMFRecommender(), {"factors": args.factors}))
+
+    rows = []
+    for name, model, params in runs:
+        start = time.perf_counter()
+        model.fit(dataset, **params)
+        fit_sec = time.perf_counter() - start
+        metrics = train.evaluate(dataset, model.recommend_result(dataset))
+        rows.append(
+            {
+                "model": name,
+                "fit_sec": fit_sec,
+                "precision_at_k": metrics.precision_at_k,
+                "recall_at_k": metrics.recall_at_k,
+                "ndcg_at_k": metrics.ndcg_at_k,
+            }
+        )
+
+    print(pd.DataFrame(rows).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
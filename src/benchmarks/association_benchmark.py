@@ -0,0 +1,79 @@
+r"""頻出アイテム集合とアソシエーションルールの計算を、mlxtendとfrequent_itemsetsで比較するベンチマーク
+
+MovieLensの学習データを高評価(4以上)の0/1の疎行列にし、min_supportごとに計算時間とピークメモリを計測する。
+mlxtendは支持度が低いと候補が爆発するため、--mlxtend-min-support未満では計測しない。
+
+    python -m src.benchmarks.association_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-users 1000
+"""
+import argparse
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.frequent_itemsets import association_rules, frequent_itemsets
+
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024**2
+
+
+def _mlxtend(matrix, min_support: float):
+    from mlxtend.frequent_patterns import apriori
+    from mlxtend.frequent_patterns import association_rules as mlxtend_rules
+
+    frequent = apriori(
+        pd.DataFrame.sparse.from_spmatrix(matrix.astype(bool)), min_support=min_support
+    )
+    return mlxtend_rules(frequent, metric="lift", min_threshold=1)
+
+
+def _eclat(matrix, min_support: float):
+    frequent = frequent_itemsets(matrix, min_support=min_support)
+    return association_rules(frequent, metric="lift", min_threshold=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument(
+        "--min-support", type=float, nargs="+", default=[0.2, 0.1, 0.05, 0.02]
+    )
+    parser.add_argument("--mlxtend-min-support", type=float, default=0.05)
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    matrix = dataset.interaction_matrix.binarized
+    print(f"users={matrix.shape[0]} movies={matrix.shape[1]} nnz={matrix.nnz}")
+
+    rows = []
+    for min_support in args.min_support:
+        row = {"min_support": min_support}
+        rules, row["eclat_sec"], row["eclat_peak_mb"] = _measure(
+            lambda: _eclat(matrix, min_support)
+        )
+        row["rules"] = len(rules)
+        if min_support >= args.mlxtend_min_support:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                mlxtend_rules, row["mlxtend_sec"], row["mlxtend_peak_mb"] = _measure(
+                    lambda: _mlxtend(matrix, min_support)
+                )
+            assert len(mlxtend_rules) == len(rules)
+        rows.append(row)
+
+    print(pd.DataFrame(rows).set_index("min_support").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
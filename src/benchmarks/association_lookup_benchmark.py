@@ -0,0 +1,98 @@
+r"""ユーザーごとのアソシエーションルールの検索を、従来のループと転置インデックスで比較するベンチマーク
+
+従来のループは、ユーザーごとにルール表全体にapplyし、一致したルールをリフト値で並べ替えてiterrowsで辿る。
+ルール数の多いmin_supportで学習し、1ユーザーあたりの時間を比較する。
+従来のループは遅いため、--num-loop-usersのユーザーだけで計測する。
+
+    python -m src.benchmarks.association_lookup_benchmark \
+        --data-path data/ml-10m/ml-10M100K --min-support 0.003
+"""
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.association_recommender import AssociationRecommender
+from src.models.frequent_itemsets import association_rules, frequent_itemsets
+
+
+def _legacy_loop(rules: pd.DataFrame, user2recent) -> dict:
+    user2consequents = {}
+    for user_id, input_data in user2recent.items():
+        matched_flags = rules.antecedents.apply(lambda x: len(set(input_data) & x)) >= 1
+        consequent_movies = []
+        for i, row in (
+            rules[matched_flags].sort_values("lift", ascending=False).iterrows()
+        ):
+            consequent_movies.extend(row["consequents"])
+        counter = Counter(consequent_movies)
+        user2consequents[user_id] = [
+            movie_id for movie_id, movie_cnt in counter.most_common()
+        ]
+    return user2consequents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--min-support", type=float, default=0.003)
+    parser.add_argument("--num-loop-users", type=int, default=100)
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    model = AssociationRecommender().fit(dataset, min_support=args.min_support)
+    user_ids = model.interaction_matrix.user_ids
+    print(f"users={len(user_ids)} rules={len(model.lift)}")
+
+    rules = association_rules(
+        frequent_itemsets(
+            model.interaction_matrix.binarized,
+            min_support=args.min_support,
+            item_names=model.interaction_matrix.movie_ids,
+        ),
+        metric="lift",
+        min_threshold=1,
+    )
+    loop_users = np.random.default_rng(0).choice(
+        len(user_ids), min(args.num_loop_users, len(user_ids)), replace=False
+    )
+    user2recent = {
+        user_ids[index]: model.recent_movie_ids[
+            model.recent_indptr[index] : model.recent_indptr[index + 1]
+        ].tolist()
+        for index in loop_users
+    }
+
+    start = time.perf_counter()
+    _legacy_loop(rules, user2recent)
+    loop_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.recommend(user_ids)
+    index_sec = time.perf_counter() - start
+
+    result = pd.DataFrame(
+        [
+            {
+                "method": "loop",
+                "users": len(loop_users),
+                "total_sec": loop_sec,
+                "ms_per_user": loop_sec / len(loop_users) * 1000,
+            },
+            {
+                "method": "inverted_index",
+                "users": len(user_ids),
+                "total_sec": index_sec,
+                "ms_per_user": index_sec / len(user_ids) * 1000,
+            },
+        ]
+    )
+    print(result.round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
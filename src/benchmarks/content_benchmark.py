@@ -0,0 +1,89 @@
+r"""ユーザーが直近に高評価した映画に似た映画の検索を、ユーザーごとの全件比較と近傍の疎行列の積で比較するベンチマーク
+
+ユーザーごとの全件比較では、直近に高評価した映画のTF-IDFベクトルの和と全映画のベクトルの内積を計算し、上位を選ぶ。
+ContentRecommenderは映画ごとの近傍を事前に計算し、全ユーザー分を疎行列の積でまとめて計算する。
+全件比較は遅いため、--num-loop-usersのユーザーだけで計測する。
+
+    python -m src.benchmarks.content_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-neighbors 50
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.content_recommender import ContentRecommender
+
+
+def _brute_force(model: ContentRecommender, item_vectors, user_index, k: int) -> dict:
+    user2items = {}
+    for index in user_index.tolist():
+        recent = model.recent.indices[
+            model.recent.indptr[index] : model.recent.indptr[index + 1]
+        ]
+        profile = np.asarray(item_vectors[recent].sum(axis=0)).ravel()
+        scores = item_vectors @ profile
+        seen = model.interaction_matrix.seen_movie_index(index)
+        scores[seen] = -np.inf
+        top = np.argsort(-scores, kind="stable")[:k]
+        user2items[index] = top[scores[top] > 0].tolist()
+    return user2items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--num-neighbors", type=int, default=50)
+    parser.add_argument("--num-loop-users", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    features = dataset.item_features
+    print(
+        f"movies={features.counts.shape[0]} features={features.counts.shape[1]} "
+        f"nnz={features.counts.nnz}"
+    )
+
+    start = time.perf_counter()
+    model = ContentRecommender().fit(dataset, num_neighbors=args.num_neighbors)
+    fit_sec = time.perf_counter() - start
+    user_ids = model.interaction_matrix.user_ids
+
+    item_vectors = features.tfidf(model.interaction_matrix.movie_ids)
+    loop_users = np.random.default_rng(0).choice(
+        len(user_ids), min(args.num_loop_users, len(user_ids)), replace=False
+    )
+    start = time.perf_counter()
+    _brute_force(model, item_vectors, loop_users, args.k)
+    loop_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.recommend(user_ids, k=args.k)
+    index_sec = time.perf_counter() - start
+
+    print(f"fit_sec={fit_sec:.3f}")
+    result = pd.DataFrame(
+        [
+            {
+                "method": "brute_force",
+                "users": len(loop_users),
+                "total_sec": loop_sec,
+                "ms_per_user": loop_sec / len(loop_users) * 1000,
+            },
+            {
+                "method": "neighbors",
+                "users": len(user_ids),
+                "total_sec": index_sec,
+                "ms_per_user": index_sec / len(user_ids) * 1000,
+            },
+        ]
+    )
+    print(result.round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""評価指標の計算を、従来のユーザーごとのループと配列でまとめて計算する方法で比較するベンチマーク
+
+    python -m src.benchmarks.eval_benchmark --num-users 70000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.models.eval import MetricCaluculator, _to_indptr, _to_padded
+
+
+def _legacy(true_rating, pred_rating, true_user2items, pred_user2items, k):
+    rmse = np.sqrt(np.mean((np.array(true_rating) - np.array(pred_rating)) ** 2))
+    precisions, recalls = [], []
+    for user_id in true_user2items.keys():
+        true_items = true_user2items[user_id]
+        pred_items = pred_user2items[user_id]
+        precisions.append(len(set(true_items) & set(pred_items[:k])) / k)
+        recalls.append(len(set(true_items) & set(pred_items[:k])) / len(true_items))
+    return rmse, np.mean(precisions), np.mean(recalls)
+
+
+def _measure(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-users", type=int, default=70000)
+    parser.add_argument("--num-movies", type=int, default=10000)
+    parser.add_argument("--num-test-items", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    true_user2items = {
+        user_id: rng.choice(
+            args.num_movies, args.num_test_items, replace=False
+        ).tolist()
+        for user_id in range(args.num_users)
+    }
+    pred_user2items = {
+        user_id: rng.choice(args.num_movies, 10, replace=False).tolist()
+        for user_id in range(args.num_users)
+    }
+    true_rating = rng.uniform(0.5, 5.0, args.num_users * args.num_test_items)
+    pred_rating = rng.uniform(0.5, 5.0, args.num_users * args.num_test_items)
+
+    calculator = MetricCaluculator()
+    users = list(true_user2items)
+    pred_items = _to_padded([pred_user2items[user] for user in users])
+    true_indptr, true_items = _to_indptr([true_user2items[user] for user in users])
+
+    legacy = _legacy(
+        true_rating.tolist(), pred_rating.tolist(), true_user2items, pred_user2items, 10
+    )
+    metrics = calculator.calc(
+        true_rating, pred_rating, true_user2items, pred_user2items, k=10
+    )
+    assert np.allclose(
+        legacy, [metrics.rmse, metrics.precision_at_k, metrics.recall_at_k]
+    )
+
+    rows = [
+        {
+            "method": "legacy loop (rmse, precision@10, recall@10)",
+            "sec": _measure(
+                lambda: _legacy(
+                    true_rating.tolist(),
+                    pred_rating.tolist(),
+                    true_user2items,
+                    pred_user2items,
+                    10,
+                )
+            ),
+        },
+        {
+            "method": "calc from dicts (all metrics, k=1,5,10)",
+            "sec": _measure(
+                lambda: calculator.calc(
+                    true_rating,
+                    pred_rating,
+                    true_user2items,
+                    pred_user2items,
+                    k=10,
+                    ks=[1, 5],
+                )
+            ),
+        },
+        {
+            "method": "calc_ranking_metrics on arrays (all metrics, k=1,5,10)",
+            "sec": _measure(
+                lambda: calculator.calc_ranking_metrics(
+                    pred_items, true_indptr, true_items, [1, 5, 10], args.num_movies
+                )
+            ),
+        },
+    ]
+    print(pd.DataFrame(rows).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+r"""全ユーザーへの推薦結果の書き出しの速さを、ワーカープロセス数ごとに比べるベンチマーク
+
+データを読み込んでモデルを学習し、成果物を一時ディレクトリに保存してから、--processesのプロセス数ごとに
+シャードに分けて書き出す。プロセス数ごとに、1秒あたりのユーザー数、1プロセスに対する速度の比、
+ワーカーのピークRSSを表示する。最後に、全てのプロセス数の書き出し結果が一致することを確かめる。
+
+    python -m src.benchmarks.export_benchmark \
+        --data-path data/ml-10m/ml-10M100K --model popularity \
+        --processes 1 2 4 8
+"""
+import argparse
+import glob
+import tempfile
+
+import pandas as pd
+
+from src.jobs.export import export_recommendations
+from src.jobs.retrieve import DataLoader
+from src.models.registry import get_model_class, resolve_model_name
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--model", default="popularity")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shard-size", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    model_name = resolve_model_name(args.model)
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    work_dir = tempfile.mkdtemp()
+    model_path = f"{work_dir}/model"
+    get_model_class(model_name)().fit(dataset).save(model_path)
+    print(f"model={model_name} users={len(dataset.interaction_matrix.user_ids)}")
+
+    rows = []
+    outputs = []
+    for processes in args.processes:
+        output_dir = f"{work_dir}/export_{processes}"
+        summary = export_recommendations(
+            model_name,
+            model_path,
+            output_dir,
+            k=args.k,
+            shard_size=args.shard_size,
+            batch_size=args.batch_size,
+            processes=processes,
+        )
+        rows.append(
+            {
+                "processes": processes,
+                "shards": summary["shards"],
+                "sec": summary["sec"],
+                "users_per_sec": summary["exported_users"] / summary["sec"],
+                "worker_peak_rss_mb": summary["worker_peak_rss_mb"],
+            }
+        )
+        lines = []
+        for path in sorted(glob.glob(f"{output_dir}/part-*.jsonl")):
+            with open(path) as f:
+                lines.extend(f.read().splitlines())
+        outputs.append(sorted(lines))
+    assert all(output == outputs[0] for output in outputs)
+
+    result = pd.DataFrame(rows)
+    result["speedup"] = result.users_per_sec / result.users_per_sec.iloc[0]
+    print(result.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
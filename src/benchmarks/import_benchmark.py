@@ -0,0 +1,93 @@
+"""コマンドの起動にかかる読み込み時間を、全てのモデルを読み込む従来のmain.pyと比べるベンチマーク
+
+新しいPythonのプロセスで以下を読み込み、--repeat回の中央値の時間と、読み込まれた重い依存を表示する。
+- all_models: 従来のmain.pyと同じく、データの読み込みと全てのモデルのモジュールを読み込む
+- cli: コマンドラインの入口(src.jobs.cli)だけを読み込む
+- cli+<モデル名>: 入口とそのモデルのモジュールだけを読み込む(保存済みのモデルで推薦結果を書き出す場合)
+- cli+data_loader: 入口とデータの読み込み(学習と評価の場合)
+
+cli+popularityの時間がall_modelsの--budget-ratio倍を超えた場合は、終了コード1で終わる。
+
+    python -m src.benchmarks.import_benchmark --repeat 5 --budget-ratio 0.5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from src.models.registry import MODEL_ALIASES, MODEL_MODULES
+
+# 読み込まれたかどうかを表示する重い依存
+HEAVY_MODULES = ["sklearn", "faiss", "mlxtend", "pandera"]
+
+
+def _measure(statement: str, repeat: int) -> dict:
+    """新しいプロセスでstatementを実行する時間の中央値と、読み込まれた重い依存を返す"""
+    script = (
+        f"{statement}\n"
+        "import json, sys\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.getcwd()}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+        ).stdout
+        times.append(time.perf_counter() - start)
+    return {
+        "sec": float(pd.Series(times).median()),
+        "heavy_modules": ",".join(json.loads(output.splitlines()[-1])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ratio", type=float, default=0.5)
+    args = parser.parse_args()
+
+    statements = {
+        "python": "pass",
+        "all_models": "\n".join(
+            ["import src.jobs.retrieve", "import src.jobs.train"]
+            + [f"import {module}" for module in MODEL_MODULES.values()]
+        ),
+        "cli": "import src.jobs.cli",
+    }
+    for alias, name in sorted(MODEL_ALIASES.items()):
+        statements[f"cli+{alias}"] = (
+            "import src.jobs.cli\n"
+            "from src.models.registry import get_model_class\n"
+            f"get_model_class({name!r})"
+        )
+    statements["cli+data_loader"] = "import src.jobs.cli\nimport src.jobs.retrieve"
+
+    rows = [
+        {"target": target, **_measure(statement, args.repeat)}
+        for target, statement in statements.items()
+    ]
+    result = pd.DataFrame(rows)
+    baseline = result.set_index("target").sec["all_models"]
+    result["ratio"] = result.sec / baseline
+    print(result.round(3).to_string(index=False))
+
+    lightweight = result.set_index("target").ratio["cli+popularity"]
+    if lightweight > args.budget_ratio:
+        print(
+            f"cli+popularity takes {lightweight:.2f} of all_models, over the budget {args.budget_ratio}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+r"""近傍探索インデックスの再現率と探索時間を比較するベンチマーク
+
+flatの厳密な探索結果を正解として、ivfとhnswのパラメータごとに再現率@kと1ユーザーあたりの探索時間を計測する。
+埋め込みはNMFの因子と同様に非負の乱数で作る。
+
+    python -m src.benchmarks.item_index_benchmark --num-items 10000 \
+        --num-users 10000 --dim 32
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.models.item_index import ItemIndex
+
+
+def _recall(exact: np.ndarray, approx: np.ndarray) -> float:
+    hits = sum(
+        len(np.intersect1d(e, a[a >= 0], assume_unique=True))
+        for e, a in zip(exact, approx)
+    )
+    return hits / exact.size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-items", type=int, default=10000)
+    parser.add_argument("--num-users", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    item_vectors = rng.gamma(0.5, 1.0, (args.num_items, args.dim)).astype(np.float32)
+    user_vectors = rng.gamma(0.5, 1.0, (args.num_users, args.dim)).astype(np.float32)
+
+    configs = [("flat", {})]
+    configs += [("ivf", {"nlist": 256, "nprobe": nprobe}) for nprobe in (1, 4, 16, 64)]
+    configs += [("hnsw", {"ef_search": ef}) for ef in (16, 64, 256)]
+
+    rows = []
+    exact = None
+    for index_type, params in configs:
+        start = time.perf_counter()
+        index = ItemIndex(args.dim, index_type=index_type, **params).build(item_vectors)
+        build_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, found = index.search(user_vectors, args.k)
+        search_sec = time.perf_counter() - start
+        if exact is None:
+            exact = found
+
+        rows.append(
+            {
+                "index": index_type,
+                "params": params,
+                "build_sec": build_sec,
+                "search_us_per_user": search_sec / args.num_users * 1e6,
+                f"recall@{args.k}": _recall(exact, found),
+            }
+        )
+
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+r"""映画×映画の類似度を、密な全件の行列と上位N件の近傍表で比較するベンチマーク
+
+密な全件の行列は、映画×映画のコサイン類似度を全て保持し、評価値の行×類似度行列の積で推薦する。
+ItemKNNRecommenderは映画ごとに上位num_neighbors件だけを疎行列で保持し、評価値の行×近傍表の疎行列の積で推薦する。
+あわせて、近傍表の作成時間をスレッド数ごとに計測する。
+
+    python -m src.benchmarks.item_knn_benchmark \
+        --data-path data/ml-10m/ml-10M100K --threads 1 2 4
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+
+from src.jobs.retrieve import DataLoader
+from src.models.item_knn_recommender import ItemKNNRecommender
+from src.models.top_k import seen_rows, top_k_unseen
+
+
+def _dense_recommend(similarity: np.ndarray, rating, user_index, k: int):
+    return top_k_unseen(
+        lambda block: (seen_rows(rating, block) @ similarity).astype(np.float32),
+        rating,
+        k=k,
+        user_index=user_index,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--num-neighbors", type=int, default=50)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    interaction_matrix = dataset.interaction_matrix
+    user_index = np.arange(len(interaction_matrix.user_ids))
+    print(f"users={interaction_matrix.shape[0]} movies={interaction_matrix.shape[1]}")
+
+    rows = []
+    start = time.perf_counter()
+    item_vectors = normalize(interaction_matrix.rating_csc.T.astype(np.float32))
+    similarity = (item_vectors @ item_vectors.T).toarray()
+    np.fill_diagonal(similarity, 0)
+    fit_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    _dense_recommend(similarity, interaction_matrix.rating, user_index, args.k)
+    recommend_sec = time.perf_counter() - start
+    rows.append(
+        {
+            "method": "dense",
+            "threads": 1,
+            "fit_sec": fit_sec,
+            "table_mb": similarity.nbytes / 1024**2,
+            "ms_per_user": recommend_sec / len(user_index) * 1000,
+        }
+    )
+    del similarity
+
+    for num_threads in args.threads:
+        start = time.perf_counter()
+        model = ItemKNNRecommender().fit(
+            dataset, num_neighbors=args.num_neighbors, num_threads=num_threads
+        )
+        fit_sec = time.perf_counter() - start
+        start = time.perf_counter()
+        model.recommend(interaction_matrix.user_ids, k=args.k)
+        recommend_sec = time.perf_counter() - start
+        neighbors = model.neighbors
+        rows.append(
+            {
+                "method": f"top_{args.num_neighbors}",
+                "threads": num_threads,
+                "fit_sec": fit_sec,
+                "table_mb": (
+                    neighbors.data.nbytes
+                    + neighbors.indices.nbytes
+                    + neighbors.indptr.nbytes
+                )
+                / 1024**2,
+                "ms_per_user": recommend_sec / len(user_index) * 1000,
+            }
+        )
+
+    print(pd.DataFrame(rows).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
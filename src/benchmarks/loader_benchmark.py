@@ -0,0 +1,113 @@
+r"""DataLoaderの読み込み速度を比較するベンチマーク
+
+pythonエンジンのread_csv(従来の読み込み)、キャッシュなしの読み込み(cold)、
+キャッシュからの読み込み(warm)の時間をファイルごとに計測する。
+あわせて、スキーマの検証モード(full, sampled, off)ごとにDataLoader.load_data全体の時間と、
+読み込んだデータセットのメモリ使用量を計測する。
+
+    python -m src.benchmarks.loader_benchmark \
+        --data-path data/ml-10m/ml-10M100K
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from src.dataset import reader
+from src.dataset.cache import ColumnarCache
+from src.dataset.validation import VALIDATION_MODES
+from src.jobs.retrieve import DataLoader
+
+PARSERS = {
+    "movies": reader.read_movies,
+    "tags": reader.read_tags,
+    "ratings": reader.read_ratings,
+}
+LEGACY_COLUMNS = {
+    "movies": ["movie_id", "title", "genres"],
+    "tags": ["user_id", "movie_id", "tag", "timestamp"],
+    "ratings": ["user_id", "movie_id", "rating", "timestamp"],
+}
+
+
+def _legacy_read(path: str, name: str) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        names=LEGACY_COLUMNS[name],
+        sep="::",
+        encoding=None if name == "tags" else "latin-1",
+        engine="python",
+    )
+
+
+def _measure(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="movielens_cache_")
+    cache = ColumnarCache(cache_dir)
+    rows = []
+    try:
+        for name, parse in PARSERS.items():
+            path = os.path.join(args.data_path, f"{name}.dat")
+            row = {"file": name}
+            if not args.skip_legacy:
+                row["legacy_sec"] = _measure(lambda: _legacy_read(path, name))
+            row["cold_sec"] = _measure(lambda: cache.load(name, path, parse))
+            # メモリマップで開くだけでなく、実際に値を読み込むまでを計測する
+            row["warm_sec"] = _measure(
+                lambda: pd.DataFrame(cache.load(name, path, parse))
+            )
+            rows.append(row)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(pd.DataFrame(rows).set_index("file").round(3).to_string())
+
+    # キャッシュを作ってから計測し、検証以外の時間を揃える
+    cache_dir = tempfile.mkdtemp(prefix="movielens_cache_")
+    rows = []
+    try:
+        for mode in ("off",) + VALIDATION_MODES:
+            loader = DataLoader(
+                num_users=args.num_users,
+                data_path=args.data_path,
+                cache_dir=cache_dir,
+                validation=mode,
+            )
+            # 検証以外の処理のばらつきが大きいため、最短の時間を使う
+            load_sec = min(_measure(loader.load_data) for _ in range(args.repeat))
+            # 評価データと映画データが実際に使うメモリ(文字列やリストの中身を含む)
+            dataset = loader.load_data()
+            dataset_mb = sum(
+                frame.memory_usage(deep=True).sum()
+                for frame in (dataset.ratings, dataset.item_content)
+            )
+            rows.append(
+                {
+                    "validation": mode,
+                    "load_sec": load_sec,
+                    "dataset_mb": dataset_mb / 1024**2,
+                }
+            )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    # 最初のoffはキャッシュの作成を含むため除く
+    print(pd.DataFrame(rows[1:]).set_index("validation").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
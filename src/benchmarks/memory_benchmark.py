@@ -0,0 +1,79 @@
+r"""ユーザー×映画の行列を作成したときのピークメモリを比較するベンチマーク
+
+従来の密行列(pivot_table)と、共通の疎行列(InteractionMatrix)をそれぞれ別プロセスで作成し、
+評価データの読み込み後と行列の作成後のピークRSSを計測する。
+
+    python -m src.benchmarks.memory_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-users 0
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.interaction_matrix import InteractionMatrix
+
+
+def _peak_rss_mb() -> float:
+    # Linuxではru_maxrssの単位はKB、macOSではバイト
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _build(mode: str, data_path: str, num_users: int, queue) -> None:
+    ratings = DataLoader(
+        num_users=num_users or None, data_path=data_path
+    )._load_ratings()
+    loaded_mb = _peak_rss_mb()
+
+    if mode == "dense":
+        matrix = ratings.pivot_table(
+            index="user_id", columns="movie_id", values="rating"
+        )
+        matrix = matrix.fillna(0).to_numpy()
+    else:
+        matrix = InteractionMatrix.from_frame(ratings)
+        matrix.binarized
+        matrix.rating_csc
+
+    queue.put(
+        {
+            "mode": mode,
+            "users": ratings.user_id.nunique(),
+            "ratings": len(ratings),
+            "loaded_peak_rss_mb": loaded_mb,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=0, help="0は全ユーザー")
+    parser.add_argument("--modes", nargs="+", default=["sparse", "dense"])
+    args = parser.parse_args()
+
+    # 各方式のピークRSSが混ざらないように、方式ごとに新しいプロセスで計測する
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for mode in args.modes:
+        queue = context.Queue()
+        process = context.Process(
+            target=_build, args=(mode, args.data_path, args.num_users, queue)
+        )
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            rows.append({"mode": mode, "error": f"exitcode={process.exitcode}"})
+            continue
+        rows.append(queue.get())
+
+    print(pd.DataFrame(rows).set_index("mode").round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
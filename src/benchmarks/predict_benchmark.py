@@ -0,0 +1,67 @@
+r"""ユーザーと映画の組の評価値の予測を、従来の行ごとの処理とpredictで比較するベンチマーク
+
+従来の処理は以下の2通り。
+- iterrows: テストデータを1行ずつ辿り、辞書で映画の平均評価値を引く(--num-loop-pairsの組だけで計測する)
+- merge: テストデータに映画の平均評価値の表を結合する
+
+predictはIDをまとめてインデックスに変換し、配列で予測する。テストデータの組を--repeat回繰り返して件数を増やす。
+
+    python -m src.benchmarks.predict_benchmark \
+        --data-path data/ml-10m/ml-10M100K --repeat 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.popularity_recommender import PopularityRecommender
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--num-loop-pairs", type=int, default=100000)
+    args = parser.parse_args()
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    model = PopularityRecommender().fit(dataset)
+    pairs = pd.concat([dataset.test] * args.repeat, ignore_index=True)
+    user_ids = pairs.user_id.to_numpy()
+    movie_ids = pairs.movie_id.to_numpy()
+    average = pd.DataFrame(
+        {
+            "movie_id": model.interaction_matrix.movie_ids,
+            "rating_pred": model.movie_rating_average,
+        }
+    )
+
+    rows = []
+    loop_pairs = pairs.head(args.num_loop_pairs)
+    average_dict = dict(zip(average.movie_id.tolist(), average.rating_pred.tolist()))
+    start = time.perf_counter()
+    [average_dict.get(row["movie_id"], 0) for _, row in loop_pairs.iterrows()]
+    elapsed = time.perf_counter() - start
+    rows.append({"method": "iterrows", "pairs": len(loop_pairs), "sec": elapsed})
+
+    start = time.perf_counter()
+    merged = pairs.merge(average, on="movie_id", how="left").rating_pred.fillna(0)
+    elapsed = time.perf_counter() - start
+    rows.append({"method": "merge", "pairs": len(pairs), "sec": elapsed})
+
+    start = time.perf_counter()
+    predicted = model.predict(user_ids, movie_ids)
+    elapsed = time.perf_counter() - start
+    rows.append({"method": "predict", "pairs": len(pairs), "sec": elapsed})
+    assert np.allclose(predicted, merged.to_numpy(), atol=1e-5)
+
+    result = pd.DataFrame(rows)
+    result["ns_per_pair"] = result.sec / result.pairs * 1e9
+    print(result.round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
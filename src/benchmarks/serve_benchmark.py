@@ -0,0 +1,111 @@
+r"""推薦サーバーの負荷試験
+
+MovieLensのサンプルでモデルを学習して成果物を保存し、同じプロセスでサーバーを起動して
+並列にGET /recommendを送り、クライアント側のp50/p99レイテンシとスループットを計測する。
+--urlを指定した場合は、起動済みのサーバーに対して負荷をかける。
+
+    python -m src.benchmarks.serve_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-users 1000
+    python -m src.benchmarks.serve_benchmark --url http://localhost:5000 \
+        --user-ids 1 2 3
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.jobs.serve import RecommendService, load_models, make_server
+from src.models.nmf_recommender import NMFRecommender
+from src.models.popularity_recommender import PopularityRecommender
+
+
+def _get(url: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def _load(base_url: str, model: str, user_ids, k: int, num_requests: int, conc: int):
+    rng = np.random.default_rng(0)
+    urls = [
+        f"{base_url}/recommend?user_id={user_id}&k={k}&model={model}"
+        for user_id in rng.choice(user_ids, num_requests)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(conc) as executor:
+        latencies = np.array(list(executor.map(_get, urls)))
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {
+        "model": model,
+        "concurrency": conc,
+        "requests_per_sec": num_requests / elapsed,
+        "p50_ms": p50,
+        "p99_ms": p99,
+    }
+
+
+def _train_and_save(data_path: str, num_users: int, model_dir: str):
+    dataset = DataLoader(num_users=num_users, data_path=data_path).load_data()
+    model_paths = {}
+    for name, model in [
+        ("popularity", PopularityRecommender()),
+        ("nmf", NMFRecommender()),
+    ]:
+        model.fit(dataset)
+        model_paths[name] = os.path.join(model_dir, name)
+        model.save(model_paths[name])
+    return model_paths, dataset.interaction_matrix.user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=1000)
+    parser.add_argument("--user-ids", type=int, nargs="+", default=None)
+    parser.add_argument("--models", nargs="+", default=["popularity", "nmf"])
+    parser.add_argument("--num-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--cache-size", type=int, default=0)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    user_ids = args.user_ids
+    if base_url is None:
+        model_dir = tempfile.mkdtemp()
+        model_paths, user_ids = _train_and_save(
+            args.data_path, args.num_users, model_dir
+        )
+        # キャッシュなしでモデルの推薦とマイクロバッチの性能を測る
+        service = RecommendService(load_models(model_paths), cache_size=args.cache_size)
+        server = make_server(service, host="127.0.0.1", port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    rows = [
+        _load(base_url, model, user_ids, args.k, args.num_requests, conc)
+        for model in args.models
+        for conc in args.concurrency
+    ]
+    print(pd.DataFrame(rows).round(3).to_string(index=False))
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        print(json.dumps(json.load(response), indent=2))
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
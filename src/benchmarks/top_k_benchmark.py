@@ -0,0 +1,136 @@
+"""評価済みの映画を除いた上位k件の選択を、従来のループとtop_k_unseenで比較するベンチマーク
+
+人気順(全ユーザー共通のスコア)とランダム(ユーザーごとのスコア)の2通りについて計測する。
+人気順は、事前に並べたランキングを走査するtop_k_rankedも計測する。
+
+    python -m src.benchmarks.top_k_benchmark --num-users 1000 10000 70000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.top_k import to_user2items, top_k_ranked, top_k_unseen
+
+
+def _make_seen(num_users: int, num_movies: int, mean_history: int, rng):
+    # 人気に偏りのある評価履歴を作る
+    lengths = rng.poisson(mean_history, num_users).clip(1, num_movies)
+    popularity = 1 / np.arange(1, num_movies + 1) ** 0.8
+    popularity /= popularity.sum()
+    rows = np.repeat(np.arange(num_users), lengths)
+    cols = rng.choice(num_movies, size=len(rows), p=popularity)
+    seen = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(num_users, num_movies),
+    )
+    seen.sum_duplicates()
+    return seen
+
+
+def _legacy_popularity(movies_sorted, user_watched_movies, user_ids):
+    pred_user2items = {}
+    for user_id in user_ids:
+        pred_user2items[user_id] = []
+        for movie_id in movies_sorted:
+            if movie_id not in user_watched_movies[user_id]:
+                pred_user2items[user_id].append(movie_id)
+                if len(pred_user2items[user_id]) >= 10:
+                    break
+    return pred_user2items
+
+
+def _legacy_random(num_movies, user_watched_movies, user_ids, rng):
+    pred_user2items = {}
+    for user_id in user_ids:
+        pred_user2items[user_id] = []
+        movie_indexs = np.argsort(-rng.uniform(0.5, 5.0, num_movies))
+        for movie_id in movie_indexs:
+            if movie_id not in user_watched_movies[user_id]:
+                pred_user2items[user_id].append(movie_id)
+                if len(pred_user2items[user_id]) == 10:
+                    break
+    return pred_user2items
+
+
+def _measure(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--num-movies", type=int, default=10000)
+    parser.add_argument("--mean-history", type=int, default=140)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for num_users in args.num_users:
+        seen = _make_seen(num_users, args.num_movies, args.mean_history, rng)
+        user_ids = np.arange(num_users)
+        movie_ids = np.arange(args.num_movies)
+        user_watched_movies = {
+            user_id: seen.indices[
+                seen.indptr[user_id] : seen.indptr[user_id + 1]
+            ].tolist()
+            for user_id in range(num_users)
+        }
+        movie_scores = rng.uniform(0.5, 5.0, args.num_movies)
+        movies_sorted = np.argsort(-movie_scores).tolist()
+        ranked = np.asarray(movies_sorted)
+
+        legacy = _legacy_popularity(movies_sorted, user_watched_movies, user_ids)
+        vectorized = to_user2items(
+            top_k_unseen(movie_scores, seen), user_ids, movie_ids
+        )
+        assert legacy == vectorized
+        assert legacy == to_user2items(top_k_ranked(ranked, seen), user_ids, movie_ids)
+
+        rows.append(
+            {
+                "users": num_users,
+                "popularity_loop_sec": _measure(
+                    lambda: _legacy_popularity(
+                        movies_sorted, user_watched_movies, user_ids
+                    )
+                ),
+                "popularity_top_k_sec": _measure(
+                    lambda: to_user2items(
+                        top_k_unseen(movie_scores, seen), user_ids, movie_ids
+                    )
+                ),
+                "popularity_ranked_sec": _measure(
+                    lambda: to_user2items(
+                        top_k_ranked(ranked, seen), user_ids, movie_ids
+                    )
+                ),
+                "random_loop_sec": _measure(
+                    lambda: _legacy_random(
+                        args.num_movies, user_watched_movies, user_ids, rng
+                    )
+                ),
+                "random_top_k_sec": _measure(
+                    lambda: to_user2items(
+                        top_k_unseen(
+                            lambda index: rng.uniform(
+                                0.5, 5.0, (len(index), args.num_movies)
+                            ),
+                            seen,
+                        ),
+                        user_ids,
+                        movie_ids,
+                    )
+                ),
+            }
+        )
+
+    print(pd.DataFrame(rows).set_index("users").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+r"""時間で減衰させた評価数と直近の期間の集計を、ストリーミングの更新と全件の集計し直しで比較するベンチマーク
+
+ratings.datを読み込み、評価時刻の新しい--num-eventsの評価を新しいイベントとみなす。
+残りの評価から1回の走査で集計を作り直す時間を計測したうえで、新しいイベントを
+1件ずつ、および--batch-size件ずつStreamingAggregates.updateに渡す時間と、
+同じ回数だけ全ての評価から集計し直す時間を比較する。最後に両者の集計が一致することを確かめる。
+
+    python -m src.benchmarks.trending_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-events 1000 --batch-size 100
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.dataset.reader import read_rating_events
+from src.models.streaming_aggregates import StreamingAggregates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-events", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--half-life-days", type=float, default=7)
+    parser.add_argument("--windows", type=int, nargs="+", default=[7, 30])
+    args = parser.parse_args()
+
+    ratings = read_rating_events(f"{args.data_path}/ratings.dat")
+    order = np.argsort(ratings["timestamp"], kind="stable")
+    movie_ids, movie_index = np.unique(ratings["movie_id"], return_inverse=True)
+    movie_index = movie_index[order]
+    rating = ratings["rating"][order].astype(np.float64)
+    timestamps = ratings["timestamp"][order]
+    num_base = len(order) - args.num_events
+    print(f"ratings={len(order)} movies={len(movie_ids)} events={args.num_events}")
+
+    def rebuild(stop: int) -> StreamingAggregates:
+        return StreamingAggregates.from_events(
+            movie_index[:stop],
+            rating[:stop],
+            timestamps[:stop],
+            len(movie_ids),
+            args.half_life_days,
+            args.windows,
+        )
+
+    start = time.perf_counter()
+    rebuild(num_base)
+    rebuild_sec = time.perf_counter() - start
+
+    rows = []
+    for batch_size in [1, args.batch_size]:
+        aggregates = rebuild(num_base)
+        starts = range(num_base, len(order), batch_size)
+        start = time.perf_counter()
+        for position in starts:
+            stop = position + batch_size
+            aggregates.update(
+                movie_index[position:stop],
+                rating[position:stop],
+                timestamps[position:stop],
+            )
+        update_sec = time.perf_counter() - start
+        rows.append(
+            {
+                "method": f"stream_batch{batch_size}",
+                "updates": len(starts),
+                "total_sec": update_sec,
+                "ms_per_update": update_sec / len(starts) * 1000,
+            }
+        )
+    # 全件の集計し直しは遅いため、更新の回数分の時間は1回の集計時間から見積もる
+    updates = len(range(num_base, len(order), args.batch_size))
+    rows.append(
+        {
+            "method": f"rebuild_batch{args.batch_size}",
+            "updates": updates,
+            "total_sec": rebuild_sec * updates,
+            "ms_per_update": rebuild_sec * 1000,
+        }
+    )
+
+    full = rebuild(len(order))
+    for name, (streamed, rebuilt) in {
+        "decayed": (aggregates.decayed(), full.decayed()),
+        **{
+            f"last_{days}d": (aggregates.window(days), full.window(days))
+            for days in args.windows
+        },
+    }.items():
+        assert all(
+            np.allclose(a, b, rtol=1e-9, atol=1e-9) for a, b in zip(streamed, rebuilt)
+        ), name
+
+    print(f"rebuild_sec={rebuild_sec:.3f}")
+    print(pd.DataFrame(rows).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+r"""新しい評価の取り込みを、partial_fitによる差分更新と全データでの学習し直しで比較するベンチマーク
+
+学習データのうち評価時刻の新しい--delta-fractionの割合を新しい評価とみなす。
+残りで学習したモデルをpartial_fitで更新する時間と、全ての学習データでfitし直す時間を計測し、
+両者の推薦リストがどれだけ重なるか(学習し直したモデルの上位k本のうち、差分更新でも推薦した割合の平均)を比較する。
+
+    python -m src.benchmarks.update_benchmark \
+        --data-path data/ml-10m/ml-10M100K --num-users 10000 \
+        --delta-fraction 0.01
+"""
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from src.jobs.retrieve import DataLoader
+from src.models.als_recommender import ALSRecommender
+from src.models.association_recommender import AssociationRecommender
+from src.models.content_recommender import ContentRecommender
+from src.models.dataset import Dataset
+from src.models.item_knn_recommender import ItemKNNRecommender
+from src.models.nmf_recommender import NMFRecommender
+from src.models.popularity_recommender import PopularityRecommender
+
+MODELS = {
+    PopularityRecommender.__name__: (PopularityRecommender, {}),
+    AssociationRecommender.__name__: (AssociationRecommender, {"min_support": 0.01}),
+    NMFRecommender.__name__: (NMFRecommender, {}),
+    ALSRecommender.__name__: (ALSRecommender, {}),
+    ItemKNNRecommender.__name__: (ItemKNNRecommender, {}),
+    ContentRecommender.__name__: (ContentRecommender, {}),
+}
+
+
+def _overlap(a: dict, b: dict, user_ids: np.ndarray) -> float:
+    # 学習し直したモデルが推薦できたユーザーについて、その推薦リストのうち差分更新でも推薦した割合
+    overlaps = [
+        len(set(a[user]) & set(b[user])) / len(b[user])
+        for user in user_ids.tolist()
+        if len(b[user]) > 0
+    ]
+    return float(np.mean(overlaps)) if overlaps else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=None)
+    parser.add_argument("--delta-fraction", type=float, default=0.01)
+    parser.add_argument("--models", nargs="+", default=list(MODELS))
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+
+    dataset = DataLoader(num_users=args.num_users, data_path=args.data_path).load_data()
+    train = dataset.train
+    cutoff = np.quantile(train.timestamp, 1 - args.delta_fraction)
+    base = train[train.timestamp < cutoff]
+    delta = train[train.timestamp >= cutoff].reset_index(drop=True)
+    base_dataset = Dataset(
+        ratings=pd.concat([base, dataset.test], ignore_index=True),
+        num_train=len(base),
+        test_user2items=dataset.test_user2items,
+        item_content=dataset.item_content,
+        item_features=dataset.item_features,
+    )
+    full_dataset = base_dataset.append_ratings(delta)
+    user_ids = full_dataset.interaction_matrix.user_ids
+    print(f"base={len(base)} delta={len(delta)} users={len(user_ids)}")
+
+    rows = []
+    for name in args.models:
+        model_class, params = MODELS[name]
+        model = model_class().fit(base_dataset, **params)
+        start = time.perf_counter()
+        model.partial_fit(delta, item_features=dataset.item_features)
+        partial_fit_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        refitted = model_class().fit(full_dataset, **params)
+        fit_sec = time.perf_counter() - start
+
+        rows.append(
+            {
+                "model": name,
+                "partial_fit_sec": partial_fit_sec,
+                "fit_sec": fit_sec,
+                "speedup": fit_sec / partial_fit_sec,
+                "overlap": _overlap(
+                    model.recommend(user_ids, k=args.k),
+                    refitted.recommend(user_ids, k=args.k),
+                    user_ids,
+                ),
+            }
+        )
+
+    print(pd.DataFrame(rows).set_index("model").round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
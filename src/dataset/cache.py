@@ -0,0 +1,197 @@
+import json
+import os
+import shutil
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.dataset.reader import Columns
+
+# キャッシュの形式を変更した場合はインクリメントし、古いキャッシュを無効にする
+CACHE_VERSION = 1
+
+
+class ColumnarCache:
+    """MovieLensのファイルを列ごとの.npyファイルとして保持するキャッシュ
+
+    数値の列はそのまま.npyとして保存し、メモリマップで読み込む。
+    文字列の列はカテゴリのコードとカテゴリの値(UTF-8のバイト列)に分けて保存する。
+    元ファイルのサイズと更新時刻をメタデータに記録し、変更があればキャッシュを作り直す。
+    appendで追加した行(新しく届いた評価など)は、元ファイルの行の後ろに連結して読み込む。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def load(
+        self,
+        name: str,
+        source_path: str,
+        parser: Callable[[str], Columns],
+        mmap: bool = True,
+    ) -> Columns:
+        """キャッシュから列を読み込む。キャッシュが無効な場合は元ファイルを読み込んで作成する
+
+        Args:
+            name (str): キャッシュ名
+            source_path (str): 元ファイルのパス
+            parser (Callable[[str], Columns]): 元ファイルを読み込む関数
+            mmap (bool): 数値の列をメモリマップで読み込むかどうか
+
+        Returns:
+            Columns: 列名と列の値
+        """
+        columns = self._read(name, source_path, mmap)
+        if columns is not None:
+            logger.info(f"load {name} from cache")
+            return columns
+
+        logger.info(f"build {name} cache from {source_path}")
+        columns = parser(source_path)
+        self.write(name, source_path, columns)
+        return columns
+
+    def write(self, name: str, source_path: str, columns: Columns) -> None:
+        """列をキャッシュに書き込む
+
+        書き込み途中のキャッシュが読まれないように、一時ディレクトリに書き込んでから置き換える。
+
+        Args:
+            name (str): キャッシュ名
+            source_path (str): 元ファイルのパス
+            columns (Columns): 列名と列の値
+        """
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        column_kinds = {}
+        num_rows = 0
+        for col, values in columns.items():
+            num_rows = len(values)
+            if isinstance(values, pd.Categorical):
+                categories = np.array(
+                    [c.encode("utf-8") for c in values.categories], dtype=bytes
+                )
+                np.save(os.path.join(tmp_path, f"{col}.codes.npy"), values.codes)
+                np.save(os.path.join(tmp_path, f"{col}.categories.npy"), categories)
+                column_kinds[col] = "categorical"
+            else:
+                np.save(os.path.join(tmp_path, f"{col}.npy"), np.asarray(values))
+                column_kinds[col] = "numeric"
+
+        meta = {
+            "version": CACHE_VERSION,
+            "source": self._source_stat(source_path),
+            "columns": column_kinds,
+            "num_rows": num_rows,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def append(self, name: str, source_path: str, columns: Columns) -> None:
+        """有効なキャッシュの末尾に行を追加する
+
+        追加した行は列ごとに別の.npyとして保存し、読み込み時に元ファイルの行の後ろに連結する。
+        元ファイルが変更されてキャッシュを作り直した場合、追加した行は破棄される。
+
+        Args:
+            name (str): キャッシュ名
+            source_path (str): 元ファイルのパス
+            columns (Columns): 追加する行の列名と列の値(数値の列のみ)
+        """
+        path = os.path.join(self.cache_dir, name)
+        meta = self._read_meta(name, source_path)
+        if meta is None:
+            raise ValueError(f"{name} cache for {source_path} has not been built")
+        if set(columns) != set(meta["columns"]):
+            raise ValueError(
+                f"columns must be {sorted(meta['columns'])}, got {sorted(columns)}"
+            )
+        if any(kind != "numeric" for kind in meta["columns"].values()):
+            raise ValueError(f"{name} cache has non-numeric columns")
+
+        segment = len(meta.get("appended", []))
+        for col, values in columns.items():
+            dtype = np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r").dtype
+            np.save(
+                os.path.join(path, f"{col}.appended{segment}.npy"),
+                np.asarray(values, dtype=dtype),
+            )
+        meta["appended"] = meta.get("appended", []) + [
+            len(next(iter(columns.values())))
+        ]
+        # 書き込み途中のメタデータが読まれないように、一時ファイルに書き込んでから置き換える
+        meta_path = os.path.join(path, "meta.json")
+        tmp_path = f"{meta_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        logger.info(f"append {meta['appended'][-1]} rows to {name} cache")
+
+    def num_appended_rows(self, name: str, source_path: str) -> int:
+        """有効なキャッシュにappendで追加した行数。キャッシュが無効な場合は0とする
+
+        Args:
+            name (str): キャッシュ名
+            source_path (str): 元ファイルのパス
+
+        Returns:
+            int: 追加した行数
+        """
+        meta = self._read_meta(name, source_path)
+        return sum(meta.get("appended", [])) if meta is not None else 0
+
+    def _read_meta(self, name: str, source_path: str) -> Optional[Dict]:
+        meta_path = os.path.join(self.cache_dir, name, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            logger.info(f"{name} cache version is outdated")
+            return None
+        if meta.get("source") != self._source_stat(source_path):
+            logger.info(f"{source_path} has been modified since {name} cache was built")
+            return None
+        return meta
+
+    def _read(self, name: str, source_path: str, mmap: bool) -> Optional[Columns]:
+        path = os.path.join(self.cache_dir, name)
+        meta = self._read_meta(name, source_path)
+        if meta is None:
+            return None
+
+        mmap_mode = "r" if mmap else None
+        columns = {}
+        for col, kind in meta["columns"].items():
+            if kind == "categorical":
+                codes = np.load(os.path.join(path, f"{col}.codes.npy"))
+                categories = np.load(os.path.join(path, f"{col}.categories.npy"))
+                columns[col] = pd.Categorical.from_codes(
+                    codes, [c.decode("utf-8") for c in categories]
+                )
+            else:
+                columns[col] = np.load(
+                    os.path.join(path, f"{col}.npy"), mmap_mode=mmap_mode
+                )
+                # 追加した行がある場合は、元ファイルの行の後ろに連結する
+                appended = [
+                    np.load(os.path.join(path, f"{col}.appended{segment}.npy"))
+                    for segment in range(len(meta.get("appended", [])))
+                ]
+                if appended:
+                    columns[col] = np.concatenate([columns[col]] + appended)
+        return columns
+
+    @staticmethod
+    def _source_stat(source_path: str) -> Dict[str, int]:
+        stat = os.stat(source_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
@@ -0,0 +1,130 @@
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from src.dataset.reader import RATING_COLUMNS, RATING_DTYPES, Columns
+
+
+class RatingsFilter:
+    """評価データの絞り込み条件
+
+    ユーザーはIDの小さい順にnum_users人に絞り込む。映画と評価時刻の条件はその後に適用する。
+    ファイル全体を読み込んでから絞り込むのではなく、読み込みながら絞り込むことで、
+    メモリ使用量と読み込み時間を残すデータの量に比例させる。
+    """
+
+    def __init__(
+        self,
+        num_users: Optional[int] = None,
+        movie_ids: Optional[List[int]] = None,
+        min_timestamp: Optional[int] = None,
+        max_timestamp: Optional[int] = None,
+    ):
+        self.num_users = num_users
+        self.movie_ids = None if movie_ids is None else np.unique(movie_ids)
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = max_timestamp
+
+    def apply(self, columns: Columns) -> Columns:
+        """読み込み済みの列(メモリマップを含む)を絞り込む
+
+        ユーザーIDが昇順に並んでいる場合は、対象ユーザーの行の範囲だけを読み込む。
+
+        Args:
+            columns (Columns): 評価データの列
+
+        Returns:
+            Columns: 絞り込んだ評価データの列
+        """
+        user_ids = columns["user_id"]
+        if self.num_users is not None and len(user_ids) > 0:
+            if np.all(user_ids[1:] >= user_ids[:-1]):
+                # 昇順の場合はユーザーの境界だけを見れば良い
+                starts = np.flatnonzero(np.diff(user_ids)) + 1
+                stop = (
+                    starts[self.num_users - 1]
+                    if len(starts) >= self.num_users
+                    else len(user_ids)
+                )
+                columns = {col: values[:stop] for col, values in columns.items()}
+            else:
+                threshold = self._user_threshold(np.unique(user_ids))
+                mask = user_ids <= threshold
+                columns = {col: values[mask] for col, values in columns.items()}
+
+        mask = self._mask(columns)
+        if mask is None:
+            return {col: np.asarray(values) for col, values in columns.items()}
+        return {col: values[mask] for col, values in columns.items()}
+
+    def stream(self, chunks: Iterable[Columns]) -> Columns:
+        """チャンクごとに読み込みながら絞り込む
+
+        ユーザーIDが昇順に並んでいる間は、num_users人分を読み終えた時点で読み込みを打ち切る。
+
+        Args:
+            chunks (Iterable[Columns]): 評価データのチャンク
+
+        Returns:
+            Columns: 絞り込んだ評価データの列
+        """
+        kept = []
+        smallest_user_ids = np.empty(0, dtype=np.int64)
+        threshold = np.inf
+        is_sorted = True
+        last_user_id = -np.inf
+
+        for chunk in chunks:
+            user_ids = chunk["user_id"]
+            if len(user_ids) == 0:
+                continue
+            is_sorted = (
+                is_sorted
+                and user_ids[0] >= last_user_id
+                and bool(np.all(user_ids[1:] >= user_ids[:-1]))
+            )
+            last_user_id = user_ids[-1]
+
+            if self.num_users is not None:
+                # これまでに読んだ中でIDが小さいnum_users人を保持し、その最大値を閾値とする
+                smallest_user_ids = np.union1d(smallest_user_ids, np.unique(user_ids))[
+                    : self.num_users
+                ]
+                threshold = self._user_threshold(smallest_user_ids)
+
+            mask = user_ids <= threshold
+            other_mask = self._mask(chunk)
+            if other_mask is not None:
+                mask &= other_mask
+            kept.append({col: values[mask] for col, values in chunk.items()})
+
+            if is_sorted and last_user_id > threshold:
+                break
+
+        if not kept:
+            return {
+                col: np.empty(0, dtype=RATING_DTYPES[col]) for col in RATING_COLUMNS
+            }
+        columns = {
+            col: np.concatenate([chunk[col] for chunk in kept]) for col in kept[0]
+        }
+        # 後のチャンクで閾値が下がった場合に備えて、最終的な閾値で絞り込み直す
+        mask = columns["user_id"] <= threshold
+        return {col: values[mask] for col, values in columns.items()}
+
+    def _user_threshold(self, unique_user_ids: np.ndarray) -> float:
+        if self.num_users is None or len(unique_user_ids) < self.num_users:
+            return np.inf
+        return unique_user_ids[self.num_users - 1]
+
+    def _mask(self, columns: Columns) -> Optional[np.ndarray]:
+        mask = None
+        if self.movie_ids is not None:
+            mask = np.isin(columns["movie_id"], self.movie_ids)
+        if self.min_timestamp is not None:
+            cond = columns["timestamp"] >= self.min_timestamp
+            mask = cond if mask is None else mask & cond
+        if self.max_timestamp is not None:
+            cond = columns["timestamp"] < self.max_timestamp
+            mask = cond if mask is None else mask & cond
+        return mask
@@ -0,0 +1,142 @@
+import sys
+from typing import Dict, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# 列名と列の値の対応。文字列の列はpd.Categoricalで保持する
+Columns = Dict[str, Union[np.ndarray, pd.Categorical]]
+
+RATING_COLUMNS = ["user_id", "movie_id", "rating", "timestamp"]
+RATING_DTYPES = {
+    "user_id": np.int32,
+    "movie_id": np.int32,
+    "rating": np.float32,
+    "timestamp": np.int64,
+}
+
+
+def _read_ratings_csv(path: str, chunksize: Optional[int] = None):
+    # `:`で区切るとフィールドの間に空の列が挟まるため、偶数番目の列だけを読む
+    return pd.read_csv(
+        path,
+        sep=":",
+        header=None,
+        usecols=[0, 2, 4, 6],
+        names=["user_id", "_1", "movie_id", "_2", "rating", "_3", "timestamp"],
+        dtype=RATING_DTYPES,
+        encoding="latin-1",
+        engine="c",
+        chunksize=chunksize,
+    )
+
+
+def read_ratings(path: str) -> Dict[str, np.ndarray]:
+    """ratings.datをCパーサーで読み込む
+
+    評価データは数値のみで構成されるため、`::`を`:`として扱い、空の列を読み飛ばすことで
+    pythonエンジンを使わずに読み込める。
+
+    Args:
+        path (str): ratings.datのパス
+
+    Returns:
+        Dict[str, np.ndarray]: 列名と列の値
+    """
+    ratings = _read_ratings_csv(path)
+    return {col: ratings[col].to_numpy() for col in RATING_COLUMNS}
+
+
+def iter_ratings(path: str, chunksize: int) -> Iterator[Dict[str, np.ndarray]]:
+    """ratings.datをチャンクごとに読み込む
+
+    Args:
+        path (str): ratings.datのパス
+        chunksize (int): 1チャンクあたりの行数
+
+    Yields:
+        Dict[str, np.ndarray]: 列名と列の値
+    """
+    with _read_ratings_csv(path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield {col: chunk[col].to_numpy() for col in RATING_COLUMNS}
+
+
+def read_rating_events(path: str) -> Dict[str, np.ndarray]:
+    """新しく届いた評価のイベントを読み込む
+
+    拡張子が.jsonlの場合と`-`(標準入力)の場合は、1行に1つのJSON
+    (`{"user_id": 1, "movie_id": 2, "rating": 4.0, "timestamp": 1234567890}`)として読み込む。
+    それ以外はratings.datと同じ形式として読み込む。
+
+    Args:
+        path (str): ファイルのパス。`-`の場合は標準入力
+
+    Returns:
+        Dict[str, np.ndarray]: 列名と列の値
+    """
+    if path != "-" and not path.endswith(".jsonl"):
+        return read_ratings(path)
+
+    events = pd.read_json(sys.stdin if path == "-" else path, lines=True, dtype=False)
+    if len(events) == 0:
+        return {col: np.array([], dtype=RATING_DTYPES[col]) for col in RATING_COLUMNS}
+    return {
+        col: events[col].to_numpy(dtype=RATING_DTYPES[col]) for col in RATING_COLUMNS
+    }
+
+
+def read_movies(path: str) -> Columns:
+    """movies.datを読み込む
+
+    タイトルに`:`が含まれるため、行ごとに`::`で分割する。
+
+    Args:
+        path (str): movies.datのパス
+
+    Returns:
+        Columns: 列名と列の値
+    """
+    movie_ids, titles, genres = [], [], []
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            movie_id, title, genre = line.rstrip("\n").split("::", 2)
+            movie_ids.append(int(movie_id))
+            titles.append(title)
+            genres.append(genre)
+
+    return {
+        "movie_id": np.array(movie_ids, dtype=np.int32),
+        "title": pd.Categorical(titles),
+        "genres": pd.Categorical(genres),
+    }
+
+
+def read_tags(path: str) -> Columns:
+    """tags.datを読み込む
+
+    タグに`:`が含まれることがあるため、先頭2列と末尾1列を`::`で切り出す。
+
+    Args:
+        path (str): tags.datのパス
+
+    Returns:
+        Columns: 列名と列の値
+    """
+    user_ids, movie_ids, tags, timestamps = [], [], [], []
+    with open(path) as f:
+        for line in f:
+            head, timestamp = line.rstrip("\n").rsplit("::", 1)
+            user_id, movie_id, tag = head.split("::", 2)
+            user_ids.append(int(user_id))
+            movie_ids.append(int(movie_id))
+            # 空のタグはread_csvと同様に欠損値として扱う
+            tags.append(tag if tag else None)
+            timestamps.append(int(timestamp))
+
+    return {
+        "user_id": np.array(user_ids, dtype=np.int32),
+        "movie_id": np.array(movie_ids, dtype=np.int32),
+        "tag": pd.Categorical(tags),
+        "timestamp": np.array(timestamps, dtype=np.int64),
+    }
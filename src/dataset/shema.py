@@ -6,25 +6,24 @@ from pandera.typing import Object, Series
 class MoviesBaseSchema(SchemaModel):
     """映画データのベーススキーマ"""
 
-    movie_id: Series[np.int64]
+    movie_id: Series[np.int32]
     title: Series[Object]
     genres: Series[Object]
 
 
 class MoviesSchema(SchemaModel):
-    """映画データのスキーマ"""
+    """映画データのスキーマ。genresは`|`区切りの文字列"""
 
-    movie_id: Series[np.int64]
+    movie_id: Series[np.int32]
     title: Series[Object]
     genres: Series[Object]
-    tag: Series[Object] = Field(nullable=True, coerce=True)
 
 
 class TagsBaseSchema(SchemaModel):
     """タグデータのベーススキーマ"""
 
-    user_id: Series[np.int64]
-    movie_id: Series[np.int64]
+    user_id: Series[np.int32]
+    movie_id: Series[np.int32]
     tag: Series[Object] = Field(nullable=True, coerce=True)
     timestamp: Series[np.int64]
 
@@ -32,17 +31,7 @@ class TagsBaseSchema(SchemaModel):
 class RatingsBaseSchema(SchemaModel):
     """評価データのベーススキーマ"""
 
-    user_id: Series[np.int64]
-    movie_id: Series[np.int64]
-    rating: Series[np.float64]
-    timestamp: Series[np.int64]
-
-
-class MoviesRatingSchema(SchemaModel):
-    """映画評価データのスキーマ"""
-
-    movie_id: Series[np.int64]
-    title: Series[Object]
-    genres: Series[Object]
-    rating: Series[np.float64]
+    user_id: Series[np.int32]
+    movie_id: Series[np.int32]
+    rating: Series[np.float32]
     timestamp: Series[np.int64]
@@ -0,0 +1,44 @@
+from typing import Type
+
+import numpy as np
+import pandas as pd
+from pandera import SchemaModel
+
+# full: 全行を検証する
+# sampled: 列と型は全体で、値はsample_size行を無作為に選んで検証する
+# off: 検証しない
+VALIDATION_MODES = ("full", "sampled", "off")
+
+
+def validate(
+    frame: pd.DataFrame,
+    schema: Type[SchemaModel],
+    mode: str = "sampled",
+    sample_size: int = 10_000,
+    random_state: int = 0,
+) -> pd.DataFrame:
+    """スキーマでデータを検証する
+
+    Args:
+        frame (pd.DataFrame): 検証するデータ
+        schema (Type[SchemaModel]): スキーマ
+        mode (str): 検証モード(full, sampled, off)
+        sample_size (int): sampledの場合に値を検証する行数
+        random_state (int): sampledの場合に行を選ぶ乱数のシード
+
+    Returns:
+        pd.DataFrame: fullの場合はスキーマの型に変換したデータ、それ以外は入力したデータ
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"mode must be one of {VALIDATION_MODES}, got {mode}")
+    if mode == "off":
+        return frame
+    if mode == "full" or len(frame) <= sample_size:
+        return schema.validate(frame)
+
+    # 抜き出した行も元のデータと同じ列と型を持つため、列と型の検証は全体に対する検証と同じになる
+    rows = np.random.default_rng(random_state).choice(
+        len(frame), sample_size, replace=False
+    )
+    schema.validate(frame.iloc[np.sort(rows)])
+    return frame
@@ -0,0 +1,241 @@
+r"""全てのレコメンドモデルを、ハイパーパラメータの組み合わせごとに並列に学習・評価するベンチマーク
+
+データセットは最初に一度だけ読み込み、評価データの列と学習データの疎行列を.npyとして書き出す。
+各ワーカーはそれをメモリマップで開くため、タスクごとにデータセットをpickleで受け渡さない。
+ピークRSSを設定ごとに計測できるように、ワーカーはspawnで起動し、1タスクごとに作り直す。
+
+    python -m src.jobs.benchmark --data-path data/ml-10m/ml-10M100K \
+        --num-users 1000 --processes 2
+    python -m src.jobs.benchmark --models nmf \
+        --grid '{"nmf": {"factors": [5, 10, 20]}}'
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.jobs.retrieve import DataLoader
+from src.jobs.train import Train
+from src.models.dataset import Dataset
+from src.models.interaction_matrix import InteractionMatrix
+from src.models.profiler import peak_rss_mb
+from src.models.registry import get_model_class, model_names, resolve_model_name
+
+# モデルごとに試すハイパーパラメータの候補。指定しないパラメータはモデルの既定値を使う
+DEFAULT_GRID: Dict[str, Dict[str, List[Any]]] = {
+    "PopularityRecommender": {"minimum_num_rating": [100, 200]},
+    "RandomRecommender": {"seed": [0]},
+    "AssociationRecommender": {"min_support": [0.1, 0.05]},
+    "NMFRecommender": {"factors": [5, 10]},
+    "ContentRecommender": {"num_neighbors": [20, 50]},
+    # ベンチマークはモデルごとにプロセスを分けて並列に動かすため、モデル内のスレッドは1つにする
+    "ItemKNNRecommender": {"num_neighbors": [20, 50], "num_threads": [1]},
+    "ALSRecommender": {"factors": [10, 20], "num_threads": [1]},
+}
+
+# 評価データのうち、.npyとして共有する列
+SHARED_COLUMNS = ["user_id", "movie_id", "rating", "timestamp"]
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """パラメータごとの候補から、全ての組み合わせを作る
+
+    Args:
+        grid (Dict[str, List[Any]]): キーはパラメータ名で、値は候補のリスト
+
+    Returns:
+        List[Dict[str, Any]]: パラメータの組み合わせ
+    """
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def share_dataset(dataset: Dataset, path: str) -> None:
+    """ワーカーがメモリマップで読み込めるように、データセットをディレクトリに書き出す
+
+    Args:
+        dataset (Dataset): データセット
+        path (str): 書き出し先のディレクトリ
+    """
+    os.makedirs(path, exist_ok=True)
+    for col in SHARED_COLUMNS:
+        np.save(
+            os.path.join(path, f"ratings.{col}.npy"), dataset.ratings[col].to_numpy()
+        )
+    for name, array in dataset.interaction_matrix.to_arrays().items():
+        np.save(os.path.join(path, f"interaction.{name}.npy"), array)
+    # 映画の情報と特徴、テストデータの正解は小さいため、一度だけpickleで書き出す
+    pd.to_pickle(
+        {
+            "num_train": dataset.num_train,
+            "item_content": dataset.item_content,
+            "item_features": dataset.item_features,
+            "test_user2items": dataset.test_user2items,
+        },
+        os.path.join(path, "objects.pkl"),
+    )
+
+
+def load_shared_dataset(path: str) -> Dataset:
+    """share_datasetで書き出したデータセットを読み込む
+
+    評価データの列と疎行列はメモリマップで開く。
+
+    Args:
+        path (str): 書き出し先のディレクトリ
+
+    Returns:
+        Dataset: データセット
+    """
+    objects = pd.read_pickle(os.path.join(path, "objects.pkl"))
+    ratings = pd.DataFrame(
+        {
+            col: np.load(os.path.join(path, f"ratings.{col}.npy"), mmap_mode="r")
+            for col in SHARED_COLUMNS
+        },
+        copy=False,
+    )
+    dataset = Dataset(
+        ratings=ratings,
+        num_train=objects["num_train"],
+        test_user2items=objects["test_user2items"],
+        item_content=objects["item_content"],
+        item_features=objects["item_features"],
+    )
+    dataset._interaction_matrix = InteractionMatrix.from_arrays(
+        {
+            name: np.load(os.path.join(path, f"interaction.{name}.npy"), mmap_mode="r")
+            for name in ("user_ids", "movie_ids", "indptr", "indices", "rating")
+        }
+    )
+    return dataset
+
+
+def _run(task: Dict[str, Any]) -> Dict[str, Any]:
+    """1つの設定で学習と評価を行い、時間とピークRSSと評価指標を返す"""
+    logger.remove()
+    row = {"model": task["model"], "params": json.dumps(task["params"])}
+    try:
+        start = time.perf_counter()
+        dataset = load_shared_dataset(task["dataset_path"])
+        row["load_sec"] = time.perf_counter() - start
+
+        # ワーカーは自分のモデルのモジュールだけを読み込む
+        model = get_model_class(task["model"])()
+        train = Train()
+        start = time.perf_counter()
+        recommend_result = train.train(model, dataset, **task["params"])
+        row["train_sec"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        metrics = train.evaluate(dataset, recommend_result)
+        row["evaluate_sec"] = time.perf_counter() - start
+        row.update(metrics.dict(exclude={"at_k"}))
+    except Exception as e:
+        row["error"] = repr(e)
+    row["peak_rss_mb"] = peak_rss_mb()
+    return row
+
+
+def run_benchmark(
+    dataset: Dataset,
+    grid: Dict[str, Dict[str, List[Any]]],
+    processes: int = 1,
+    work_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    """モデルとハイパーパラメータの組み合わせごとに、プロセスプールで学習と評価を行う
+
+    Args:
+        dataset (Dataset): データセット
+        grid (Dict[str, Dict[str, List[Any]]]): キーはモデル名(短い名前またはクラス名)で、値はパラメータごとの候補
+        processes (int): 並列に実行するプロセス数
+        work_dir (Optional[str]): データセットを書き出す作業ディレクトリ。Noneの場合は一時ディレクトリ
+
+    Returns:
+        pd.DataFrame: 設定ごとの時間、ピークRSS、評価指標
+    """
+    grid = {resolve_model_name(model): model_grid for model, model_grid in grid.items()}
+
+    dataset_path = tempfile.mkdtemp(dir=work_dir)
+    try:
+        share_dataset(dataset, dataset_path)
+        tasks = [
+            {"model": model, "params": params, "dataset_path": dataset_path}
+            for model, model_grid in grid.items()
+            for params in expand_grid(model_grid)
+        ]
+        logger.info(f"run {len(tasks)} configurations with {processes} processes")
+
+        context = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        with context.Pool(processes, maxtasksperchild=1) as pool:
+            rows = pool.map(_run, tasks, chunksize=1)
+        logger.info(f"done in {time.perf_counter() - start:.1f} sec")
+    finally:
+        shutil.rmtree(dataset_path, ignore_errors=True)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--num-users", type=int, default=1000)
+    parser.add_argument("--num-test-items", type=int, default=5)
+    parser.add_argument("--models", nargs="+", default=None)
+    parser.add_argument(
+        "--grid",
+        default=None,
+        help="モデル名ごとのパラメータの候補(JSON文字列またはJSONファイルのパス)",
+    )
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", default=None, help="結果を書き出すCSVのパス")
+    args = parser.parse_args()
+
+    grid = {model: {} for model in model_names()}
+    grid.update(DEFAULT_GRID)
+    try:
+        if args.grid is not None:
+            if os.path.exists(args.grid):
+                with open(args.grid) as f:
+                    user_grid = json.load(f)
+            else:
+                user_grid = json.loads(args.grid)
+            # 短い名前("nmf"など)で指定した候補も、既定の候補と同じクラス名のキーで置き換える
+            grid.update(
+                {
+                    resolve_model_name(model): model_grid
+                    for model, model_grid in user_grid.items()
+                }
+            )
+        if args.models is not None:
+            models = [resolve_model_name(model) for model in args.models]
+            grid = {model: grid.get(model, {}) for model in models}
+    except ValueError as e:
+        parser.error(str(e))
+
+    dataset = DataLoader(
+        num_users=args.num_users,
+        num_test_items=args.num_test_items,
+        data_path=args.data_path,
+    ).load_data()
+    results = run_benchmark(dataset, grid, processes=args.processes)
+
+    print(results.round(4).to_string(index=False))
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+r"""レコメンドモデルの学習、評価、推薦結果の書き出しを行うコマンドラインの入口
+
+モデルは--modelに短い名前("popularity"など)またはクラス名で指定する。
+モデルのモジュールとデータの読み込み(pandera)は、実行するコマンドで必要になったときに初めて読み込むため、
+保存済みのモデルから推薦結果を書き出すだけのコマンドは、使わないモデルの依存(faiss、scikit-learnなど)を読み込まない。
+実行ごとに段階ごとの時間とメモリを計測し、--report-dirにJSONのレポートを書き出す。
+
+    recommend-movie train --model nmf --data-path data/ml-10m/ml-10M100K \
+        --params '{"factors": 10}'
+    recommend-movie evaluate --model popularity --model-path models/popularity
+    recommend-movie export --model popularity --output exports/popularity \
+        --processes 4
+    python -m src.jobs.cli train --model popularity
+"""
+import argparse
+import json
+import os
+from typing import List, Optional
+
+from loguru import logger
+
+from src.models.artifact import read_model_name
+from src.models.base_recommender import BaseRecommender
+from src.models.profiler import StageProfiler, stage
+from src.models.registry import MODEL_ALIASES, get_model_class, resolve_model_name
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="recommend-movie")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--model",
+        required=True,
+        help=f"モデル名({', '.join(sorted(MODEL_ALIASES))})またはクラス名",
+    )
+    common.add_argument(
+        "--model-path",
+        default=None,
+        help="成果物のディレクトリ。省略した場合はmodels/<短いモデル名>",
+    )
+    common.add_argument("--report-dir", default="reports", help="計測結果のレポートを書き出すディレクトリ")
+    common.add_argument("--no-report", action="store_true")
+    common.add_argument(
+        "--profile-stages",
+        nargs="*",
+        default=[],
+        help="cProfileでも計測する区間の名前(recommendなど)",
+    )
+    common.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="tracemallocで区間ごとのメモリの割り当てのピークも計測する(処理が遅くなる)",
+    )
+
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    data.add_argument("--num-users", type=int, default=1000)
+    data.add_argument("--num-test-items", type=int, default=5)
+    data.add_argument(
+        "--params",
+        default="{}",
+        help="fitに渡すハイパーパラメータ(JSON文字列またはJSONファイルのパス)",
+    )
+
+    train = subparsers.add_parser("train", parents=[common, data], help="学習して成果物を保存する")
+    train.set_defaults(run=_train)
+
+    evaluate = subparsers.add_parser(
+        "evaluate",
+        parents=[common, data],
+        help="テストデータで評価する。--model-pathに成果物があれば学習し直さない",
+    )
+    evaluate.set_defaults(run=_evaluate)
+
+    export = subparsers.add_parser(
+        "export",
+        parents=[common],
+        help="保存済みのモデルで全ユーザーへの推薦結果をシャードに分けて書き出す",
+    )
+    export.add_argument("--output", required=True, help="書き出し先のディレクトリ")
+    export.add_argument("--k", type=int, default=10)
+    export.add_argument("--shard-size", type=int, default=10_000)
+    export.add_argument("--batch-size", type=int, default=1_000)
+    export.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    export.set_defaults(run=_export)
+
+    args = parser.parse_args(argv)
+    try:
+        args.model = resolve_model_name(args.model)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.model_path is None:
+        aliases = {name: alias for alias, name in MODEL_ALIASES.items()}
+        args.model_path = os.path.join("models", aliases.get(args.model, args.model))
+
+    with StageProfiler(
+        profile_stages=args.profile_stages, trace_memory=args.trace_memory
+    ) as profiler:
+        args.run(args)
+    if not args.no_report:
+        report_path = os.path.join(
+            args.report_dir,
+            f"profile_{args.command}_{profiler.started_at.replace(':', '')}.json",
+        )
+        profiler.write(report_path)
+        logger.info(f"profile report: {report_path}")
+
+
+def _load_dataset(args: argparse.Namespace):
+    # データの読み込みはpanderaの読み込みに時間がかかるため、使うコマンドでだけ読み込む
+    from src.jobs.retrieve import DataLoader
+
+    return DataLoader(
+        num_users=args.num_users,
+        num_test_items=args.num_test_items,
+        data_path=args.data_path,
+    ).load_data()
+
+
+def _params(args: argparse.Namespace) -> dict:
+    if os.path.exists(args.params):
+        with open(args.params) as f:
+            return json.load(f)
+    return json.loads(args.params)
+
+
+def _check_artifact(args: argparse.Namespace) -> None:
+    saved_name = read_model_name(args.model_path)
+    if saved_name != args.model:
+        raise ValueError(
+            f"{args.model_path} is an artifact of {saved_name}, not {args.model}"
+        )
+
+
+def _load_model(args: argparse.Namespace) -> BaseRecommender:
+    _check_artifact(args)
+    return get_model_class(args.model).load(args.model_path)
+
+
+def _train(args: argparse.Namespace) -> None:
+    from src.jobs.train import Train
+
+    dataset = _load_dataset(args)
+    model = get_model_class(args.model)()
+    Train().train(model, dataset, **_params(args))
+    model.save(args.model_path)
+    logger.info(f"saved {args.model} to {args.model_path}")
+
+
+def _evaluate(args: argparse.Namespace) -> None:
+    from src.jobs.train import Train
+
+    dataset = _load_dataset(args)
+    train = Train()
+    if os.path.exists(args.model_path):
+        model = _load_model(args)
+        recommend_result = model.recommend_result(dataset)
+    else:
+        model = get_model_class(args.model)()
+        recommend_result = train.train(model, dataset, **_params(args))
+    metrics = train.evaluate(dataset, recommend_result)
+    logger.info(f"metrics: {metrics}")
+    print(metrics.json())
+
+
+def _export(args: argparse.Namespace) -> None:
+    from src.jobs.export import export_recommendations
+
+    _check_artifact(args)
+    with stage(
+        "export", model=args.model, k=args.k, processes=args.processes
+    ) as record:
+        summary = export_recommendations(
+            args.model,
+            args.model_path,
+            args.output,
+            k=args.k,
+            shard_size=args.shard_size,
+            batch_size=args.batch_size,
+            processes=args.processes,
+        )
+        record.update(summary)
+    logger.info(f"exported recommendations to {args.output}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+r"""保存済みのモデルで、全ユーザーへの上位k本の推薦結果をシャードに分けて書き出す
+
+ユーザーを--shard-size人ずつのシャードに分け、各ワーカープロセスが成果物をメモリマップで開いてシャードごとに推薦する。
+シャードの中は--batch-size人ずつ推薦して書き出すため、メモリはバッチの大きさまでしか使わない。
+シャードのファイルは書き終えてから名前を変えて置くため、途中で止まっても、もう一度実行すれば
+書き終えていないシャードだけを書き出す。成果物が保存し直された場合は、前回のシャードと混ざらないように再開しない。
+
+    recommend-movie export --model popularity --output exports/popularity \
+        --processes 4
+    recommend-movie export --model nmf --output exports/nmf --shard-size 10000
+"""
+import json
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from src.models.artifact import artifact_fingerprint
+from src.models.base_recommender import BaseRecommender
+from src.models.profiler import peak_rss_mb
+from src.models.random_recommender import RandomRecommender
+from src.models.registry import get_model_class
+
+# 書き出しの設定と成果物の指紋を記録するファイル。再開する際に設定と成果物が同じか確かめる
+MANIFEST_NAME = "_manifest.json"
+# ワーカーのプロセスで、BLASなどのスレッド数を1にする環境変数
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+# ワーカーのプロセスで読み込んだモデル
+_worker_model: Optional[BaseRecommender] = None
+
+
+def export_recommendations(
+    model_name: str,
+    model_path: str,
+    output_dir: str,
+    k: int = 10,
+    shard_size: int = 10_000,
+    batch_size: int = 1_000,
+    processes: int = 1,
+) -> Dict[str, Any]:
+    """全ユーザーへの推薦結果を、シャードごとのJSONLファイルに書き出す
+
+    Args:
+        model_name (str): モデル名(クラス名)
+        model_path (str): 成果物のディレクトリ
+        output_dir (str): 書き出し先のディレクトリ
+        k (int): 推薦する映画の数
+        shard_size (int): 1つのシャードのユーザー数
+        batch_size (int): 一度に推薦するユーザー数
+        processes (int): 並列に推薦するプロセス数。1の場合はこのプロセスで推薦する
+
+    Returns:
+        Dict[str, Any]: シャード数、書き出したシャード数、書き出したユーザー数、かかった秒数、
+            ワーカーのピークRSSの最大値
+    """
+    global _worker_model
+    # 成果物はメモリマップで開くため、ユーザー数を知るために読み込んでも配列はコピーしない
+    model = get_model_class(model_name).load(model_path)
+    num_users = len(model.interaction_matrix.user_ids)
+    manifest = {
+        "model": model_name,
+        "model_path": os.path.abspath(model_path),
+        "k": k,
+        "shard_size": shard_size,
+        "num_users": num_users,
+        "artifact": artifact_fingerprint(model_path),
+    }
+    _check_manifest(output_dir, manifest)
+
+    tasks = []
+    for shard, start in enumerate(range(0, num_users, shard_size)):
+        path = shard_path(output_dir, shard)
+        if not os.path.exists(path):
+            tasks.append(
+                {
+                    "shard": shard,
+                    "path": path,
+                    "start": start,
+                    "stop": min(start + shard_size, num_users),
+                    "k": k,
+                    "batch_size": batch_size,
+                }
+            )
+    num_shards = -(-num_users // shard_size)
+    logger.info(
+        f"export {len(tasks)} of {num_shards} shards with {processes} processes"
+    )
+
+    start = time.perf_counter()
+    num_exported = 0
+    worker_peak_rss_mb = 0.0
+    if processes == 1:
+        _worker_model = model
+        shard_results = map(_export_shard, tasks)
+        pool = None
+    else:
+        # 成果物はワーカーごとにメモリマップで開くため、ページキャッシュを共有する
+        # ワーカー内のスレッドが競合しないように、スレッド数を1にしてから起動する
+        with _single_threaded_env():
+            pool = multiprocessing.get_context("spawn").Pool(
+                processes, initializer=_init_worker, initargs=(model_name, model_path)
+            )
+        shard_results = pool.imap_unordered(_export_shard, tasks)
+    try:
+        for done, result in enumerate(shard_results, start=1):
+            num_exported += result["users"]
+            worker_peak_rss_mb = max(worker_peak_rss_mb, result["peak_rss_mb"])
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"exported {result['path']} ({done}/{len(tasks)}), "
+                f"{num_exported / elapsed:.0f} users/sec"
+            )
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return {
+        "shards": num_shards,
+        "exported_shards": len(tasks),
+        "exported_users": num_exported,
+        "sec": time.perf_counter() - start,
+        "worker_peak_rss_mb": worker_peak_rss_mb,
+    }
+
+
+def shard_path(output_dir: str, shard: int) -> str:
+    """シャードのファイルのパス"""
+    return os.path.join(output_dir, f"part-{shard:05d}.jsonl")
+
+
+def _check_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    # 書き出し先に前回の設定があれば同じ設定か確かめ、なければ設定を記録する
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        changed = sorted(
+            key
+            for key in previous.keys() | manifest.keys()
+            if previous.get(key) != manifest.get(key)
+        )
+        if changed:
+            # artifactが違う場合は、前回の書き出しの後に成果物が保存し直されている
+            raise ValueError(
+                f"{output_dir} was exported with a different {', '.join(changed)}, "
+                "use another output directory or remove it"
+            )
+        return
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+@contextmanager
+def _single_threaded_env() -> Iterator[None]:
+    # spawnで起動するプロセスは起動時の環境変数を引き継ぐため、起動する間だけ書き換える
+    previous = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: "1" for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(model_name: str, model_path: str) -> None:
+    global _worker_model
+    _worker_model = get_model_class(model_name).load(model_path)
+
+
+def _export_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    """1つのシャードのユーザーに推薦し、一時ファイルに書き終えてからシャードのファイルに置く"""
+    if isinstance(_worker_model, RandomRecommender):
+        # 全てのワーカーが同じシードを読み込むため、シャードごとに乱数列を分けて相関させない
+        _worker_model.reseed(task["shard"])
+    user_ids = _worker_model.interaction_matrix.user_ids[task["start"] : task["stop"]]
+    batches = (
+        _worker_model.recommend(
+            user_ids[start : start + task["batch_size"]], k=task["k"]
+        )
+        for start in range(0, len(user_ids), task["batch_size"])
+    )
+    directory, name = os.path.split(task["path"])
+    temp_path = os.path.join(directory, f".{name}.tmp")
+    _write_jsonl(temp_path, batches)
+    os.replace(temp_path, task["path"])
+    return {"path": task["path"], "users": len(user_ids), "peak_rss_mb": peak_rss_mb()}
+
+
+def _write_jsonl(path: str, batches: Iterator[Dict[int, List[int]]]) -> None:
+    with open(path, "w") as f:
+        for user2items in batches:
+            f.writelines(
+                json.dumps({"user_id": user_id, "movie_ids": movie_ids}) + "\n"
+                for user_id, movie_ids in user2items.items()
+            )
@@ -0,0 +1,46 @@
+r"""StageProfilerが書き出した2つの実行のレポートを、区間ごとに比べる
+
+区間のパスごとに経過時間、CPU時間、ピークRSSの前後の値と比を表示する。
+--max-ratioを指定すると、経過時間かピークRSSの比がそれを超えた区間がある場合に終了コード1で終わる。
+
+    python -m src.jobs.profile_report reports/profile_before.json reports/profile_after.json \
+        --max-ratio 1.2
+"""
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+from src.models.profiler import compare_reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before", help="基準にするレポートのパス")
+    parser.add_argument("after", help="比べるレポートのパス")
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=None,
+        help="経過時間とピークRSSの比の許容値。超えた区間があれば終了コード1で終わる",
+    )
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    result = pd.DataFrame(compare_reports(before, after))
+    print(result.round(4).to_string(index=False))
+
+    if args.max_ratio is not None:
+        ratios = result[["wall_sec_ratio", "peak_rss_mb_ratio"]].max(axis=1)
+        regressed = result.path[ratios > args.max_ratio].tolist()
+        if regressed:
+            print(f"regressed stages: {regressed}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
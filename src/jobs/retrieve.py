@@ -1,31 +1,62 @@
 import os
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import pandera as pa
 from loguru import logger
 from pandera.typing import DataFrame
 
+from src.dataset import reader
+from src.dataset.cache import ColumnarCache
+from src.dataset.ratings_filter import RatingsFilter
 from src.dataset.shema import (
     MoviesBaseSchema,
-    MoviesRatingSchema,
     MoviesSchema,
     RatingsBaseSchema,
     TagsBaseSchema,
 )
+from src.dataset.validation import VALIDATION_MODES, validate
 from src.models.dataset import Dataset
+from src.models.interaction_matrix import latest_rating_mask
+from src.models.item_features import ItemFeatures
+from src.models.profiler import stage
+from src.models.user_history import UserHistory, chronological_order
 
 
 class DataLoader:
     def __init__(
         self,
-        num_users: int = 1000,
+        num_users: Optional[int] = 1000,
         num_test_items: int = 5,
         data_path: str = "../data/ml-10m/ml-10M100K/",
+        use_cache: bool = True,
+        cache_dir: Optional[str] = None,
+        movie_ids: Optional[List[int]] = None,
+        min_timestamp: Optional[int] = None,
+        max_timestamp: Optional[int] = None,
+        chunksize: int = 1_000_000,
+        validation: str = "sampled",
+        validation_sample_size: int = 10_000,
     ):
         self.num_users = num_users
         self.num_test_items = num_test_items
         self.data_path = data_path
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir or os.path.join(data_path, ".cache")
+        self.ratings_filter = RatingsFilter(
+            num_users=num_users,
+            movie_ids=movie_ids,
+            min_timestamp=min_timestamp,
+            max_timestamp=max_timestamp,
+        )
+        self.chunksize = chunksize
+        # 読み込んだファイルごとに一度だけ、このモードでスキーマを検証する(full, sampled, off)
+        if validation not in VALIDATION_MODES:
+            raise ValueError(
+                f"validation must be one of {VALIDATION_MODES}, got {validation}"
+            )
+        self.validation = validation
+        self.validation_sample_size = validation_sample_size
 
     def load_data(self) -> Dataset:
         """データを読み込み、Datasetに変換する
@@ -34,116 +65,132 @@ class DataLoader:
             Dataset: データセット
         """
         logger.info("Start load data")
-        ratings, movie_content = self._load()
-        movie_train, movie_test = self._split_data(ratings)
-
-        movie_test_user2items = (
-            movie_test[movie_test.rating >= 4]
-            .groupby("user_id")
-            .agg({"movie_id": list})["movie_id"]
-            .to_dict()
-        )
+        with stage("load_data") as record:
+            ratings, movie_content, item_features = self._load()
+            with stage("split_data", rows=len(ratings)):
+                ratings, num_train = self._split_data(ratings)
+            record.update(rows=len(ratings), train_rows=num_train)
+
+        movie_test = UserHistory.from_frame(ratings.iloc[num_train:])
+        movie_test_user2items = movie_test.to_user2items(movie_test.ratings >= 4)
 
         return Dataset(
-            train=movie_train,
-            test=movie_test,
+            ratings=ratings,
+            num_train=num_train,
             test_user2items=movie_test_user2items,
             item_content=movie_content,
+            item_features=item_features,
         )
 
-    @pa.check_types
+    def load_item_features(self) -> ItemFeatures:
+        """映画のジャンルとタグの特徴の行列だけを読み込む(評価データは読み込まない)
+
+        Returns:
+            ItemFeatures: 映画×特徴(ジャンル、タグ)の行列
+        """
+        with stage("load_movies") as record:
+            movies, item_features = self._load_movies()
+            record["rows"] = len(movies)
+        return item_features
+
     def _split_data(
-        self, movies: DataFrame[MoviesSchema]
-    ) -> Tuple[DataFrame[MoviesSchema], DataFrame[MoviesSchema]]:
+        self, ratings: DataFrame[RatingsBaseSchema]
+    ) -> Tuple[DataFrame[RatingsBaseSchema], int]:
         """データを学習用とテスト用に分割する
 
+        学習用とテスト用の行をそれぞれユーザーの昇順、同じユーザーの中では時刻の古い順に並べ、
+        学習用を先頭、テスト用を末尾に置く。学習用とテスト用のデータは、並べ替えた評価データの
+        先頭と末尾の範囲として参照し、どちらもソートせずにユーザーごとの履歴(UserHistory)にできる。
+
         Args:
-            movies (DataFrame[MoviesSchema]): 映画データ
+            ratings (DataFrame[RatingsBaseSchema]): 評価データ
 
         Returns:
-            Tuple[DataFrame[MoviesSchema], DataFrame[MoviesSchema]]: 学習用データ、テスト用データ
+            Tuple[DataFrame[RatingsBaseSchema], int]: 並べ替えた評価データ、学習用データの行数
         """
         logger.info("Start split data")
 
         # 学習用とテスト用にデータを分割する
         # 各ユーザーの直近の映画5件を評価用に使い、それ以外を学習用とする
-        # まずは、それぞれのユーザーが評した映画の順序を計算する
-        # 直近付与した映画から順番を付与していく（0始まり）
-        movies["rating_order"] = movies.groupby("user_id")["timestamp"].rank(
-            method="first", ascending=False
-        )
-
-        movie_train = movies[movies.rating_order > self.num_test_items]
-        movie_train = MoviesSchema(movie_train)
-        movie_test = movies[movies.rating_order <= self.num_test_items]
-        movie_test = MoviesSchema(movie_test)
-
-        return movie_train, movie_test
-
-    @pa.check_types
-    def _load(self) -> Tuple[DataFrame[MoviesRatingSchema], DataFrame[MoviesSchema]]:
+        # まずは、評価データをユーザーごとに時刻の古い順に1回だけ安定ソートする
+        # 同じ時刻の場合は先に現れた行を新しいとみなすため、行を逆順にしてからソートする
+        reverse = np.arange(len(ratings))[::-1]
+        order = reverse[
+            chronological_order(
+                ratings.user_id.to_numpy()[reverse],
+                ratings.timestamp.to_numpy()[reverse],
+            )
+        ]
+        ratings = ratings.take(order).reset_index(drop=True)
+
+        # 並べ替えた評価データはそのまま履歴になり、各ユーザーの末尾の範囲がテスト用になる
+        _, test = UserHistory.from_frame(ratings).latest(self.num_test_items)
+        is_test = np.zeros(len(ratings), dtype=bool)
+        is_test[test] = True
+        rows = np.concatenate([np.flatnonzero(~is_test), test])
+        ratings = ratings.take(rows).reset_index(drop=True)
+        num_train = len(rows) - len(test)
+
+        return ratings, num_train
+
+    def _load(
+        self,
+    ) -> Tuple[DataFrame[RatingsBaseSchema], DataFrame[MoviesSchema], ItemFeatures]:
         """データを読み込む
 
+        映画の情報は評価データに結合せず、映画IDで引く別のテーブルとして返す。
+
         Returns:
-            Tuple[DataFrame[MoviesRatingSchema], DataFrame[MoviesSchema]]: 映画評価データ、映画データ
+            Tuple[DataFrame[RatingsBaseSchema], DataFrame[MoviesSchema], ItemFeatures]:
+                評価データ、映画データ、映画×特徴(ジャンル、タグ)の行列
         """
-        movies = self._load_movies()
-        ratings = self._load_ratings()
+        with stage("load_movies") as record:
+            movies, item_features = self._load_movies()
+            record["rows"] = len(movies)
+        with stage("load_ratings") as record:
+            ratings = self._load_ratings()
 
-        # データを結合する
-        logger.info("merge ratings data")
-        movies_ratings = ratings.merge(movies, on="movie_id")
-        movies_ratings = MoviesRatingSchema(movies_ratings)
+            # 映画データにない映画の評価は使わない
+            known = np.isin(ratings.movie_id.to_numpy(), movies.movie_id.to_numpy())
+            if not known.all():
+                ratings = ratings[known].reset_index(drop=True)
 
-        logger.info(
-            f"unique_users={len(movies_ratings.user_id.unique())}, unique_movies={len(movies_ratings.movie_id.unique())}"
-        )
+            num_users = len(ratings.user_id.unique())
+            num_movies = len(ratings.movie_id.unique())
+            record.update(rows=len(ratings), users=num_users, movies=num_movies)
+        logger.info(f"unique_users={num_users}, unique_movies={num_movies}")
 
-        return movies_ratings, movies
+        return ratings, movies, item_features
 
-    @pa.check_types
-    def _load_movies(self) -> DataFrame[MoviesSchema]:
+    def _load_movies(self) -> Tuple[DataFrame[MoviesSchema], ItemFeatures]:
         """映画データを読み込む
 
+        ジャンルとタグはリストの列にせず、整数に符号化した映画×特徴の疎行列にする。
+
         Returns:
-            DataFrame[MoviesSchema]: 映画データ
+            Tuple[DataFrame[MoviesSchema], ItemFeatures]: 映画データ、映画×特徴(ジャンル、タグ)の行列
         """
         # 映画の情報の読み込み
         logger.info("load movies data")
-        m_cols = ["movie_id", "title", "genres"]
-        movies = pd.read_csv(
-            os.path.join(self.data_path, "movies.dat"),
-            names=m_cols,
-            sep="::",
-            encoding="latin-1",
-            engine="python",
+        movies = self._read_columns("movies", reader.read_movies).astype(
+            {"title": object, "genres": object}
         )
-
-        # genreをlistを形式で保持する
-        movies["genres"] = movies.genres.apply(lambda x: x.split("|"))
-        movies = MoviesBaseSchema(movies)
+        movies = self._validate(movies, MoviesBaseSchema)
 
         # ユーザーがタグ付けした映画の情報の読み込み
         logger.info("load tags data")
-        t_cols = ["user_id", "movie_id", "tag", "timestamp"]
-        user_tagged_movies = pd.read_csv(
-            os.path.join(self.data_path, "tags.dat"),
-            names=t_cols,
-            sep="::",
-            engine="python",
+        user_tagged_movies = self._read_columns("tags", reader.read_tags).astype(
+            {"tag": object}
         )
         # tagを小文字にする
         user_tagged_movies["tag"] = user_tagged_movies["tag"].str.lower()
-        user_tagged_movies = TagsBaseSchema(user_tagged_movies)
-        movie_tags = user_tagged_movies.groupby("movie_id").agg({"tag": list})
+        user_tagged_movies = self._validate(user_tagged_movies, TagsBaseSchema)
 
-        # タグ情報を映画情報に結合する
-        movies = movies.merge(movie_tags, on="movie_id", how="left")
-        movies = MoviesSchema(movies)
+        # ジャンルとタグを映画×特徴の行列にする
+        item_features = ItemFeatures.from_frames(movies, user_tagged_movies)
 
-        return movies
+        return movies, item_features
 
-    @pa.check_types
     def _load_ratings(self) -> DataFrame[RatingsBaseSchema]:
         """映画評価データを読み込む
 
@@ -151,17 +198,53 @@ class DataLoader:
             DataFrame[RatingsBaseSchema]: 映画評価データ
         """
         # ユーザーの評価情報の読み込み
-        r_cols = ["user_id", "movie_id", "rating", "timestamp"]
-        ratings = pd.read_csv(
-            os.path.join(self.data_path, "ratings.dat"),
-            names=r_cols,
-            sep="::",
-            encoding="latin-1",
-            engine="python",
-        )
-        # ユーザー数をnum_usersに制限する
-        valid_user_ids = sorted(ratings.user_id.unique())[: self.num_users]
-        ratings = ratings[ratings.user_id <= max(valid_user_ids)]
-        ratings = RatingsBaseSchema(ratings)
+        # ユーザー数をnum_usersに制限し、映画と評価時刻の条件で絞り込みながら読み込む
+        source_path = os.path.join(self.data_path, "ratings.dat")
+        num_appended = 0
+        if self.use_cache:
+            cache = ColumnarCache(self.cache_dir)
+            columns = cache.load("ratings", source_path, reader.read_ratings)
+            num_appended = cache.num_appended_rows("ratings", source_path)
+            columns = self.ratings_filter.apply(columns)
+        else:
+            columns = self.ratings_filter.stream(
+                reader.iter_ratings(source_path, self.chunksize)
+            )
+        # 評価データは行数が多いため、読み込んだときの型(int32, float32)のまま保持する
+        ratings = pd.DataFrame(columns).astype(reader.RATING_DTYPES, copy=False)
+        ratings = self._validate(ratings, RatingsBaseSchema)
+        if num_appended > 0:
+            # update.pyで追加した評価には評価し直した組が含まれるため、同じ組は最新の評価だけを残す
+            latest = latest_rating_mask(ratings)
+            if not latest.all():
+                ratings = ratings[latest].reset_index(drop=True)
 
         return ratings
+
+    def _validate(self, frame: pd.DataFrame, schema) -> pd.DataFrame:
+        """読み込んだファイルのデータを、設定した検証モードで一度だけ検証する"""
+        return validate(
+            frame,
+            schema,
+            mode=self.validation,
+            sample_size=self.validation_sample_size,
+        )
+
+    def _read_columns(
+        self, name: str, parser: Callable[[str], reader.Columns]
+    ) -> pd.DataFrame:
+        """`{name}.dat`を読み込む。キャッシュが有効な場合は列キャッシュを経由する
+
+        Args:
+            name (str): ファイル名(拡張子なし)
+            parser (Callable[[str], reader.Columns]): ファイルを読み込む関数
+
+        Returns:
+            pd.DataFrame: 読み込んだデータ
+        """
+        source_path = os.path.join(self.data_path, f"{name}.dat")
+        if self.use_cache:
+            columns = ColumnarCache(self.cache_dir).load(name, source_path, parser)
+        else:
+            columns = parser(source_path)
+        return pd.DataFrame(columns)
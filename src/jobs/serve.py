@@ -0,0 +1,360 @@
+r"""学習済みの成果物を読み込み、HTTPで推薦結果を返すサーバー
+
+起動時に成果物を一度だけ読み込み、以降はメモリ上の因子や事前計算した推薦リストから推薦する。
+同時に届いたリクエストはまとめて1回のrecommendで計算し(マイクロバッチ)、結果はユーザーごとにLRUキャッシュする。
+
+    python -m src.jobs.serve --model popularity=models/popularity \
+        --model nmf=models/nmf --port 5000
+
+    GET /recommend?user_id=1&k=10&model=nmf
+    GET /stats
+"""
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from loguru import logger
+
+from src.models.artifact import read_model_name
+from src.models.base_recommender import BaseRecommender
+from src.models.registry import get_model_class
+
+
+class LRUCache:
+    """スレッドセーフなLRUキャッシュ"""
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class LatencyStats:
+    """直近のリクエストのレイテンシを保持し、パーセンタイルを計算する"""
+
+    def __init__(self, window: int = 10_000):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self.count += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = np.array(self._latencies)
+        if len(latencies) == 0:
+            return {"count": self.count}
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        return {
+            "count": self.count,
+            "p50_ms": round(float(p50), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(latencies.max() * 1000), 3),
+        }
+
+
+class MicroBatcher:
+    """同時に届いたリクエストをまとめて、1回のrecommendで計算する
+
+    最初のリクエストが届いてからmax_wait_ms経つか、max_batch_size件集まった時点でまとめて計算する。
+    モデルの呼び出しはこのクラスのスレッドからのみ行うため、モデル側はスレッドセーフでなくてよい。
+    """
+
+    def __init__(
+        self,
+        model: BaseRecommender,
+        max_batch_size: int = 256,
+        max_wait_ms: float = 2.0,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Queue = Queue()
+        self.batch_sizes = deque(maxlen=10_000)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: int, k: int) -> Future:
+        future: Future = Future()
+        self._queue.put((user_id, k, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except Empty:
+                    break
+            self.batch_sizes.append(len(batch))
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[int, int, Future]]) -> None:
+        # 最大のkでまとめて計算し、リクエストごとに先頭k件を返す
+        user_ids = np.unique([user_id for user_id, _, _ in batch])
+        max_k = max(k for _, k, _ in batch)
+        try:
+            user2items = self.model.recommend(user_ids, k=max_k)
+        except Exception as e:
+            logger.exception("failed to recommend")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for user_id, k, future in batch:
+            future.set_result(user2items[user_id][:k])
+
+
+class RecommendService:
+    """読み込んだモデルごとに、事前計算した推薦リスト、キャッシュ、マイクロバッチを束ねる"""
+
+    def __init__(
+        self,
+        models: Dict[str, BaseRecommender],
+        cache_size: int = 100_000,
+        max_batch_size: int = 256,
+        max_wait_ms: float = 2.0,
+        precompute_k: Optional[int] = None,
+        timeout_sec: float = 10.0,
+    ):
+        self.models = models
+        self.default_model = next(iter(models))
+        self.timeout_sec = timeout_sec
+        self.caches = {name: LRUCache(cache_size) for name in models}
+        self.batchers = {
+            name: MicroBatcher(model, max_batch_size, max_wait_ms)
+            for name, model in models.items()
+        }
+        self.latency = LatencyStats()
+
+        # 学習データの全ユーザーの推薦リストを事前に計算しておく
+        self.precompute_k = precompute_k
+        self.precomputed: Dict[str, Dict[int, List[int]]] = {}
+        if precompute_k is not None:
+            for name, model in models.items():
+                start = time.perf_counter()
+                self.precomputed[name] = model.recommend(
+                    model.interaction_matrix.user_ids, k=precompute_k
+                )
+                logger.info(
+                    f"precomputed {name} in {time.perf_counter() - start:.2f} sec"
+                )
+
+    def recommend(self, user_id: int, k: int = 10, model: Optional[str] = None):
+        """1ユーザーにk本推薦する
+
+        Args:
+            user_id (int): ユーザーID
+            k (int): 推薦する映画の数
+            model (Optional[str]): モデル名。Noneの場合は最初に読み込んだモデル
+
+        Returns:
+            List[int]: おすすめの映画IDのリスト
+        """
+        model = model or self.default_model
+        if model not in self.models:
+            raise KeyError(model)
+
+        precomputed = self.precomputed.get(model)
+        if precomputed is not None and k <= self.precompute_k:
+            items = precomputed.get(user_id)
+            if items is not None:
+                return items[:k]
+
+        cache = self.caches[model]
+        items = cache.get((user_id, k))
+        if items is None:
+            items = self.batchers[model].submit(user_id, k).result(self.timeout_sec)
+            cache.put((user_id, k), items)
+        return items
+
+    def stats(self) -> Dict:
+        return {
+            "latency": self.latency.summary(),
+            "models": {
+                name: {
+                    "cache_size": len(self.caches[name]),
+                    "cache_hits": self.caches[name].hits,
+                    "cache_misses": self.caches[name].misses,
+                    "mean_batch_size": round(
+                        float(np.mean(self.batchers[name].batch_sizes or [0])), 2
+                    ),
+                    "precomputed_users": len(self.precomputed.get(name, {})),
+                }
+                for name in self.models
+            },
+        }
+
+
+def load_models(model_paths: Dict[str, str]) -> Dict[str, BaseRecommender]:
+    """成果物のディレクトリからモデルを読み込む
+
+    Args:
+        model_paths (Dict[str, str]): キーはモデル名で、値は成果物のディレクトリ
+
+    Returns:
+        Dict[str, BaseRecommender]: キーはモデル名で、値は学習済みのモデル
+    """
+    models = {}
+    for name, path in model_paths.items():
+        model_class = get_model_class(read_model_name(path))
+        models[name] = model_class.load(path)
+        logger.info(f"loaded {model_class.__name__} from {path} as {name}")
+    return models
+
+
+def make_handler(service: RecommendService):
+    class RecommendHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            if url.path == "/recommend":
+                self._recommend(parse_qs(url.query))
+                service.latency.add(time.perf_counter() - start)
+            elif url.path == "/stats":
+                self._send(200, service.stats())
+            elif url.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": f"not found: {url.path}"})
+
+        def _recommend(self, query: Dict[str, List[str]]) -> None:
+            try:
+                user_id = int(query["user_id"][0])
+                k = int(query.get("k", ["10"])[0])
+                if k <= 0:
+                    raise ValueError("k must be positive")
+            except (KeyError, ValueError) as e:
+                self._send(400, {"error": f"invalid query: {e}"})
+                return
+            model = query.get("model", [None])[0]
+            if model is not None and model not in service.models:
+                self._send(404, {"error": f"unknown model: {model}"})
+                return
+
+            try:
+                items = service.recommend(user_id, k=k, model=model)
+            except Exception as e:
+                self._send(500, {"error": repr(e)})
+                return
+            self._send(
+                200,
+                {
+                    "user_id": user_id,
+                    "model": model or service.default_model,
+                    "items": [int(movie_id) for movie_id in items],
+                },
+            )
+
+        def _send(self, status: int, body: Dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # リクエストごとのアクセスログはレイテンシに影響するため出力しない
+            pass
+
+    return RecommendHandler
+
+
+class RecommendHTTPServer(ThreadingHTTPServer):
+    # 同時接続が多いと既定のバックログ(5)では接続がSYNの再送待ちになり、レイテンシが秒単位で跳ねる
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def make_server(
+    service: RecommendService, host: str = "0.0.0.0", port: int = 5000
+) -> ThreadingHTTPServer:
+    return RecommendHTTPServer((host, port), make_handler(service))
+
+
+def _parse_model_paths(values: List[str]) -> Dict[str, str]:
+    model_paths = {}
+    for value in values:
+        name, sep, path = value.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--model must be name=path, got {value}")
+        model_paths[name] = path
+    return model_paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--model",
+        action="append",
+        required=True,
+        help="name=path。複数指定でき、最初のモデルがデフォルトになる",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--cache-size", type=int, default=100_000)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--precompute-k", type=int, default=None)
+    args = parser.parse_args()
+
+    service = RecommendService(
+        load_models(_parse_model_paths(args.model)),
+        cache_size=args.cache_size,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        precompute_k=args.precompute_k,
+    )
+    server = make_server(service, args.host, args.port)
+    logger.info(f"serving on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
+import numpy as np
 from loguru import logger
 
 from src.models.base_recommender import BaseRecommender
 from src.models.dataset import Dataset
 from src.models.eval import MetricCaluculator, Metrics
+from src.models.profiler import stage
 from src.models.recommend_result import RecommendResult
 
 
 class Train:
-    def train(self, model: BaseRecommender, movies: Dataset) -> RecommendResult:
+    def train(
+        self, model: BaseRecommender, movies: Dataset, **kwargs
+    ) -> RecommendResult:
         logger.info("start train")
-        recommend_result = model.recommend(movies)
+        with stage(
+            "fit", model=type(model).__name__, rows=len(movies.train), params=kwargs
+        ):
+            model.fit(movies, **kwargs)
+        recommend_result = model.recommend_result(movies)
         return recommend_result
 
     def evaluate(
@@ -19,11 +27,13 @@ class Train:
     ) -> Metrics:
         logger.info("start evaluation")
         metrics = MetricCaluculator().calc(
-            movies.test.rating.tolist(),
-            recommend_result.rating.tolist(),
+            movies.test.rating.to_numpy(),
+            np.asarray(recommend_result.rating),
             movies.test_user2items,
             recommend_result.user2items,
             k=10,
+            ks=[1, 5, 10],
+            num_items=len(movies.interaction_matrix.movie_ids),
         )
 
         return metrics
@@ -32,11 +42,13 @@ class Train:
         self,
         model: BaseRecommender,
         movies: Dataset,
+        **kwargs,
     ) -> Metrics:
         logger.info("start training and evaluation")
         recommend_result = self.train(
             model=model,
             movies=movies,
+            **kwargs,
         )
 
         evaluation = self.evaluate(
@@ -0,0 +1,184 @@
+r"""新しく届いた評価で、学習済みモデルと評価データのキャッシュを差分だけ更新する
+
+評価のイベント(.jsonl、標準入力、またはratings.datと同じ形式のファイル)を読み込み、
+各モデルの成果物をpartial_fitで更新して同じディレクトリに保存し直す。
+最後に評価データのキャッシュに追加し、以降のDataLoaderの読み込みに含める。
+評価データに既にあるイベントは除くため、同じファイルで再実行しても評価を2回反映しない。
+
+    python -m src.jobs.update --data-path data/ml-10m/ml-10M100K \
+        --events new_ratings.jsonl --model models/popularity models/nmf
+    cat new_ratings.jsonl | python -m src.jobs.update --events - \
+        --model models/association
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.dataset import reader
+from src.dataset.cache import ColumnarCache
+from src.dataset.shema import RatingsBaseSchema
+from src.dataset.validation import validate
+from src.jobs.retrieve import DataLoader
+from src.models.artifact import read_model_name
+from src.models.interaction_matrix import latest_rating_mask
+from src.models.registry import get_model_class
+
+
+def update_models(
+    model_paths: List[str], ratings: pd.DataFrame, **kwargs
+) -> Dict[str, float]:
+    """成果物のモデルを新しい評価で更新し、同じディレクトリに保存し直す
+
+    各モデルが既に同じ評価値で持っている組は除き、新しい評価が残らなかった成果物は保存し直さない。
+
+    Args:
+        model_paths (List[str]): 成果物のディレクトリ
+        ratings (pd.DataFrame): 新しい評価データ
+        **kwargs: partial_fitに渡すパラメータ
+
+    Returns:
+        Dict[str, float]: キーは成果物のディレクトリで、値は更新にかかった秒数
+    """
+    # 途中で止まって一部の成果物だけが更新されないように、先に全ての成果物のモデルを確かめる
+    model_classes = {
+        path: get_model_class(read_model_name(path)) for path in model_paths
+    }
+
+    elapsed = {}
+    for path, model_class in model_classes.items():
+        start = time.perf_counter()
+        # 保存し直す際にディレクトリを作り直すため、メモリマップせずに読み込む
+        model = model_class.load(path, mmap=False)
+        # 前回の実行がモデルを保存してからキャッシュに追加する前に止まった場合に、同じ評価を2回反映しないように、
+        # 既に同じ評価値で持っている組は除く
+        stored = model.interaction_matrix.rating_at(
+            ratings.user_id.to_numpy(), ratings.movie_id.to_numpy()
+        )
+        pending = ratings[stored != ratings.rating.to_numpy()]
+        if len(pending) == 0:
+            logger.info(f"{path} already has all the new ratings")
+            continue
+        model.partial_fit(pending, **kwargs)
+        model.save(path)
+        elapsed[path] = time.perf_counter() - start
+        logger.info(
+            f"updated {model_class.__name__} at {path} in {elapsed[path]:.2f} sec"
+        )
+    return elapsed
+
+
+def select_new_ratings(
+    ratings: pd.DataFrame, stored: reader.Columns, movie_ids: np.ndarray
+) -> pd.DataFrame:
+    """新しい評価のうち、まだ評価データにない評価を選ぶ
+
+    映画データにない映画の評価(DataLoaderが読み込まない評価)と、同じユーザー、映画、時刻の評価が
+    既に評価データにある評価を除き、同じユーザーと映画の組の評価は最新の評価だけを残す。
+
+    Args:
+        ratings (pd.DataFrame): 新しい評価データ
+        stored (reader.Columns): 評価データのキャッシュの列
+        movie_ids (np.ndarray): 映画データの映画ID
+
+    Returns:
+        pd.DataFrame: まだ評価データにない新しい評価データ
+    """
+    ratings = ratings[np.isin(ratings.movie_id.to_numpy(), movie_ids)]
+    ratings = ratings[latest_rating_mask(ratings)]
+    # 新しい評価のあったユーザーの評価だけと比べる
+    keys = ["user_id", "movie_id", "timestamp"]
+    related = np.isin(stored["user_id"], ratings.user_id.unique())
+    applied = pd.MultiIndex.from_frame(ratings[keys]).isin(
+        pd.MultiIndex.from_arrays([np.asarray(stored[key])[related] for key in keys])
+    )
+    return ratings[~applied].reset_index(drop=True)
+
+
+def load_ratings_cache(
+    data_path: str, cache_dir: Optional[str] = None
+) -> reader.Columns:
+    """評価データのキャッシュ(追加した評価を含む)を読み込む。キャッシュがない場合は元ファイルから作成する
+
+    Args:
+        data_path (str): ratings.datのあるディレクトリ
+        cache_dir (Optional[str]): キャッシュのディレクトリ。Noneの場合はDataLoaderと同じ場所
+
+    Returns:
+        reader.Columns: 列名と列の値
+    """
+    cache = ColumnarCache(cache_dir or os.path.join(data_path, ".cache"))
+    source_path = os.path.join(data_path, "ratings.dat")
+    return cache.load("ratings", source_path, reader.read_ratings)
+
+
+def append_to_cache(
+    data_path: str, ratings: pd.DataFrame, cache_dir: Optional[str] = None
+) -> None:
+    """新しい評価を評価データのキャッシュに追加する
+
+    Args:
+        data_path (str): ratings.datのあるディレクトリ
+        ratings (pd.DataFrame): 新しい評価データ
+        cache_dir (Optional[str]): キャッシュのディレクトリ。Noneの場合はDataLoaderと同じ場所
+    """
+    cache = ColumnarCache(cache_dir or os.path.join(data_path, ".cache"))
+    source_path = os.path.join(data_path, "ratings.dat")
+    # キャッシュがない場合は、先に元ファイルから作成する
+    cache.load("ratings", source_path, reader.read_ratings)
+    cache.append(
+        "ratings",
+        source_path,
+        {col: ratings[col].to_numpy() for col in reader.RATING_COLUMNS},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-path", default="data/ml-10m/ml-10M100K")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument(
+        "--events",
+        required=True,
+        help="新しい評価のファイル(.jsonlまたはratings.datと同じ形式)。-の場合は標準入力のJSONL",
+    )
+    parser.add_argument("--model", nargs="*", default=[], help="更新する成果物のディレクトリ")
+    parser.add_argument(
+        "--refit",
+        action="store_true",
+        help=(
+            "NMFRecommenderとALSRecommenderの因子を更新した因子を初期値にして学習し直し、"
+            "AssociationRecommenderの頻出アイテム集合を求め直す"
+        ),
+    )
+    parser.add_argument("--skip-cache", action="store_true")
+    args = parser.parse_args()
+
+    columns = reader.read_rating_events(args.events)
+    ratings = validate(pd.DataFrame(columns), RatingsBaseSchema, mode="full")
+    logger.info(f"read {len(ratings)} new ratings from {args.events}")
+
+    # 新しい映画をジャンルのランキングや近傍に加えるため、映画の特徴を読み込む
+    item_features = DataLoader(
+        data_path=args.data_path, cache_dir=args.cache_dir
+    ).load_item_features()
+    ratings = select_new_ratings(
+        ratings,
+        load_ratings_cache(args.data_path, cache_dir=args.cache_dir),
+        item_features.movie_ids,
+    )
+    logger.info(f"{len(ratings)} ratings are not in the ratings data yet")
+    if len(ratings) == 0:
+        return
+
+    update_models(args.model, ratings, refit=args.refit, item_features=item_features)
+    if not args.skip_cache:
+        append_to_cache(args.data_path, ratings, cache_dir=args.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
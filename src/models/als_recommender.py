@@ -0,0 +1,277 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.dataset import Dataset
+from src.models.factor_recommender import FactorRecommender
+
+
+class ALSRecommender(FactorRecommender):
+    def fit(self, dataset: Dataset, **kwargs) -> "ALSRecommender":
+        """暗黙的フィードバックの交互最小二乗法(implicit ALS)でユーザーと映画の因子を学習する
+
+        評価した映画を選好1、評価していない映画を選好0とし、評価値が高いほど大きな確信度
+        1 + alpha * 評価値 で重み付けした二乗誤差を最小化する。欠損値を評価値0とはみなさず、
+        ユーザー×映画の疎行列のまま学習する。
+        ユーザーと映画の因子を交互に、共役勾配法を数ステップ進めて更新する。
+        ブロックごとの更新は独立しているため、num_threads個のスレッドで並列に計算する。
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            ALSRecommender: 学習済みのモデル
+        """
+        factors = kwargs.get("factors", 10)
+        # ユーザーと映画の因子を交互に更新する回数
+        iterations = kwargs.get("iterations", 15)
+        # 因子のL2正則化の強さ
+        regularization = kwargs.get("regularization", 0.1)
+        # 評価値を確信度に変換する係数
+        alpha = kwargs.get("alpha", 1.0)
+        # 因子を1回更新するごとに進める共役勾配法のステップ数
+        cg_steps = kwargs.get("cg_steps", 3)
+        # 因子を更新するスレッド数と、一度に更新するユーザー(映画)の数
+        num_threads = kwargs.get("num_threads", os.cpu_count() or 1)
+        block_size = kwargs.get("block_size", 4096)
+        seed = kwargs.get("seed", 0)
+        # 予測評価値をユーザーのブロックごとに計算する際に使うメモリの上限(MB)
+        memory_budget_mb = kwargs.get("memory_budget_mb", 256)
+        # 映画の埋め込みの近傍探索インデックスの種類(flat, ivf, hnsw)
+        index_type = kwargs.get("index_type", "flat")
+        # 指定した場合は、近傍探索で取得した候補の中から推薦する。Noneの場合は全映画から推薦する
+        num_candidates = kwargs.get("num_candidates")
+        self.params = {
+            "factors": factors,
+            "iterations": iterations,
+            "regularization": regularization,
+            "alpha": alpha,
+            "cg_steps": cg_steps,
+            "num_threads": num_threads,
+            "block_size": block_size,
+            "seed": seed,
+            "memory_budget_mb": memory_budget_mb,
+            "index_type": index_type,
+            "num_candidates": num_candidates,
+        }
+
+        self.interaction_matrix = dataset.interaction_matrix
+        rating = self.interaction_matrix.rating
+        # 確信度から1を引いた値(alpha * 評価値)の行列
+        confidence = sparse.csr_matrix(rating * alpha, dtype=np.float32)
+
+        rng = np.random.default_rng(seed)
+        num_users, num_movies = rating.shape
+        self.user_factors = (rng.standard_normal((num_users, factors)) * 0.01).astype(
+            np.float32
+        )
+        self.item_factors = (rng.standard_normal((num_movies, factors)) * 0.01).astype(
+            np.float32
+        )
+        self._alternate(confidence, iterations)
+
+        # 他の因子モデルと同じく、全体の平均評価値も成果物に含める
+        self.average_score = self.interaction_matrix.average_score
+        self._build_item_index()
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "ALSRecommender":
+        """新しい評価の分だけ因子を更新する
+
+        既定では映画の因子を固定したまま、新しい評価のあったユーザーの因子だけを解き直し(fold-in)、
+        新しい映画の因子はユーザーの因子を固定して解く。refit=Trueの場合は、更新した因子を初期値にして
+        ユーザーと映画の因子をiterations回交互に更新し直す(warm start)。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            ALSRecommender: 更新したモデル
+        """
+        # 全体を交互に更新し直すかどうか
+        refit = kwargs.get("refit", False)
+
+        old_matrix = self.interaction_matrix
+        ratings, _ = self._append_ratings(ratings)
+        rating = self.interaction_matrix.rating
+        confidence = sparse.csr_matrix(rating * self.params["alpha"], dtype=np.float32)
+
+        # 既存の因子を、新しいユーザーと映画の並びでの位置に移す
+        user_factors = np.zeros((rating.shape[0], self.params["factors"]), np.float32)
+        user_factors[
+            self.interaction_matrix.user_index(old_matrix.user_ids)
+        ] = self.user_factors
+        item_factors = np.zeros((rating.shape[1], self.params["factors"]), np.float32)
+        item_factors[
+            self.interaction_matrix.movie_index(old_matrix.movie_ids)
+        ] = self.item_factors
+
+        # 新しい評価のあったユーザーの因子を、映画の因子を固定して解き直す
+        user_index = self.interaction_matrix.user_index(
+            np.unique(ratings.user_id.to_numpy())
+        )
+        user_factors[user_index] = self._fold_in(
+            confidence[user_index], user_factors[user_index], item_factors
+        )
+        # 新しい映画の因子を、ユーザーの因子を固定して解く
+        new_movies = np.flatnonzero(
+            ~np.isin(self.interaction_matrix.movie_ids, old_matrix.movie_ids)
+        )
+        if len(new_movies) > 0:
+            item_factors[new_movies] = self._fold_in(
+                sparse.csr_matrix(confidence[:, new_movies].T),
+                item_factors[new_movies],
+                user_factors,
+            )
+
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        if refit:
+            self._alternate(confidence, self.params["iterations"])
+        self.average_score = self.interaction_matrix.average_score
+        if refit or len(new_movies) > 0:
+            self._build_item_index()
+        return self
+
+    def _alternate(self, confidence: sparse.csr_matrix, iterations: int) -> None:
+        """ユーザーと映画の因子を、もう一方を固定してiterations回交互に更新する"""
+        # 映画×ユーザーの確信度の行列
+        confidence_t = sparse.csr_matrix(confidence.T, dtype=np.float32)
+        for _ in range(iterations):
+            for matrix, factors, fixed_factors in [
+                (confidence, self.user_factors, self.item_factors),
+                (confidence_t, self.item_factors, self.user_factors),
+            ]:
+                _update_factors(
+                    matrix,
+                    factors,
+                    fixed_factors,
+                    self.params["regularization"],
+                    self.params["cg_steps"],
+                    self.params["block_size"],
+                    self.params["num_threads"],
+                )
+
+    def _fold_in(
+        self,
+        confidence: sparse.csr_matrix,
+        factors: np.ndarray,
+        fixed_factors: np.ndarray,
+    ) -> np.ndarray:
+        """もう一方の因子を固定し、confidenceの各行の因子を解く"""
+        # 1行の連立方程式は因子数の次元のため、共役勾配法を因子数のステップ進めれば解ける
+        factors = factors.copy()
+        _update_factors(
+            confidence,
+            factors,
+            fixed_factors,
+            self.params["regularization"],
+            max(self.params["cg_steps"], self.params["factors"]),
+            self.params["block_size"],
+            self.params["num_threads"],
+        )
+        return factors
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # 内積は選好の強さで評価値の尺度ではないため、ユーザーの平均評価値を予測値とする
+        return self._predict_user_average(user_ids)
+
+
+def _update_factors(
+    confidence: sparse.csr_matrix,
+    factors: np.ndarray,
+    fixed_factors: np.ndarray,
+    regularization: float,
+    cg_steps: int,
+    block_size: int,
+    num_threads: int,
+) -> None:
+    """もう一方の因子を固定し、各行の因子を共役勾配法で更新する(factorsを書き換える)
+
+    行uの因子xは (Y^T Y + Y^T (C_u - I) Y + λI) x = Y^T C_u p_u の解で、
+    Y^T Yは全ての行で共通のため一度だけ計算する。ブロックごとの計算は独立しているため、
+    num_threads個のスレッドで並列に計算する(疎行列の積と行列積はGILを解放する)。
+
+    Args:
+        confidence (sparse.csr_matrix): 行×列の、確信度から1を引いた値の行列
+        factors (np.ndarray): 行×因子数の更新する因子
+        fixed_factors (np.ndarray): 列×因子数の固定する因子
+        regularization (float): L2正則化の強さ
+        cg_steps (int): 共役勾配法のステップ数
+        block_size (int): 一度に更新する行数
+        num_threads (int): 並列に計算するスレッド数
+    """
+    gram = fixed_factors.T @ fixed_factors + regularization * np.eye(
+        factors.shape[1], dtype=np.float32
+    )
+
+    def run(start: int) -> None:
+        stop = min(start + block_size, factors.shape[0])
+        factors[start:stop] = _conjugate_gradient(
+            confidence[start:stop], factors[start:stop], fixed_factors, gram, cg_steps
+        )
+
+    starts = range(0, factors.shape[0], block_size)
+    if num_threads > 1:
+        with ThreadPoolExecutor(num_threads) as executor:
+            list(executor.map(run, starts))
+    else:
+        for start in starts:
+            run(start)
+
+
+def _conjugate_gradient(
+    confidence: sparse.csr_matrix,
+    x: np.ndarray,
+    fixed_factors: np.ndarray,
+    gram: np.ndarray,
+    cg_steps: int,
+) -> np.ndarray:
+    """ブロック内の全ての行の連立方程式を、現在の因子xを初期値としてまとめて共役勾配法で解く"""
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    gathered = fixed_factors[confidence.indices]
+
+    def apply(p: np.ndarray) -> np.ndarray:
+        # (Y^T Y + λI) p に、評価した列についての (c - 1) (y・p) y の和を足す
+        weights = confidence.data * np.einsum("ij,ij->i", gathered, p[rows])
+        weighted = sparse.csr_matrix(
+            (weights, confidence.indices, confidence.indptr), shape=confidence.shape
+        )
+        return p @ gram + weighted @ fixed_factors
+
+    # 右辺は評価した列についての c y の和
+    rhs = (
+        sparse.csr_matrix(
+            (confidence.data + 1, confidence.indices, confidence.indptr),
+            shape=confidence.shape,
+        )
+        @ fixed_factors
+    )
+    x = x.copy()
+    residual = rhs - apply(x)
+    direction = residual.copy()
+    residual_norm = np.einsum("ij,ij->i", residual, residual)
+    for _ in range(cg_steps):
+        applied = apply(direction)
+        denominator = np.einsum("ij,ij->i", direction, applied)
+        step = np.divide(
+            residual_norm,
+            denominator,
+            out=np.zeros_like(residual_norm),
+            where=denominator > 0,
+        )
+        x += step[:, None] * direction
+        residual -= step[:, None] * applied
+        new_norm = np.einsum("ij,ij->i", residual, residual)
+        ratio = np.divide(
+            new_norm,
+            residual_norm,
+            out=np.zeros_like(new_norm),
+            where=residual_norm > 0,
+        )
+        direction = residual + ratio[:, None] * direction
+        residual_norm = new_norm
+    return x
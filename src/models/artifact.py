@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+# 保存形式を変更した場合はインクリメントし、古い成果物を読み込まないようにする
+ARTIFACT_VERSION = 5
+
+
+def save_artifact(
+    path: str, model_name: str, params: Dict[str, Any], arrays: Dict[str, np.ndarray]
+) -> None:
+    """学習済みモデルの成果物をディレクトリに保存する
+
+    配列は1つずつ.npyとして保存し、読み込み時にメモリマップで開けるようにする。
+    保存途中の成果物が読まれないように、隣の一時ディレクトリに書き込んでから置き換える。
+    成果物でない(meta.jsonのない)空でないディレクトリは、誤って消さないように上書きしない。
+
+    Args:
+        path (str): 保存先のディレクトリ
+        model_name (str): モデル名
+        params (Dict[str, Any]): ハイパーパラメータ(JSONに変換できる値)
+        arrays (Dict[str, np.ndarray]): 配列名と配列
+    """
+    path = os.path.normpath(path)
+    if os.path.exists(path) and not _is_replaceable(path):
+        raise ValueError(
+            f"{path} exists and is not a model artifact, refusing to overwrite it"
+        )
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "model": model_name,
+            "params": params,
+            "arrays": sorted(arrays),
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # 空でないディレクトリには置き換えられないため、前の成果物を退避してから置き換えて消す
+    # 前の成果物をメモリマップで開いているプロセスは、消した後もそのまま読める
+    old_path = f"{path}.old{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _is_replaceable(path: str) -> bool:
+    """保存先が、上書きしてよい成果物のディレクトリか空のディレクトリかどうか"""
+    if not os.path.isdir(path):
+        return False
+    return os.path.exists(os.path.join(path, "meta.json")) or not os.listdir(path)
+
+
+def artifact_fingerprint(path: str) -> Dict[str, Any]:
+    """成果物が保存し直されたかを見分けるための、保存形式のバージョンと各ファイルの大きさと更新時刻
+
+    配列の内容をハッシュにすると大きな成果物では時間がかかるため、ファイルの大きさと更新時刻で見分ける。
+    保存し直す場合はディレクトリごと書き直すため、内容が同じでも更新時刻が変わる。
+
+    Args:
+        path (str): 保存先のディレクトリ
+
+    Returns:
+        Dict[str, Any]: 保存形式のバージョンと、ディレクトリからの相対パスごとの[大きさ, 更新時刻(ns)]
+    """
+    files = {}
+    for directory, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(directory, name)
+            stat = os.stat(file_path)
+            files[os.path.relpath(file_path, path)] = [stat.st_size, stat.st_mtime_ns]
+    return {"version": ARTIFACT_VERSION, "files": dict(sorted(files.items()))}
+
+
+def read_model_name(path: str) -> str:
+    """保存した成果物のモデル名を読み込む
+
+    Args:
+        path (str): 保存先のディレクトリ
+
+    Returns:
+        str: モデル名
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)["model"]
+
+
+def load_artifact(
+    path: str, model_name: str, mmap: bool = True
+) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """保存した成果物を読み込む
+
+    Args:
+        path (str): 保存先のディレクトリ
+        model_name (str): モデル名。保存時のモデル名と一致しない場合はエラーとする
+        mmap (bool): 配列をメモリマップで読み込むかどうか
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, np.ndarray]]: ハイパーパラメータと、配列名と配列
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["version"] != ARTIFACT_VERSION:
+        raise ValueError(
+            f"artifact version {meta['version']} is not supported "
+            f"(expected {ARTIFACT_VERSION})"
+        )
+    if meta["model"] != model_name:
+        raise ValueError(f"{path} is a {meta['model']} artifact, not {model_name}")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in meta["arrays"]
+    }
+    return meta["params"], arrays
@@ -1,57 +1,353 @@
-from collections import Counter, defaultdict
+from typing import Dict, List
 
-from mlxtend.frequent_patterns import apriori, association_rules
+import numpy as np
+import pandas as pd
+from scipy import sparse
 
-from src.models.dataset import Dataset
 from src.models.base_recommender import BaseRecommender
-from src.models.recommend_result import RecommendResult
-from loguru import logger
+from src.models.dataset import Dataset
+from src.models.frequent_itemsets import association_rules, frequent_itemsets
+from src.models.top_k import latest_per_row, to_user2items, top_k_unseen
+
+# recommendで一度に候補を展開するユーザー数
+RECOMMEND_BLOCK_SIZE = 4096
+# ユーザーごとに保持する、直近に高評価した映画の数
+RECENT_SIZE = 5
+
 
 class AssociationRecommender(BaseRecommender):
-    def recommend(self, dataset: Dataset, **kwargs) -> RecommendResult:
+    def fit(self, dataset: Dataset, **kwargs) -> "AssociationRecommender":
+        """アソシエーションルールを計算し、各ユーザーが直近に高評価した映画と合わせて保持する
+
+        ルールは条件部と帰結部の映画IDを、ルールごとの区切り位置(indptr)と映画IDの配列で保持する。
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            AssociationRecommender: 学習済みのモデル
+        """
         # 評価数の閾値
         min_support = kwargs.get("min_support", 0.1)
         min_threshold = kwargs.get("min_threshold", 1)
+        # 頻出アイテム集合の最大の長さ。Noneの場合は制限しない
+        max_len = kwargs.get("max_len")
+        # partial_fitで、頻出アイテム集合を求めてから高評価が変わったユーザーの割合がこの値を超えたら求め直す
+        max_drift = kwargs.get("max_drift", 0.05)
+        self.params = {
+            "min_support": min_support,
+            "min_threshold": min_threshold,
+            "max_len": max_len,
+            "max_drift": max_drift,
+        }
+        self.interaction_matrix = dataset.interaction_matrix
+        self._find_itemsets()
+
+        # 学習用データで評価値が4以上のものだけ取得し、ユーザーが直近評価した５つの映画を保持する
+        # 履歴はユーザーごとに時刻の順に並んでいるため、ソートせずに末尾から選ぶ
+        # (履歴のユーザーは疎行列の行と同じ並び)
+        history = dataset.user_history
+        self.recent_indptr, recent = history.latest(
+            RECENT_SIZE,
+            history.ratings >= self.interaction_matrix.high_rating_threshold,
+        )
+        self.recent_movie_ids = history.movie_ids[recent]
+        self.recent_timestamps = history.timestamps[recent]
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "AssociationRecommender":
+        """新しい評価の分だけ、頻出アイテム集合の支持度と直近に高評価した映画を更新する
+
+        支持度を数え直すのは、頻出アイテム集合を求めた時点で頻出だったアイテム集合だけで、
+        新しい評価で初めて頻出になるアイテム集合はルールに加わらない。
+        そのため、頻出アイテム集合を求めてから高評価が変わったユーザーと新しいユーザーの割合が
+        max_driftを超えた場合、またはrefit=Trueの場合は、全ての評価から頻出アイテム集合を求め直す。
+        評価し直して高評価でなくなった映画は直近の高評価から除き、保持していない古い高評価では補わない。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            AssociationRecommender: 更新したモデル
+        """
+        # 割合によらず頻出アイテム集合を求め直すかどうか
+        refit = kwargs.get("refit", False)
+
+        old_matrix = self.interaction_matrix
+        ratings, previous = self._append_ratings(ratings)
+        threshold = old_matrix.high_rating_threshold
+        is_high = ratings.rating.to_numpy() >= threshold
+        high_rating = ratings[is_high]
+
+        # 高評価が増えた(評価し直して高評価でなくなった)ユーザーだけ、含むアイテム集合が変わるため、
+        # そのユーザーの分だけ数え直す
+        user_ids = np.unique(
+            ratings.user_id.to_numpy()[is_high != (previous >= threshold)]
+        )
+        # 頻出アイテム集合を求めた時点から変わったトランザクション(高評価が変わったユーザーと新しいユーザー)を数える
+        new_user_ids = np.setdiff1d(ratings.user_id.to_numpy(), old_matrix.user_ids)
+        self.num_updated_transactions = int(self.num_updated_transactions) + len(
+            np.union1d(user_ids, new_user_ids)
+        )
+        drift = self.num_updated_transactions / self.interaction_matrix.shape[0]
+        if refit or drift > self.params["max_drift"]:
+            self._find_itemsets()
+        else:
+            self.itemset_count = (
+                self.itemset_count
+                + self._count_itemsets(self.interaction_matrix, user_ids)
+                - self._count_itemsets(old_matrix, user_ids)
+            )
+            self.num_transactions = self.interaction_matrix.shape[0]
+            self._build_rules()
+
+        # 保持している直近の高評価に新しい高評価を加え、ユーザーごとに直近の5つを選び直す
+        # 評価し直した組は、保持している高評価から除いてから新しい評価で加え直す
+        recent_user_ids = np.repeat(old_matrix.user_ids, np.diff(self.recent_indptr))
+        num_movies = len(self.interaction_matrix.movie_ids)
+        kept = ~np.isin(
+            self.interaction_matrix.user_index(recent_user_ids) * num_movies
+            + self.interaction_matrix.movie_index(self.recent_movie_ids),
+            self.interaction_matrix.user_index(ratings.user_id.to_numpy()) * num_movies
+            + self.interaction_matrix.movie_index(ratings.movie_id.to_numpy()),
+        )
+        self._set_recent(
+            np.concatenate([recent_user_ids[kept], high_rating.user_id.to_numpy()]),
+            np.concatenate(
+                [self.recent_movie_ids[kept], high_rating.movie_id.to_numpy()]
+            ).astype(self.recent_movie_ids.dtype),
+            np.concatenate(
+                [self.recent_timestamps[kept], high_rating.timestamp.to_numpy()]
+            ).astype(self.recent_timestamps.dtype),
+        )
+        return self
+
+    def _find_itemsets(self) -> None:
+        """全ての評価から頻出アイテム集合を求め、アソシエーションルールを作る"""
+        # 4以上の評価値は1, 4未満の評価値と欠損値は0にした疎行列から、支持度が高い映画の組を求める
+        freq_movies = frequent_itemsets(
+            self.interaction_matrix.binarized,
+            min_support=self.params["min_support"],
+            max_len=self.params["max_len"],
+            item_names=self.interaction_matrix.movie_ids,
+        )
+        # 頻出アイテム集合ごとに、含むユーザー数(支持度の分子)を保持し、新しい評価の分だけ更新できるようにする
+        self.num_transactions = self.interaction_matrix.shape[0]
+        self.itemset_indptr, self.itemset_movie_ids = _flatten(freq_movies.itemsets)
+        self.itemset_count = np.rint(
+            freq_movies.support.to_numpy() * self.num_transactions
+        ).astype(np.int64)
+        # 頻出アイテム集合を求めてから、高評価が増えたユーザーと新しいユーザーの数
+        self.num_updated_transactions = 0
+        self._build_rules()
+
+    def _build_rules(self) -> None:
+        """頻出アイテム集合の支持度から、アソシエーションルールとその転置インデックスを作る"""
+        support = self.itemset_count / int(self.num_transactions)
+        frequent = np.flatnonzero(support >= self.params["min_support"])
+        freq_movies = pd.DataFrame(
+            {
+                "support": support[frequent],
+                "itemsets": [
+                    frozenset(
+                        self.itemset_movie_ids[
+                            self.itemset_indptr[i] : self.itemset_indptr[i + 1]
+                        ].tolist()
+                    )
+                    for i in frequent
+                ],
+            },
+            columns=["support", "itemsets"],
+        )
+        # アソシエーションルールの計算（リフト値の高い順に並べておく）
+        rules = association_rules(
+            freq_movies, metric="lift", min_threshold=self.params["min_threshold"]
+        ).sort_values("lift", ascending=False, kind="stable")
+
+        self.antecedent_indptr, self.antecedent_movie_ids = _flatten(rules.antecedents)
+        self.consequent_indptr, self.consequent_movie_ids = _flatten(rules.consequents)
+        self.lift = rules.lift.to_numpy(dtype=np.float64)
+        # 映画のインデックスから、その映画を条件部に含むルール(リフト値の高い順)を引く転置インデックス
+        self.antecedent_rule_indptr, self.antecedent_rule_ids = _invert(
+            self.antecedent_indptr,
+            self.interaction_matrix.movie_index(self.antecedent_movie_ids),
+            len(self.interaction_matrix.movie_ids),
+        )
+
+    def _set_recent(
+        self, user_ids: np.ndarray, movie_ids: np.ndarray, timestamps: np.ndarray
+    ) -> None:
+        """高評価の中から、ユーザーごとに評価時刻の新しい5つの映画を選んで保持する
+
+        同じ時刻の評価は、後に並んでいるものを新しいとみなす。
+        """
+        self.recent_indptr, recent = latest_per_row(
+            self.interaction_matrix.user_index(user_ids),
+            timestamps,
+            len(self.interaction_matrix.user_ids),
+            RECENT_SIZE,
+        )
+        self.recent_movie_ids = movie_ids[recent]
+        self.recent_timestamps = timestamps[recent]
+
+    def _count_itemsets(self, matrix, user_ids: np.ndarray) -> np.ndarray:
+        """指定したユーザーのうち、頻出アイテム集合ごとにそれを全て高評価したユーザー数を数える"""
+        user_index = matrix.user_index(user_ids)
+        rows = matrix.binarized[user_index[user_index >= 0]]
+        num_itemsets = len(self.itemset_indptr) - 1
+        lengths = np.diff(self.itemset_indptr)
+        # 映画×アイテム集合の0/1の行列との積で、アイテム集合ごとに高評価した映画の数を数える
+        membership = sparse.csr_matrix(
+            (
+                np.ones(len(self.itemset_movie_ids), dtype=np.float32),
+                (
+                    matrix.movie_index(self.itemset_movie_ids),
+                    np.repeat(np.arange(num_itemsets), lengths),
+                ),
+            ),
+            shape=(len(matrix.movie_ids), num_itemsets),
+        )
+        matched = (rows @ membership).tocsr()
+        contained = matched.data == lengths[matched.indices]
+        return np.bincount(matched.indices[contained], minlength=num_itemsets)
+
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
+        # アソシエーションルールを使って、各ユーザーにまだ評価していない映画をk本推薦する
+        # ユーザーごとの推薦候補の並び順をスコアとして疎行列に格納する
+        user_ids = np.asarray(user_ids)
+        user_index = self.interaction_matrix.user_index(user_ids)
+        score_rows, score_cols, score_values = [], [], []
+
+        # ルールがない場合は推薦できない
+        target_user_index = (
+            np.unique(user_index[user_index >= 0])
+            if len(self.lift) > 0
+            else np.array([], dtype=np.int64)
+        )
+        # 一致したルールの帰結部を全ユーザー分まとめて展開するため、メモリを抑えるようにユーザーのブロックごとに計算する
+        for start in range(0, len(target_user_index), RECOMMEND_BLOCK_SIZE):
+            rows, cols, values = self._score_block(
+                target_user_index[start : start + RECOMMEND_BLOCK_SIZE]
+            )
+            score_rows.append(rows)
+            score_cols.append(cols)
+            score_values.append(values)
+
+        # ユーザーがまだ評価していない映画の中から、スコアの高い順にk本を推薦リストとする
+        score_matrix = sparse.csr_matrix(
+            (
+                np.concatenate(score_values or [[]]),
+                (
+                    np.concatenate(score_rows or [[]]).astype(np.int64),
+                    np.concatenate(score_cols or [[]]).astype(np.int64),
+                ),
+            ),
+            shape=self.interaction_matrix.shape,
+        )
+        top_items = top_k_unseen(
+            score_matrix, self.interaction_matrix.rating, k=k, user_index=user_index
+        )
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
+
+    def _score_block(self, user_index: np.ndarray):
+        """ユーザーごとに一致したルールの帰結部の映画に、推薦する順番のスコアを付ける
+
+        Args:
+            user_index (np.ndarray): 昇順のユーザーのインデックス
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: ユーザーのインデックス、映画のインデックス、スコア
+        """
+        num_rules = len(self.lift)
+        num_movies = len(self.interaction_matrix.movie_ids)
+
+        # ユーザーが直近に高評価した５つの映画
+        recent_user = np.repeat(user_index, np.diff(self.recent_indptr)[user_index])
+        recent_movie = self.interaction_matrix.movie_index(
+            _gather(self.recent_indptr, self.recent_movie_ids, user_index)
+        )
+        # 転置インデックスから、それらの映画を条件部に含むルールだけを取り出す
+        # 複数の映画が同じルールに一致した場合は1回だけ数え、(ユーザー, リフト値の順)に並べる
+        matched_user = np.repeat(
+            recent_user, np.diff(self.antecedent_rule_indptr)[recent_movie]
+        )
+        matched_rule = _gather(
+            self.antecedent_rule_indptr, self.antecedent_rule_ids, recent_movie
+        )
+        matched_user, matched_rule = np.divmod(
+            np.unique(matched_user * num_rules + matched_rule), num_rules
+        )
+
+        # アソシエーションルールの帰結部の映画を(ユーザーごとにリフト値の高い順に)並べ、
+        # 登場頻度の高い順、同じ頻度なら先に登場した順に大きなスコアを付ける
+        candidate_user = np.repeat(
+            matched_user, np.diff(self.consequent_indptr)[matched_rule]
+        )
+        candidate_movie = self.interaction_matrix.movie_index(
+            _gather(self.consequent_indptr, self.consequent_movie_ids, matched_rule)
+        )
+        keys, first_index, counts = np.unique(
+            candidate_user * num_movies + candidate_movie,
+            return_index=True,
+            return_counts=True,
+        )
+        rows, cols = np.divmod(keys, num_movies)
+        order = np.lexsort((first_index, -counts, rows))
+        return rows[order], cols[order], np.arange(len(order), 0, -1)
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # アソシエーションルールでは評価値の予測は難しいため、ユーザーの平均評価値を予測値とする
+        return self._predict_user_average(user_ids)
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "antecedent_indptr": self.antecedent_indptr,
+            "antecedent_movie_ids": self.antecedent_movie_ids,
+            "consequent_indptr": self.consequent_indptr,
+            "consequent_movie_ids": self.consequent_movie_ids,
+            "lift": self.lift,
+            "antecedent_rule_indptr": self.antecedent_rule_indptr,
+            "antecedent_rule_ids": self.antecedent_rule_ids,
+            "recent_indptr": self.recent_indptr,
+            "recent_movie_ids": self.recent_movie_ids,
+            "recent_timestamps": self.recent_timestamps,
+            "itemset_indptr": self.itemset_indptr,
+            "itemset_movie_ids": self.itemset_movie_ids,
+            "itemset_count": self.itemset_count,
+            "num_transactions": np.array(self.num_transactions),
+            "num_updated_transactions": np.array(self.num_updated_transactions),
+        }
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        for name, array in arrays.items():
+            if not name.startswith("interaction_"):
+                setattr(self, name, array)
+
+
+def _gather(indptr: np.ndarray, values: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """区切り位置(indptr)で分けた配列から、指定した行の値を順に連結して取り出す"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[offsets + np.arange(lengths.sum())]
+
+
+def _invert(indptr: np.ndarray, values: np.ndarray, num_values: int):
+    """区切り位置(indptr)で分けた配列を、値ごとに含まれる行番号の昇順の配列に変換する"""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(values, kind="stable")
+    inverted_indptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(values, minlength=num_values))]
+    ).astype(np.int64)
+    return inverted_indptr, rows[order].astype(np.int64)
+
 
-        # ユーザー×映画の行列形式に変更
-        user_movie_matrix = dataset.train.pivot(index="user_id", columns="movie_id", values="rating")
-
-        # ライブラリ使用のために、4以上の評価値は1, 4未満の評価値と欠損値は0にする
-        user_movie_matrix[user_movie_matrix < 4] = 0
-        user_movie_matrix[user_movie_matrix.isnull()] = 0
-        user_movie_matrix[user_movie_matrix >= 4] = 1
-
-        # 支持度が高い映画
-        freq_movies = apriori(user_movie_matrix, min_support=min_support, use_colnames=True)
-        # アソシエーションルールの計算（リフト値の高い順に表示）
-        rules = association_rules(freq_movies, metric="lift", min_threshold=min_threshold)
-
-        # アソシエーションルールを使って、各ユーザーにまだ評価していない映画を１０本推薦する
-        pred_user2items = defaultdict(list)
-        user_evaluated_movies = dataset.train.groupby("user_id").agg({"movie_id": list})["movie_id"].to_dict()
-
-        # 学習用データで評価値が4以上のものだけ取得する。
-        movielens_train_high_rating = dataset.train[dataset.train.rating >= 4]
-
-        for user_id, data in movielens_train_high_rating.groupby("user_id"):
-            # ユーザーが直近評価した５つの映画を取得
-            input_data = data.sort_values("timestamp")["movie_id"].tolist()[-5:]
-            # それらの映画が条件部に１本でも含まれているアソシエーションルールを抽出
-            matched_flags = rules.antecedents.apply(lambda x: len(set(input_data) & x)) >= 1
-
-            # アソシエーションルールの帰結部の映画をリストに格納し、登場頻度順に並び替え、ユーザーがまだに評価していないければ、推薦リストに追加する
-            consequent_movies = []
-            for i, row in rules[matched_flags].sort_values("lift", ascending=False).iterrows():
-                consequent_movies.extend(row["consequents"])
-            # 登場頻度をカウント
-            counter = Counter(consequent_movies)
-            for movie_id, movie_cnt in counter.most_common():
-                if movie_id not in user_evaluated_movies[user_id]:
-                    pred_user2items[user_id].append(movie_id)
-                # 推薦リストが10本になったら終了する
-                if len(pred_user2items[user_id]) == 10:
-                    break
-
-        # アソシエーションルールでは評価値の予測は難しいため、rmseの評価は行わない。（便宜上、テストデータの予測値をそのまま返す）
-
-        return RecommendResult(rating=dataset.test.rating, user2items=pred_user2items)
+def _flatten(itemsets: pd.Series):
+    """frozensetの列を、区切り位置(indptr)と映画IDの配列に変換する"""
+    lengths = itemsets.apply(len).to_numpy()
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    movie_ids = np.array(
+        [movie_id for itemset in itemsets for movie_id in sorted(itemset)],
+        dtype=np.int64,
+    )
+    return indptr, movie_ids
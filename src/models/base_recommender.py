@@ -1,10 +1,177 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
+
+from src.models.artifact import load_artifact, save_artifact
 from src.models.dataset import Dataset
+from src.models.interaction_matrix import InteractionMatrix, latest_rating_mask
+from src.models.profiler import stage
 from src.models.recommend_result import RecommendResult
 
 
 class BaseRecommender(ABC):
+    """レコメンドモデルの基底クラス
+
+    fitで学習し、saveで成果物を保存する。loadで成果物を読み込めば、学習し直さずにrecommendで推薦できる。
+    新しい評価が届いた場合は、partial_fitで学習済みの状態を新しい評価の分だけ更新する。
+    """
+
+    def __init__(self):
+        self.params: Dict[str, Any] = {}
+        self.interaction_matrix: Optional[InteractionMatrix] = None
+
+    @abstractmethod
+    def fit(self, dataset: Dataset, **kwargs) -> "BaseRecommender":
+        """学習する
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            BaseRecommender: 学習済みのモデル
+        """
+        pass
+
+    @abstractmethod
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "BaseRecommender":
+        """学習済みのモデルを、新しい評価の分だけ更新する
+
+        Args:
+            ratings (pd.DataFrame): RatingsBaseSchemaの列を持つ新しい評価データ
+
+        Returns:
+            BaseRecommender: 更新したモデル
+        """
+        pass
+
+    def _append_ratings(self, ratings: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+        """partial_fitで、新しい評価を評価値の行列に加える
+
+        同じユーザーと映画の組の評価は最新の評価だけを残し、評価済みの組は評価値を置き換える。
+        各モデルは返した評価データで更新し、評価し直した組は置き換える前の評価値の分を差し引く。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            Tuple[pd.DataFrame, np.ndarray]: 重複を除いた新しい評価データと、
+                各行の置き換える前の評価値(新しい組は0)
+        """
+        ratings = ratings[latest_rating_mask(ratings)]
+        previous = self.interaction_matrix.rating_at(
+            ratings.user_id.to_numpy(), ratings.movie_id.to_numpy()
+        )
+        self.interaction_matrix = self.interaction_matrix.append(ratings)
+        return ratings, previous
+
+    @abstractmethod
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
+        """各ユーザーに、まだ評価していない映画をk本推薦する
+
+        Args:
+            user_ids: ユーザーID
+            k (int): 推薦する映画の数
+
+        Returns:
+            Dict[int, List[int]]: キーはユーザーIDで、値はおすすめの映画IDのリスト
+        """
+        pass
+
+    @abstractmethod
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        """ユーザーと映画の組ごとに評価値を予測する
+
+        IDからインデックスへの変換と予測はまとめて配列で行う。学習データにないユーザーや映画は、
+        モデルごとに決めた値(平均評価値など)で予測する。
+
+        Args:
+            user_ids: 各組のユーザーID
+            movie_ids: 各組の映画ID
+
+        Returns:
+            np.ndarray: 各組の予測評価値(float32)
+        """
+        pass
+
+    def _predict_user_average(self, user_ids) -> np.ndarray:
+        """評価値を予測できないモデルの予測値として、各ユーザーの平均評価値を返す
+
+        学習データにないユーザーは全体の平均評価値とする。
+
+        Args:
+            user_ids: 各組のユーザーID
+
+        Returns:
+            np.ndarray: 各組の予測評価値(float32)
+        """
+        user_index = self.interaction_matrix.user_index(user_ids)
+        return self.interaction_matrix.average_rating(user_index).astype(np.float32)
+
     @abstractmethod
-    def recommend(self, dataset: Dataset, **kwargs) -> RecommendResult:
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        """保存する学習済みの配列を返す"""
         pass
+
+    @abstractmethod
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        """保存した配列から学習済みの状態を復元する"""
+        pass
+
+    def recommend_result(self, dataset: Dataset, k: int = 10) -> RecommendResult:
+        """学習済みのモデルで、テストデータの予測評価値と学習データの全ユーザーへの推薦結果を作る
+
+        Args:
+            dataset (Dataset): データセット
+            k (int): 推薦する映画の数
+
+        Returns:
+            RecommendResult: レコメンド結果
+        """
+        model = type(self).__name__
+        with stage("predict", model=model, rows=len(dataset.test)):
+            rating = self.predict(
+                dataset.test.user_id.to_numpy(), dataset.test.movie_id.to_numpy()
+            )
+        user_ids = dataset.interaction_matrix.user_ids
+        with stage("recommend", model=model, users=len(user_ids), k=k):
+            user2items = self.recommend(user_ids, k=k)
+        return RecommendResult(rating=rating, user2items=user2items)
+
+    def save(self, path: str) -> None:
+        """学習済みの成果物をディレクトリに保存する
+
+        Args:
+            path (str): 保存先のディレクトリ
+        """
+        arrays = {
+            f"interaction_{name}": array
+            for name, array in self.interaction_matrix.to_arrays().items()
+        }
+        arrays.update(self._to_arrays())
+        save_artifact(path, type(self).__name__, self.params, arrays)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BaseRecommender":
+        """保存した成果物を読み込む
+
+        Args:
+            path (str): 保存先のディレクトリ
+            mmap (bool): 配列をメモリマップで読み込むかどうか
+
+        Returns:
+            BaseRecommender: 学習済みのモデル
+        """
+        params, arrays = load_artifact(path, cls.__name__, mmap=mmap)
+        model = cls()
+        model.params = params
+        model.interaction_matrix = InteractionMatrix.from_arrays(
+            {
+                name[len("interaction_") :]: array
+                for name, array in arrays.items()
+                if name.startswith("interaction_")
+            }
+        )
+        model._from_arrays(arrays)
+        return model
@@ -0,0 +1,181 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.base_recommender import BaseRecommender
+from src.models.dataset import Dataset
+from src.models.neighbors import (
+    reindex_neighbors,
+    top_k_neighbors,
+    update_neighbors,
+)
+from src.models.top_k import to_user2items, top_k_unseen
+from src.models.user_history import chronological_order
+
+
+class ContentRecommender(BaseRecommender):
+    def fit(self, dataset: Dataset, **kwargs) -> "ContentRecommender":
+        """ジャンルとタグのTF-IDFベクトルで映画ごとの近傍を求め、各ユーザーが直近に高評価した映画と合わせて保持する
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            ContentRecommender: 学習済みのモデル
+        """
+        # 映画ごとに保持する、似ている映画の数
+        num_neighbors = kwargs.get("num_neighbors", 50)
+        # ユーザーごとに使う、直近に高評価した映画の数
+        num_recent = kwargs.get("num_recent", 5)
+        self.params = {"num_neighbors": num_neighbors, "num_recent": num_recent}
+        self.interaction_matrix = dataset.interaction_matrix
+
+        # 映画×映画のコサイン類似度の上位num_neighbors件を疎行列で持つ
+        item_vectors = dataset.item_features.tfidf(self.interaction_matrix.movie_ids)
+        self.neighbors = top_k_neighbors(item_vectors, num_neighbors)
+
+        # ユーザー×映画で、直近に高評価した映画を1とした行列
+        # 履歴のユーザーは疎行列の行と同じ並びのため、履歴の区切り位置をそのまま行の区切りに使う
+        history = dataset.user_history
+        indptr, recent = history.latest(
+            num_recent,
+            history.ratings >= self.interaction_matrix.high_rating_threshold,
+        )
+        movie_index = self.interaction_matrix.movie_index(history.movie_ids[recent])
+        self.recent = sparse.csr_matrix(
+            (np.ones(len(recent), dtype=np.float32), movie_index, indptr),
+            shape=self.interaction_matrix.shape,
+        )
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "ContentRecommender":
+        """新しい評価の分だけ、各ユーザーが直近に高評価した映画を更新する
+
+        新しい評価は、保持している評価より後の評価とする。映画の近傍はジャンルとタグから求めるため評価では変わらず、
+        新しい映画が現れた場合だけ、item_featuresで渡したItemFeaturesからその映画との近傍をupdate_neighborsで求める。
+        item_featuresを渡さない場合は、新しい映画を近傍のない映画とする。
+        評価し直して高評価でなくなった映画は直近の高評価から除く。保持していない古い高評価では補わないため、
+        そのユーザーの直近の高評価は、fitし直した場合より少なくなることがある。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            ContentRecommender: 更新したモデル
+        """
+        # 新しい映画のジャンルとタグ(ItemFeatures)
+        item_features = kwargs.get("item_features")
+
+        old_matrix = self.interaction_matrix
+        ratings, _ = self._append_ratings(ratings)
+        movie_ids = self.interaction_matrix.movie_ids
+        movie_index = self.interaction_matrix.movie_index(old_matrix.movie_ids)
+        self.neighbors = reindex_neighbors(self.neighbors, movie_index, len(movie_ids))
+        new_movies = np.flatnonzero(~np.isin(movie_ids, old_matrix.movie_ids))
+        if len(new_movies) > 0 and item_features is not None:
+            self.neighbors = update_neighbors(
+                self.neighbors,
+                item_features.tfidf(movie_ids),
+                new_movies,
+                self.params["num_neighbors"],
+            )
+
+        # 保持している直近の高評価の後に新しい高評価を時刻の順に加え、ユーザーごとに末尾のnum_recent件を選び直す
+        # 評価し直した組は、保持している高評価から除いてから新しい評価で加え直す
+        num_recent = self.params["num_recent"]
+        old_rows = np.repeat(
+            self.interaction_matrix.user_index(old_matrix.user_ids),
+            np.diff(self.recent.indptr),
+        )
+        old_columns = movie_index[self.recent.indices]
+        rerated = np.isin(
+            old_rows.astype(np.int64) * len(movie_ids) + old_columns,
+            self.interaction_matrix.user_index(ratings.user_id.to_numpy())
+            * len(movie_ids)
+            + self.interaction_matrix.movie_index(ratings.movie_id.to_numpy()),
+        )
+        high_rating = ratings[
+            ratings.rating >= self.interaction_matrix.high_rating_threshold
+        ]
+        order = chronological_order(
+            high_rating.user_id.to_numpy(), high_rating.timestamp.to_numpy()
+        )
+        rows = np.concatenate(
+            [
+                old_rows[~rerated],
+                self.interaction_matrix.user_index(high_rating.user_id.to_numpy())[
+                    order
+                ],
+            ]
+        )
+        columns = np.concatenate(
+            [
+                old_columns[~rerated],
+                self.interaction_matrix.movie_index(high_rating.movie_id.to_numpy())[
+                    order
+                ],
+            ]
+        )
+        # ユーザーの順に安定ソートし、同じユーザーの中では保持していた高評価、新しい高評価の順に並べる
+        order = np.argsort(rows, kind="stable")
+        rows, columns = rows[order], columns[order]
+        num_elements = np.bincount(rows, minlength=self.interaction_matrix.shape[0])
+        position_from_end = np.cumsum(num_elements)[rows] - np.arange(len(rows))
+        recent = position_from_end <= num_recent
+        self.recent = sparse.csr_matrix(
+            (
+                np.ones(recent.sum(), dtype=np.float32),
+                columns[recent].astype(np.int32),
+                np.concatenate([[0], np.cumsum(np.minimum(num_elements, num_recent))]),
+            ),
+            shape=self.interaction_matrix.shape,
+        )
+        return self
+
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
+        # 直近に高評価した映画×近傍の行列の積で、各映画に似ている度合いを全ユーザー分まとめて計算する
+        # 複数の高評価した映画に似ている映画ほどスコアが高くなる
+        user_ids = np.asarray(user_ids)
+        user_index = self.interaction_matrix.user_index(user_ids)
+        # 対象ユーザーの行だけを残して積を計算する(学習データにないユーザーは推薦しない)
+        target = np.zeros(self.recent.shape[0], dtype=np.float32)
+        target[user_index[user_index >= 0]] = 1
+        scores = (sparse.diags(target) @ self.recent @ self.neighbors).tocsr()
+        top_items = top_k_unseen(
+            scores, self.interaction_matrix.rating, k=k, user_index=user_index
+        )
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # 特徴からは評価値を予測できないため、ユーザーの平均評価値を予測値とする
+        return self._predict_user_average(user_ids)
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "neighbor_indptr": self.neighbors.indptr,
+            "neighbor_indices": self.neighbors.indices,
+            "neighbor_scores": self.neighbors.data,
+            "recent_indptr": self.recent.indptr,
+            "recent_indices": self.recent.indices,
+        }
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        num_movies = len(self.interaction_matrix.movie_ids)
+        self.neighbors = sparse.csr_matrix(
+            (
+                arrays["neighbor_scores"],
+                arrays["neighbor_indices"],
+                arrays["neighbor_indptr"],
+            ),
+            shape=(num_movies, num_movies),
+        )
+        self.recent = sparse.csr_matrix(
+            (
+                np.ones(len(arrays["recent_indices"]), dtype=np.float32),
+                arrays["recent_indices"],
+                arrays["recent_indptr"],
+            ),
+            shape=self.interaction_matrix.shape,
+        )
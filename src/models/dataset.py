@@ -1,13 +1,112 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence
 
-from pandera.typing import DataFrame
-from pydantic import BaseModel
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, PrivateAttr
 
-from src.dataset.shema import MoviesSchema
+from src.models.interaction_matrix import InteractionMatrix, latest_rating_mask
+from src.models.item_features import ItemFeatures
+from src.models.user_history import UserHistory
 
 
 class Dataset(BaseModel):
-    train: DataFrame[MoviesSchema]
-    test: DataFrame[MoviesSchema]
+    # スキーマの検証はDataLoaderがファイルを読み込んだ時点で一度だけ行うため、ここでは検証しない
+    # 評価データ(RatingsBaseSchemaの列を持つDataFrame)。学習用の行を先頭に、テスト用の行を末尾に並べる
+    ratings: pd.DataFrame
+    # ratingsの先頭から何行目までが学習用データか
+    num_train: int
     test_user2items: Dict[int, List[int]]
-    item_content: DataFrame[MoviesSchema]
+    # 映画の情報(MoviesSchemaの列を持つDataFrame)。評価データには結合せず、必要なときに映画IDで引く
+    item_content: pd.DataFrame
+    # 映画×特徴(ジャンル、タグ)の行列
+    item_features: ItemFeatures
+
+    _interaction_matrix: Optional[InteractionMatrix] = PrivateAttr(default=None)
+    _user_history: Optional[UserHistory] = PrivateAttr(default=None)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def train(self) -> pd.DataFrame:
+        """学習用データ。ratingsの先頭の範囲をコピーせずに参照する"""
+        return self.ratings.iloc[: self.num_train]
+
+    @property
+    def test(self) -> pd.DataFrame:
+        """テスト用データ。ratingsの末尾の範囲をコピーせずに参照する"""
+        return self.ratings.iloc[self.num_train :]
+
+    @property
+    def user_history(self) -> UserHistory:
+        """学習データのユーザーごとの時刻順の履歴。初回アクセス時に一度だけ作成する
+
+        DataLoaderは学習用データをユーザーと時刻の順に並べておくため、ソートせずに作成できる。
+        """
+        if self._user_history is None:
+            self._user_history = UserHistory.from_frame(self.train)
+        return self._user_history
+
+    @property
+    def interaction_matrix(self) -> InteractionMatrix:
+        """学習データのユーザー×映画の疎行列。初回アクセス時に一度だけ、履歴から作成する"""
+        if self._interaction_matrix is None:
+            self._interaction_matrix = InteractionMatrix.from_history(self.user_history)
+        return self._interaction_matrix
+
+    def append_ratings(self, ratings: pd.DataFrame) -> "Dataset":
+        """新しい評価を学習用データの末尾に加えたデータセットを作る
+
+        同じユーザーと映画の組の評価は、学習用データの評価も含めて時刻の最も新しい評価だけを残す。
+        評価し直した組は学習用データの元の行を除き、学習用データの評価より古い新しい評価は加えない。
+        作成済みの疎行列は作り直さず、加えた評価の分だけ更新する。テスト用データは変えない。
+
+        Args:
+            ratings (pd.DataFrame): RatingsBaseSchemaの列を持つ新しい評価データ
+
+        Returns:
+            Dataset: 新しい評価を加えたデータセット
+        """
+        ratings = ratings[list(self.ratings.columns)].astype(self.ratings.dtypes)
+        train = self.train
+        # 新しい評価のあったユーザーの行だけを、新しい評価と合わせて同じ組の最新の評価を選ぶ
+        related = np.flatnonzero(
+            np.isin(train.user_id.to_numpy(), ratings.user_id.unique())
+        )
+        latest = latest_rating_mask(
+            pd.concat([train.iloc[related], ratings], ignore_index=True)
+        )
+        kept = np.ones(len(train), dtype=bool)
+        kept[related] = latest[: len(related)]
+        ratings = ratings[latest[len(related) :]]
+        dataset = Dataset(
+            ratings=pd.concat([train[kept], ratings, self.test], ignore_index=True),
+            num_train=int(kept.sum()) + len(ratings),
+            test_user2items=self.test_user2items,
+            item_content=self.item_content,
+            item_features=self.item_features,
+        )
+        if self._interaction_matrix is not None:
+            dataset._interaction_matrix = self._interaction_matrix.append(ratings)
+        return dataset
+
+    def join_item_content(
+        self, ratings: pd.DataFrame, columns: Optional[Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """評価データに映画の情報の列を付ける
+
+        Args:
+            ratings (pd.DataFrame): movie_idを持つ評価データ(trainやtestなど)
+            columns (Optional[Sequence[str]]): 付ける映画の情報の列。Noneの場合は全ての列
+
+        Returns:
+            pd.DataFrame: 映画の情報の列を付けた評価データ
+        """
+        content = self.item_content.set_index("movie_id")
+        if columns is not None:
+            content = content[list(columns)]
+        position = content.index.get_indexer(ratings.movie_id.to_numpy())
+        joined = ratings.copy()
+        for col in content.columns:
+            joined[col] = content[col].to_numpy()[position]
+        return joined
@@ -1,8 +1,21 @@
-from typing import Dict, List
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 from pydantic import BaseModel
-from loguru import logger
+
+from src.models.profiler import stage
+
+
+class RankingMetrics(BaseModel):
+    """レコメンド数kごとのランキングの評価指標"""
+
+    precision: float
+    recall: float
+    ndcg: float
+    map: float
+    hit_rate: float
+    coverage: float
 
 
 class Metrics(BaseModel):
@@ -11,137 +24,211 @@ class Metrics(BaseModel):
     rmse: float
     precision_at_k: float
     recall_at_k: float
+    ndcg_at_k: float = 0.0
+    map_at_k: float = 0.0
+    hit_rate_at_k: float = 0.0
+    coverage_at_k: float = 0.0
+    # キーはレコメンド数k
+    at_k: Dict[int, RankingMetrics] = {}
 
 
 class MetricCaluculator:
     def calc(
         self,
-        true_rating: List[float],
-        pred_rating: List[float],
+        true_rating: Sequence[float],
+        pred_rating: Sequence[float],
         true_user2items: Dict[int, List[int]],
         pred_user2items: Dict[int, List[int]],
         k: int,
+        ks: Optional[Sequence[int]] = None,
+        num_items: Optional[int] = None,
     ) -> Metrics:
         """指標を計算する
 
         Args:
-            true_rating (List[float]): 真の評価値
-            pred_rating (List[float]): 実際の評価値
+            true_rating (Sequence[float]): 真の評価値(リストまたはnumpy配列)
+            pred_rating (Sequence[float]): 実際の評価値(リストまたはnumpy配列)
             true_user2items (Dict[int, List[int]]): 真のユーザーとアイテムの対応
             pred_user2items (Dict[int, List[int]]): 実際のユーザーとアイテムの対応
             k (int): レコメンド数
+            ks (Optional[Sequence[int]]): 合わせて計算するレコメンド数。kは必ず含める
+            num_items (Optional[int]): カバレッジの分母にするアイテム数。Noneの場合は
+                真と実際のアイテムに登場したアイテム数とする
 
         Returns:
             Metrics: 評価指標
         """
-        rmse = self._calc_rmse(true_rating, pred_rating)
-        precision_at_k = self._calc_precision_at_k(true_user2items, pred_user2items, k)
-        recall_at_k = self._calc_recall_at_k(true_user2items, pred_user2items, k)
+        with stage("evaluate", rows=len(true_rating), users=len(true_user2items)):
+            rmse = self._calc_rmse(true_rating, pred_rating)
+
+            ks = sorted(set(ks or []) | {k})
+            users = list(true_user2items.keys())
+            pred_items = _to_padded([pred_user2items.get(user, []) for user in users])
+            true_indptr, true_items = _to_indptr(
+                [true_user2items[user] for user in users]
+            )
+            if num_items is None:
+                num_items = len(np.union1d(true_items, pred_items[pred_items >= 0]))
+            at_k = self.calc_ranking_metrics(
+                pred_items, true_indptr, true_items, ks, num_items
+            )
 
         return Metrics(
-            rmse=rmse, precision_at_k=precision_at_k, recall_at_k=recall_at_k
+            rmse=rmse,
+            precision_at_k=at_k[k].precision,
+            recall_at_k=at_k[k].recall,
+            ndcg_at_k=at_k[k].ndcg,
+            map_at_k=at_k[k].map,
+            hit_rate_at_k=at_k[k].hit_rate,
+            coverage_at_k=at_k[k].coverage,
+            at_k=at_k,
         )
 
-    def _precision_at_k(
-        self, true_items: Dict[int, List[int]], pred_items: Dict[int, List[int]], k: int
-    ) -> float:
-        """Precision@kを計算する
-
-        Args:
-            true_items (Dict[int, List[int]]): 真にレコメンドされるアイテム
-            pred_items (Dict[int, List[int]]): 実際にレコメンドされたアイテム
-            k (int): レコメンド数
-
-        Returns:
-            float: Precision@k
-        """
-        if k == 0:
-            return 0.0
-        p_at_k = len(set(true_items) & set(pred_items[:k])) / k
-
-        return p_at_k
-
-    def _recall_at_k(
-        self, true_items: List[int], pred_items: List[int], k: int
-    ) -> float:
-        """Recall@kを計算する
-
-        Args:
-            true_items (List[int]): 真にレコメンドされるアイテム
-            pred_items (List[int]): 実際にレコメンドされたアイテム
-            k (int): レコメンド数
-
-        Returns:
-            float: Recall@k
-        """
-        if len(true_items) == 0 or k == 0:
-            return 0.0
-        r_at_k = len(set(true_items) & set(pred_items[:k])) / len(true_items)
-
-        return r_at_k
-
     def _calc_rmse(
         self,
-        true_rating: List[float],
-        pred_rating: List[float],
+        true_rating: Sequence[float],
+        pred_rating: Sequence[float],
     ) -> float:
         """RMSEを計算する
 
         Args:
-            true_rating (List[float]): 真の評価値
-            pred_rating (List[float]): 実際の評価値
+            true_rating (Sequence[float]): 真の評価値
+            pred_rating (Sequence[float]): 実際の評価値
 
         Returns:
             float: RMSE
         """
-        return np.sqrt(np.mean((np.array(true_rating) - np.array(pred_rating)) ** 2))
+        true_rating = np.asarray(true_rating, dtype=np.float64)
+        pred_rating = np.asarray(pred_rating, dtype=np.float64)
+        return float(np.sqrt(np.mean((true_rating - pred_rating) ** 2)))
 
-    def _calc_recall_at_k(
+    def calc_ranking_metrics(
         self,
-        true_user2items: Dict[int, List[int]],
-        pred_user2items: Dict[int, List[int]],
-        k: int,
-    ) -> float:
-        """Recall@kを計算する
+        pred_items: np.ndarray,
+        true_indptr: np.ndarray,
+        true_items: np.ndarray,
+        ks: Sequence[int],
+        num_items: int,
+    ) -> Dict[int, RankingMetrics]:
+        """全ユーザーのランキングの評価指標を、レコメンド数ごとにまとめて計算する
 
         Args:
-            true_user2items (Dict[int, List[int]]): 真のユーザーとアイテムの対応
-            pred_user2items (Dict[int, List[int]]): 実際のユーザーとアイテムの対応
-            k (int): レコメンド数
+            pred_items (np.ndarray): ユーザー×レコメンド順のアイテム。足りない部分は-1で埋める
+            true_indptr (np.ndarray): ユーザーごとの真のアイテムの区切り位置
+            true_items (np.ndarray): 真のアイテムを連結した配列
+            ks (Sequence[int]): レコメンド数
+            num_items (int): カバレッジの分母にするアイテム数
 
         Returns:
-            float: Recall@k
+            Dict[int, RankingMetrics]: キーはレコメンド数で、値は全ユーザーの平均の評価指標
         """
-        scores = []
-        for user_id in true_user2items.keys():
-            r_at_k = self._recall_at_k(
-                true_user2items[user_id], pred_user2items[user_id], k
+        num_users = len(true_indptr) - 1
+        max_k = max(ks)
+        pred_items = _pad_columns(pred_items, max_k)[:, :max_k]
+
+        # ユーザーとアイテムの組を1つの整数にし、重複を除いた真のアイテムを(ユーザー, アイテム)の順に並べる
+        true_users = np.repeat(np.arange(num_users), np.diff(true_indptr))
+        offset = max(int(true_items.max(initial=0)), int(pred_items.max(initial=0))) + 1
+        true_keys = np.unique(true_users * offset + true_items)
+        num_true = np.bincount(true_keys // offset, minlength=num_users)
+        hits = _isin_rows(pred_items, true_keys, num_true, offset)
+
+        positions = np.arange(1, max_k + 1)
+        discounts = 1 / np.log2(positions + 1)
+        ideal_dcg = np.concatenate([[0], np.cumsum(discounts)])
+        # 順位方向の累積和は、上三角行列との積で計算する(axis=1のcumsumより速い)
+        upper = np.triu(np.ones((max_k, max_k)))
+        hits = hits.astype(np.float64)
+        cumulative_hits = hits @ upper
+        cumulative_precision = (hits * cumulative_hits / positions) @ upper
+        cumulative_dcg = hits @ (upper * discounts[:, None])
+
+        at_k = {}
+        for k in ks:
+            if num_users == 0 or k == 0:
+                at_k[k] = RankingMetrics(
+                    precision=0, recall=0, ndcg=0, map=0, hit_rate=0, coverage=0
+                )
+                continue
+            num_hits = cumulative_hits[:, k - 1]
+            num_relevant = np.minimum(num_true, k)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                recall = np.where(num_true > 0, num_hits / num_true, 0)
+                ndcg = np.where(
+                    num_relevant > 0,
+                    cumulative_dcg[:, k - 1] / ideal_dcg[num_relevant],
+                    0,
+                )
+                average_precision = np.where(
+                    num_relevant > 0, cumulative_precision[:, k - 1] / num_relevant, 0
+                )
+            recommended = pred_items[:, :k]
+            num_recommended = np.count_nonzero(
+                np.bincount(recommended[recommended >= 0], minlength=1)
             )
-            scores.append(r_at_k)
-
-        return np.mean(scores)
-
-    def _calc_precision_at_k(
-        self,
-        true_user2items: Dict[int, List[int]],
-        pred_user2items: Dict[int, List[int]],
-        k: int,
-    ) -> float:
-        """Precision@kを計算する
-
-        Args:
-            true_user2items (Dict[int, List[int]]): 真のユーザーとアイテムの対応
-            pred_user2items (Dict[int, List[int]]): 実際のユーザーとアイテムの対応
-            k (int): レコメンド数
-
-        Returns:
-            float: Precision@k
-        """
-        scores = []
-        for user_id in true_user2items.keys():
-            p_at_k = self._precision_at_k(
-                true_user2items[user_id], pred_user2items[user_id], k
+            coverage = num_recommended / num_items if num_items > 0 else 0.0
+            at_k[k] = RankingMetrics(
+                precision=float(np.mean(num_hits / k)),
+                recall=float(np.mean(recall)),
+                ndcg=float(np.mean(ndcg)),
+                map=float(np.mean(average_precision)),
+                hit_rate=float(np.mean(num_hits > 0)),
+                coverage=coverage,
             )
-            scores.append(p_at_k)
-
-        return np.mean(scores)
+        return at_k
+
+
+def _isin_rows(
+    pred_items: np.ndarray, true_keys: np.ndarray, num_true: np.ndarray, offset: int
+) -> np.ndarray:
+    """ユーザーごとに、レコメンドしたアイテムが真のアイテムに含まれるかを判定する"""
+    valid = pred_items >= 0
+    if len(true_keys) == 0:
+        return np.zeros(pred_items.shape, dtype=bool)
+    max_true = int(num_true.max())
+    if max_true <= 64:
+        # 真のアイテムが少ない場合は、ユーザー×真のアイテムの配列にして直接比較するほうが速い
+        true_padded = _to_padded_rows(true_keys % offset, num_true, max_true)
+        hits = np.zeros(pred_items.shape, dtype=bool)
+        for column in range(max_true):
+            hits |= pred_items == true_padded[:, column : column + 1]
+        return hits & valid
+    pred_keys = np.arange(len(pred_items))[:, None] * offset + pred_items
+    found = np.searchsorted(true_keys, pred_keys).clip(max=len(true_keys) - 1)
+    return (true_keys[found] == pred_keys) & valid
+
+
+def _to_padded_rows(items: np.ndarray, lengths: np.ndarray, width: int) -> np.ndarray:
+    """行ごとに連結したアイテムを、足りない部分を-1で埋めた行×width列の配列に変換する"""
+    if len(items) == len(lengths) * width:
+        # 全ての行が同じ長さの場合は並べ替えるだけでよい
+        return items.reshape(len(lengths), width).astype(np.int64)
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    padded = np.full((len(lengths), width), -1, np.int64)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    padded[rows, np.arange(len(items)) - indptr[rows]] = items
+    return padded
+
+
+def _to_indptr(item_lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """アイテムのリストを、区切り位置(indptr)とアイテムを連結した配列に変換する"""
+    lengths = np.fromiter(map(len, item_lists), dtype=np.int64, count=len(item_lists))
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    items = np.fromiter(
+        chain.from_iterable(item_lists), dtype=np.int64, count=int(indptr[-1])
+    )
+    return indptr, items
+
+
+def _to_padded(item_lists: List[List[int]]) -> np.ndarray:
+    """アイテムのリストを、足りない部分を-1で埋めたユーザー×順位の配列に変換する"""
+    indptr, items = _to_indptr(item_lists)
+    lengths = np.diff(indptr)
+    return _to_padded_rows(items, lengths, int(lengths.max(initial=0)))
+
+
+def _pad_columns(items: np.ndarray, width: int) -> np.ndarray:
+    if items.shape[1] >= width:
+        return items
+    padding = np.full((items.shape[0], width - items.shape[1]), -1, items.dtype)
+    return np.hstack([items, padding])
@@ -0,0 +1,99 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+from scipy import sparse
+
+from src.models.base_recommender import BaseRecommender
+from src.models.item_index import ItemIndex
+from src.models.top_k import seen_rows, to_user2items, top_k_unseen
+
+
+class FactorRecommender(BaseRecommender):
+    """ユーザーと映画の因子の内積で推薦するモデルの基底クラス
+
+    継承したクラスはfitでuser_factors(ユーザー数×因子数)、item_factors(映画数×因子数)、average_scoreを学習し、
+    paramsにfactors、memory_budget_mb、index_type、num_candidatesを設定して_build_item_indexを呼ぶ。
+    推薦(上位の選択と映画の埋め込みの近傍探索)と保存は共通で行う。
+    """
+
+    def _build_item_index(self) -> None:
+        # 映画の埋め込みの近傍探索インデックスを作成する
+        self.item_index = ItemIndex(
+            dim=self.params["factors"], index_type=self.params["index_type"]
+        ).build(self.item_factors)
+
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
+        # 入力したユーザーの順番を行として、予測評価値と評価済みの映画の行列を作る
+        user_ids = np.asarray(user_ids)
+        user_index = self.interaction_matrix.user_index(user_ids)
+        user_vectors = self._user_vectors(user_index)
+        seen = seen_rows(self.interaction_matrix.rating, user_index)
+        num_movies = len(self.interaction_matrix.movie_ids)
+
+        # ユーザー×アイテムの予測評価値の行列全体は持たず、ユーザーのブロックごとに上位を選ぶ
+        # 1要素あたり、最大で予測評価値(float64)とargpartitionのインデックス(int64)の16バイトを使う
+        block_size = max(
+            1, self.params["memory_budget_mb"] * 1024**2 // (max(num_movies, 1) * 16)
+        )
+        if self.params["num_candidates"] is None:
+            # 全映画の予測評価値をブロックごとに計算する
+            def scores(rows: np.ndarray) -> np.ndarray:
+                return user_vectors[rows] @ self.item_factors.T
+
+        else:
+            # 近傍探索で取得した候補だけに予測評価値を付けた疎行列を作る
+            candidate_scores, candidate_index = self.item_index.search(
+                user_vectors, self.params["num_candidates"]
+            )
+            found = candidate_index >= 0
+            scores = sparse.csr_matrix(
+                (
+                    candidate_scores[found],
+                    (np.nonzero(found)[0], candidate_index[found]),
+                ),
+                shape=(len(user_ids), num_movies),
+            )
+        top_items = top_k_unseen(scores, seen, k=k, block_size=block_size)
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # 学習データにないユーザーとアイテムは平均評価値で予測する
+        user_index = self.interaction_matrix.user_index(user_ids)
+        movie_index = self.interaction_matrix.movie_index(movie_ids)
+        known = (user_index >= 0) & (movie_index >= 0)
+        pred_results = np.full(len(user_index), self.average_score, dtype=np.float32)
+        pred_results[known] = np.einsum(
+            "ij,ij->i",
+            self.user_factors[user_index[known]],
+            self.item_factors[movie_index[known]],
+        )
+        return pred_results
+
+    def _user_vectors(self, user_index: np.ndarray) -> np.ndarray:
+        # 学習データにないユーザーは、全ユーザーの平均のベクトルとする
+        user_vectors = self.user_factors[np.maximum(user_index, 0)]
+        user_vectors[user_index < 0] = self.user_factors.mean(axis=0)
+        return user_vectors
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "user_factors": self.user_factors,
+            "item_factors": self.item_factors,
+            "average_score": np.array(self.average_score),
+        }
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.user_factors = arrays["user_factors"]
+        self.item_factors = arrays["item_factors"]
+        self.average_score = float(arrays["average_score"])
+
+    def save(self, path: str) -> None:
+        super().save(path)
+        self.item_index.save(os.path.join(path, "item_index"))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "FactorRecommender":
+        model = super().load(path, mmap=mmap)
+        model.item_index = ItemIndex.load(os.path.join(path, "item_index"))
+        return model
@@ -0,0 +1,334 @@
+"""疎なトランザクション行列から頻出アイテム集合とアソシエーションルールを計算する
+
+頻出アイテム集合は垂直表現(Eclat)で探索する。各アイテムを評価したユーザーの集合をビット列で持ち、
+共通の接頭辞を持つアイテム集合ごとにビット列のANDとビット数のカウントでまとめて支持度を計算する。
+長さ2のアイテム集合は疎行列の積で共起数を一度に計算する。
+出力はmlxtendのapriori / association_rulesと同じ形式のDataFrameにする。
+"""
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+RULE_COLUMNS = [
+    "antecedents",
+    "consequents",
+    "antecedent support",
+    "consequent support",
+    "support",
+    "confidence",
+    "lift",
+    "leverage",
+    "conviction",
+    "zhangs_metric",
+]
+
+# 8ビットごとの立っているビット数
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def frequent_itemsets(
+    matrix: sparse.spmatrix,
+    min_support: float = 0.5,
+    max_len: Optional[int] = None,
+    item_names: Optional[Sequence] = None,
+) -> pd.DataFrame:
+    """トランザクション×アイテムの疎行列から、支持度がmin_support以上のアイテム集合を求める
+
+    Args:
+        matrix (sparse.spmatrix): トランザクション×アイテムの行列。0以外の要素を1とみなす
+        min_support (float): 最小支持度
+        max_len (Optional[int]): アイテム集合の最大の長さ。Noneの場合は制限しない
+        item_names (Optional[Sequence]): 列番号に対応するアイテム名。Noneの場合は列番号のまま返す
+
+    Returns:
+        pd.DataFrame: supportとitemsets(frozenset)の列を持つ。長さの短い順、列番号の辞書順に並ぶ
+    """
+    matrix = sparse.csc_matrix(matrix, dtype=bool)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    num_rows = matrix.shape[0]
+
+    itemsets: List[Tuple[int, ...]] = []
+    supports: List[float] = []
+    if num_rows > 0 and (max_len is None or max_len >= 1):
+        # 長さ1
+        item_support = np.diff(matrix.indptr) / num_rows
+        items = np.flatnonzero(item_support >= min_support)
+        itemsets.extend((item,) for item in items.tolist())
+        supports.extend(item_support[items].tolist())
+
+        if max_len is None or max_len >= 2:
+            pairs, pair_support = _frequent_pairs(matrix[:, items], min_support)
+            pairs = items[pairs]
+            itemsets.extend(map(tuple, pairs.tolist()))
+            supports.extend(pair_support.tolist())
+
+            if max_len is None or max_len >= 3:
+                bitsets = _to_bitsets(matrix[:, items])
+                position = np.full(matrix.shape[1], -1)
+                position[items] = np.arange(len(items))
+                _eclat(
+                    pairs,
+                    bitsets,
+                    position,
+                    min_support,
+                    num_rows,
+                    max_len,
+                    itemsets,
+                    supports,
+                )
+
+    # 長さの短い順、列番号の辞書順に並べる
+    order = sorted(range(len(itemsets)), key=lambda i: (len(itemsets[i]), itemsets[i]))
+    if item_names is not None:
+        item_names = np.asarray(item_names)
+        names = [frozenset(item_names[list(itemsets[i])].tolist()) for i in order]
+    else:
+        names = [frozenset(itemsets[i]) for i in order]
+    return pd.DataFrame(
+        {"support": np.array(supports, dtype=float)[order], "itemsets": names},
+        columns=["support", "itemsets"],
+    )
+
+
+def association_rules(
+    frequent: pd.DataFrame, metric: str = "confidence", min_threshold: float = 0.8
+) -> pd.DataFrame:
+    """頻出アイテム集合からアソシエーションルールを作る
+
+    Args:
+        frequent (pd.DataFrame): frequent_itemsetsの結果
+        metric (str): ルールを絞り込む指標
+        min_threshold (float): 指標の閾値。指標がこの値以上のルールを残す
+
+    Returns:
+        pd.DataFrame: mlxtendのassociation_rulesと同じ列を持つルール。アイテム集合の順、
+            同じアイテム集合内では条件部の長い順に並ぶ
+    """
+    if metric not in _METRICS:
+        raise ValueError(f"metric must be one of {list(_METRICS)}, got {metric}")
+
+    # 長さごとにアイテム集合を(件数×長さ)の配列にし、部分集合の支持度を引けるようにする
+    by_length: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    lengths = frequent.itemsets.apply(len).to_numpy()
+    for length in np.unique(lengths):
+        position = np.flatnonzero(lengths == length)
+        items = np.array(
+            [sorted(itemset) for itemset in frequent.itemsets.iloc[position]]
+        ).reshape(len(position), length)
+        support = frequent.support.to_numpy(dtype=float)[position]
+        by_length[length] = (position, items, support)
+    lookup = {
+        length: _itemset_index(items) for length, (_, items, _) in by_length.items()
+    }
+
+    parts = []
+    for length, (position, items, support) in by_length.items():
+        if length < 2:
+            continue
+        combination_order = 0
+        for antecedent_len in range(length - 1, 0, -1):
+            for antecedent_cols in combinations(range(length), antecedent_len):
+                consequent_cols = [
+                    col for col in range(length) if col not in antecedent_cols
+                ]
+                antecedents = items[:, list(antecedent_cols)]
+                consequents = items[:, consequent_cols]
+                sA = _lookup_support(
+                    lookup[antecedent_len], by_length[antecedent_len][2], antecedents
+                )
+                sC = _lookup_support(
+                    lookup[length - antecedent_len],
+                    by_length[length - antecedent_len][2],
+                    consequents,
+                )
+                keep = _METRICS[metric](support, sA, sC) >= min_threshold
+                parts.append(
+                    {
+                        "position": position[keep],
+                        "combination": np.full(keep.sum(), combination_order),
+                        "antecedents": antecedents[keep],
+                        "consequents": consequents[keep],
+                        "sAC": support[keep],
+                        "sA": sA[keep],
+                        "sC": sC[keep],
+                    }
+                )
+                combination_order += 1
+
+    parts = [part for part in parts if len(part["sAC"]) > 0]
+    if not parts:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+
+    # mlxtendと同様に、アイテム集合ごとに条件部の長い順にルールを並べる
+    order = np.lexsort(
+        (
+            np.concatenate([part["combination"] for part in parts]),
+            np.concatenate([part["position"] for part in parts]),
+        )
+    )
+    sAC, sA, sC = (
+        np.concatenate([part[name] for part in parts])[order]
+        for name in ("sAC", "sA", "sC")
+    )
+    rules = pd.DataFrame(
+        {
+            "antecedents": _to_frozensets(parts, "antecedents", order),
+            "consequents": _to_frozensets(parts, "consequents", order),
+        }
+    )
+    rules["antecedent support"] = sA
+    rules["consequent support"] = sC
+    rules["support"] = sAC
+    for name in RULE_COLUMNS[5:]:
+        rules[name] = _METRICS[name](sAC, sA, sC)
+    return rules
+
+
+def _frequent_pairs(
+    matrix: sparse.csc_matrix, min_support: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """共起数を疎行列の積で計算し、支持度が閾値以上の列番号の組(i < j)を返す"""
+    num_rows = matrix.shape[0]
+    binary = matrix.astype(np.int32)
+    cooccurrence = sparse.triu(binary.T @ binary, k=1).tocoo()
+    support = cooccurrence.data / num_rows
+    frequent = support >= min_support
+    pairs = np.stack([cooccurrence.row[frequent], cooccurrence.col[frequent]], axis=1)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return pairs[order].astype(np.int64).reshape(-1, 2), support[frequent][order]
+
+
+def _to_bitsets(matrix: sparse.csc_matrix) -> np.ndarray:
+    """各列の0以外の行番号を、64ビット単位のビット列(列数×ワード数)に変換する"""
+    num_words = (matrix.shape[0] + 63) // 64
+    bitsets = np.zeros((matrix.shape[1], num_words), dtype=np.uint64)
+    if matrix.nnz == 0:
+        return bitsets
+    cols = np.repeat(np.arange(matrix.shape[1]), np.diff(matrix.indptr))
+    rows = matrix.indices.astype(np.int64)
+    keys = cols * num_words + rows // 64
+    bits = np.left_shift(np.uint64(1), (rows % 64).astype(np.uint64))
+    # CSCの行番号は列ごとに昇順なので、同じワードに入るビットは連続している
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    bitsets.reshape(-1)[keys[starts]] = np.bitwise_or.reduceat(bits, starts)
+    return bitsets
+
+
+def _popcount(bitsets: np.ndarray) -> np.ndarray:
+    """ビット列ごとに立っているビット数を数える"""
+    return _POPCOUNT[bitsets.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def _eclat(
+    pairs: np.ndarray,
+    bitsets: np.ndarray,
+    position: np.ndarray,
+    min_support: float,
+    num_rows: int,
+    max_len: Optional[int],
+    itemsets: List[Tuple[int, ...]],
+    supports: List[float],
+) -> None:
+    """長さ2の頻出アイテム集合を接頭辞ごとにまとめ、長さ3以上を深さ優先で探索する"""
+    starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+    ends = np.r_[starts[1:], len(pairs)]
+    for start, end in zip(starts, ends):
+        if end - start < 2:
+            continue
+        prefix = int(pairs[start, 0])
+        extensions = pairs[start:end, 1]
+        tidsets = bitsets[position[prefix]] & bitsets[position[extensions]]
+        _extend(
+            (prefix,),
+            extensions,
+            tidsets,
+            min_support,
+            num_rows,
+            max_len,
+            itemsets,
+            supports,
+        )
+
+
+def _extend(
+    prefix: Tuple[int, ...],
+    extensions: np.ndarray,
+    tidsets: np.ndarray,
+    min_support: float,
+    num_rows: int,
+    max_len: Optional[int],
+    itemsets: List[Tuple[int, ...]],
+    supports: List[float],
+) -> None:
+    """接頭辞+各拡張アイテムが頻出のとき、拡張アイテム同士を組み合わせた集合を探索する
+
+    tidsetsは接頭辞+各拡張アイテムを含むトランザクションのビット列。
+    """
+    stack = [(prefix, extensions, tidsets)]
+    while stack:
+        prefix_, extensions_, tidsets_ = stack.pop()
+        # 接頭辞+拡張アイテムの長さ+1が追加するアイテム集合の長さ
+        if max_len is not None and len(prefix_) + 2 > max_len:
+            continue
+        for i in range(len(extensions_) - 1):
+            joined = tidsets_[i] & tidsets_[i + 1 :]
+            support = _popcount(joined) / num_rows
+            frequent = np.flatnonzero(support >= min_support)
+            if len(frequent) == 0:
+                continue
+            new_prefix = prefix_ + (int(extensions_[i]),)
+            new_extensions = extensions_[i + 1 :][frequent]
+            itemsets.extend(new_prefix + (item,) for item in new_extensions.tolist())
+            supports.extend(support[frequent].tolist())
+            if len(frequent) >= 2:
+                stack.append((new_prefix, new_extensions, joined[frequent]))
+
+
+def _itemset_index(items: np.ndarray) -> pd.Index:
+    if items.shape[1] == 1:
+        return pd.Index(items[:, 0])
+    return pd.MultiIndex.from_arrays(list(items.T))
+
+
+def _lookup_support(
+    index: pd.Index, support: np.ndarray, items: np.ndarray
+) -> np.ndarray:
+    position = index.get_indexer(_itemset_index(items))
+    if (position < 0).any():
+        raise KeyError("antecedent or consequent is missing from frequent itemsets")
+    return support[position]
+
+
+def _to_frozensets(parts: List[Dict], name: str, order: np.ndarray) -> List[frozenset]:
+    rows = [row for part in parts for row in part[name].tolist()]
+    return [frozenset(rows[i]) for i in order]
+
+
+def _conviction(sAC: np.ndarray, sA: np.ndarray, sC: np.ndarray) -> np.ndarray:
+    confidence = sAC / sA
+    conviction = np.full(confidence.shape, np.inf)
+    below = confidence < 1.0
+    conviction[below] = (1.0 - sC[below]) / (1.0 - confidence[below])
+    return conviction
+
+
+def _zhangs_metric(sAC: np.ndarray, sA: np.ndarray, sC: np.ndarray) -> np.ndarray:
+    denominator = np.maximum(sAC * (1 - sA), sA * (sC - sAC))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator == 0, 0, (sAC - sA * sC) / denominator)
+
+
+_METRICS = {
+    "antecedent support": lambda sAC, sA, sC: sA,
+    "consequent support": lambda sAC, sA, sC: sC,
+    "support": lambda sAC, sA, sC: sAC,
+    "confidence": lambda sAC, sA, sC: sAC / sA,
+    "lift": lambda sAC, sA, sC: sAC / sA / sC,
+    "leverage": lambda sAC, sA, sC: sAC - sA * sC,
+    "conviction": _conviction,
+    "zhangs_metric": _zhangs_metric,
+}
@@ -0,0 +1,329 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.user_history import UserHistory
+
+# IDの最大値がID数のこの倍数以下の場合は、IDを添字にした対応表でインデックスに変換する
+MAX_TABLE_RATIO = 16
+
+
+class InteractionMatrix:
+    """ユーザー×映画の評価値を保持する疎行列
+
+    ユーザーIDと映画IDは昇順に並べ、0始まりのインデックスを割り当てる。
+    評価値の行列と、評価値が閾値以上かどうかの0/1の行列を一度だけ作成して使い回す。
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        movie_ids: np.ndarray,
+        rating: sparse.csr_matrix,
+        high_rating_threshold: float = 4,
+    ):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.rating = rating
+        self.high_rating_threshold = high_rating_threshold
+        self._binarized: Optional[sparse.csr_matrix] = None
+        self._rating_csc: Optional[sparse.csc_matrix] = None
+        self._user_table: Optional[np.ndarray] = None
+        self._movie_table: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(
+        cls, ratings: pd.DataFrame, high_rating_threshold: float = 4
+    ) -> "InteractionMatrix":
+        """評価データから行列を作成する
+
+        Args:
+            ratings (pd.DataFrame): user_id, movie_id, ratingを持つ評価データ
+            high_rating_threshold (float): 高評価とみなす評価値の閾値
+
+        Returns:
+            InteractionMatrix: ユーザー×映画の行列
+        """
+        user_ids, user_index = np.unique(
+            ratings.user_id.to_numpy(), return_inverse=True
+        )
+        movie_ids, movie_index = np.unique(
+            ratings.movie_id.to_numpy(), return_inverse=True
+        )
+        # 評価し直した組はDataLoaderが最新の評価だけにしているため、重複はないものとする
+        rating = sparse.csr_matrix(
+            (
+                ratings.rating.to_numpy(dtype=np.float32),
+                (user_index.astype(np.int32), movie_index.astype(np.int32)),
+            ),
+            shape=(len(user_ids), len(movie_ids)),
+        )
+        rating.sort_indices()
+        return cls(user_ids, movie_ids, rating, high_rating_threshold)
+
+    @classmethod
+    def from_history(
+        cls, history: UserHistory, high_rating_threshold: float = 4
+    ) -> "InteractionMatrix":
+        """ユーザーごとの履歴から行列を作成する
+
+        履歴はユーザーの昇順に並んでいるため、ユーザーの区切り位置をそのまま行の区切りに使い、
+        各行の中だけを映画のインデックスの順に並べ替える。
+
+        Args:
+            history (UserHistory): ユーザーごとの評価の履歴
+            high_rating_threshold (float): 高評価とみなす評価値の閾値
+
+        Returns:
+            InteractionMatrix: ユーザー×映画の行列
+        """
+        movie_ids, movie_index = np.unique(history.movie_ids, return_inverse=True)
+        index_dtype = np.int32 if len(history) <= np.iinfo(np.int32).max else np.int64
+        rating = sparse.csr_matrix(
+            (
+                history.ratings.astype(np.float32),
+                movie_index.astype(index_dtype),
+                history.indptr.astype(index_dtype),
+            ),
+            shape=(len(history.user_ids), len(movie_ids)),
+        )
+        rating.sort_indices()
+        return cls(history.user_ids, movie_ids, rating, high_rating_threshold)
+
+    @classmethod
+    def from_arrays(
+        cls, arrays: Dict[str, np.ndarray], high_rating_threshold: float = 4
+    ) -> "InteractionMatrix":
+        """to_arraysで取り出した配列から行列を復元する
+
+        Args:
+            arrays (Dict[str, np.ndarray]): 配列名と配列
+            high_rating_threshold (float): 高評価とみなす評価値の閾値
+
+        Returns:
+            InteractionMatrix: ユーザー×映画の行列
+        """
+        user_ids, movie_ids = arrays["user_ids"], arrays["movie_ids"]
+        rating = sparse.csr_matrix(
+            (arrays["rating"], arrays["indices"], arrays["indptr"]),
+            shape=(len(user_ids), len(movie_ids)),
+        )
+        return cls(user_ids, movie_ids, rating, high_rating_threshold)
+
+    def append(self, ratings: pd.DataFrame) -> "InteractionMatrix":
+        """新しい評価を加えた行列を作成する
+
+        新しいユーザーと映画は、IDの昇順を保つ位置に行と列を挿入する。
+        既存の評価は並べ替えずに行と列の位置をずらすだけにする。同じユーザーと映画の組の評価は
+        latest_rating_maskで最新の評価だけを残し、評価済みの組は評価値を足さずに置き換える。
+
+        Args:
+            ratings (pd.DataFrame): user_id, movie_id, rating, timestampを持つ新しい評価データ
+
+        Returns:
+            InteractionMatrix: 新しい評価を加えた行列
+        """
+        ratings = ratings[latest_rating_mask(ratings)]
+        new_user_ids = ratings.user_id.to_numpy()
+        new_movie_ids = ratings.movie_id.to_numpy()
+        user_ids = np.union1d(self.user_ids, new_user_ids).astype(self.user_ids.dtype)
+        movie_ids = np.union1d(self.movie_ids, new_movie_ids).astype(
+            self.movie_ids.dtype
+        )
+
+        # 既存の行と列を、新しいIDの並びでの位置に移す
+        num_seen = np.zeros(len(user_ids), dtype=np.int64)
+        num_seen[np.searchsorted(user_ids, self.user_ids)] = np.diff(self.rating.indptr)
+        indices = self.rating.indices
+        if len(movie_ids) > len(self.movie_ids):
+            indices = np.searchsorted(movie_ids, self.movie_ids).astype(np.int32)[
+                indices
+            ]
+        shape = (len(user_ids), len(movie_ids))
+        rating = sparse.csr_matrix(
+            (
+                self.rating.data,
+                indices,
+                np.concatenate([[0], np.cumsum(num_seen)]),
+            ),
+            shape=shape,
+        )
+        position = (
+            np.searchsorted(user_ids, new_user_ids).astype(np.int32),
+            np.searchsorted(movie_ids, new_movie_ids).astype(np.int32),
+        )
+        # 評価し直した組は、既存の評価値を消してから新しい評価値を足す
+        touched = sparse.csr_matrix(
+            (np.ones(len(ratings), dtype=np.float32), position), shape=shape
+        )
+        delta = sparse.csr_matrix(
+            (ratings.rating.to_numpy(dtype=np.float32), position), shape=shape
+        )
+        rating = (rating - rating.multiply(touched) + delta).tocsr()
+        rating.sort_indices()
+        return type(self)(user_ids, movie_ids, rating, self.high_rating_threshold)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """保存用に行列を配列に分解する
+
+        Returns:
+            Dict[str, np.ndarray]: 配列名と配列
+        """
+        return {
+            "user_ids": self.user_ids,
+            "movie_ids": self.movie_ids,
+            "indptr": self.rating.indptr,
+            "indices": self.rating.indices,
+            "rating": self.rating.data,
+        }
+
+    @property
+    def shape(self):
+        return self.rating.shape
+
+    @property
+    def binarized(self) -> sparse.csr_matrix:
+        """評価値が閾値以上なら1、それ以外は0の行列"""
+        if self._binarized is None:
+            binarized = self.rating >= self.high_rating_threshold
+            binarized.eliminate_zeros()
+            self._binarized = binarized.astype(np.float32)
+        return self._binarized
+
+    @property
+    def rating_csc(self) -> sparse.csc_matrix:
+        """映画ごとに評価値を取り出すための列方向の行列"""
+        if self._rating_csc is None:
+            self._rating_csc = self.rating.tocsc()
+        return self._rating_csc
+
+    def user_index(self, user_ids) -> np.ndarray:
+        """ユーザーIDを行のインデックスに変換する。存在しないユーザーは-1とする
+
+        Args:
+            user_ids: ユーザーID
+
+        Returns:
+            np.ndarray: 行のインデックス
+        """
+        if self._user_table is None:
+            self._user_table = _index_table(self.user_ids)
+        return _lookup(self.user_ids, self._user_table, user_ids)
+
+    def movie_index(self, movie_ids) -> np.ndarray:
+        """映画IDを列のインデックスに変換する。存在しない映画は-1とする
+
+        Args:
+            movie_ids: 映画ID
+
+        Returns:
+            np.ndarray: 列のインデックス
+        """
+        if self._movie_table is None:
+            self._movie_table = _index_table(self.movie_ids)
+        return _lookup(self.movie_ids, self._movie_table, movie_ids)
+
+    @property
+    def average_score(self) -> float:
+        """全ての評価の平均評価値。評価がない場合は0とする"""
+        return float(self.rating.data.mean()) if self.rating.nnz > 0 else 0.0
+
+    def average_rating(self, user_index: np.ndarray) -> np.ndarray:
+        """ユーザーごとの平均評価値を返す
+
+        Args:
+            user_index (np.ndarray): ユーザーの行インデックス。-1と評価のないユーザーは全体の平均評価値とする
+
+        Returns:
+            np.ndarray: 各ユーザーの平均評価値
+        """
+        user_index = np.asarray(user_index)
+        known = np.flatnonzero(user_index >= 0)
+        rows = self.rating[user_index[known]]
+        num_rated = np.diff(rows.indptr)
+        rated = num_rated > 0
+        results = np.full(len(user_index), self.average_score)
+        results[known[rated]] = (
+            np.asarray(rows.sum(axis=1, dtype=np.float64)).ravel()[rated]
+            / num_rated[rated]
+        )
+        return results
+
+    def rating_at(self, user_ids, movie_ids) -> np.ndarray:
+        """ユーザーと映画の組ごとの評価値を返す。評価していない組は0とする
+
+        Args:
+            user_ids: 各組のユーザーID
+            movie_ids: 各組の映画ID
+
+        Returns:
+            np.ndarray: 各組の評価値
+        """
+        user_index = self.user_index(user_ids)
+        movie_index = self.movie_index(movie_ids)
+        known = np.flatnonzero((user_index >= 0) & (movie_index >= 0))
+        results = np.zeros(len(user_index), dtype=self.rating.dtype)
+        if len(known) > 0:
+            results[known] = np.asarray(
+                self.rating[user_index[known], movie_index[known]]
+            ).ravel()
+        return results
+
+    def seen_movie_index(self, user_index: int) -> np.ndarray:
+        """ユーザーが評価済みの映画の列のインデックスを返す
+
+        Args:
+            user_index (int): 行のインデックス
+
+        Returns:
+            np.ndarray: 評価済みの映画の列のインデックス(昇順)
+        """
+        start, end = self.rating.indptr[user_index], self.rating.indptr[user_index + 1]
+        return self.rating.indices[start:end]
+
+
+def latest_rating_mask(ratings: pd.DataFrame) -> np.ndarray:
+    """同じユーザーと映画の組の評価が複数ある場合に、最新の評価の行だけを残すマスクを返す
+
+    評価し直した組は時刻の最も新しい評価を残し、同じ時刻の場合は後の行を新しいとみなす。
+
+    Args:
+        ratings (pd.DataFrame): user_id, movie_id, timestampを持つ評価データ
+
+    Returns:
+        np.ndarray: 残す行をTrueとするマスク
+    """
+    order = np.argsort(ratings.timestamp.to_numpy(), kind="stable")
+    superseded = (
+        ratings[["user_id", "movie_id"]].iloc[order].duplicated(keep="last").to_numpy()
+    )
+    mask = np.ones(len(ratings), dtype=bool)
+    mask[order[superseded]] = False
+    return mask
+
+
+def _index_table(sorted_ids: np.ndarray) -> np.ndarray:
+    """IDを添字、インデックスを値とする対応表。IDが負や疎らな場合は空の配列とし、二分探索で変換する"""
+    if (
+        len(sorted_ids) == 0
+        or sorted_ids[0] < 0
+        or sorted_ids[-1] > MAX_TABLE_RATIO * len(sorted_ids)
+    ):
+        return np.zeros(0, dtype=np.int64)
+    table = np.full(int(sorted_ids[-1]) + 1, -1, dtype=np.int64)
+    table[sorted_ids] = np.arange(len(sorted_ids))
+    return table
+
+
+def _lookup(sorted_ids: np.ndarray, table: np.ndarray, ids) -> np.ndarray:
+    ids = np.asarray(ids)
+    if len(sorted_ids) == 0:
+        return np.full(ids.shape, -1, dtype=np.int64)
+    if len(table) > 0:
+        # 対応表の範囲外のIDは存在しないものとする
+        index = table[np.clip(ids, 0, len(table) - 1)]
+        return np.where((ids >= 0) & (ids < len(table)), index, -1)
+    index = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[index] == ids, index, -1)
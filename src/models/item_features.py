@@ -0,0 +1,119 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# ジャンルの区切り文字
+GENRE_SEPARATOR = "|"
+
+
+class ItemFeatures:
+    """映画×特徴(ジャンル、タグ)の出現回数の疎行列
+
+    特徴は"genre:<ジャンル>"と"tag:<タグ>"の文字列を昇順に並べた語彙(vocabulary)で整数に符号化し、列番号とする。
+    値はジャンルなら1、タグならその映画にタグが付けられた回数とする。映画IDは昇順に並べる。
+    """
+
+    def __init__(
+        self, movie_ids: np.ndarray, vocabulary: np.ndarray, counts: sparse.csr_matrix
+    ):
+        self.movie_ids = movie_ids
+        self.vocabulary = vocabulary
+        self.counts = counts
+
+    @classmethod
+    def from_frames(cls, movies: pd.DataFrame, tags: pd.DataFrame) -> "ItemFeatures":
+        """映画データとタグデータから特徴の行列を作成する
+
+        Args:
+            movies (pd.DataFrame): movie_idと、`|`区切りの文字列のgenresを持つ映画データ
+            tags (pd.DataFrame): movie_idと、小文字にしたtagを持つタグデータ
+
+        Returns:
+            ItemFeatures: 映画×特徴の行列
+        """
+        movie_ids = np.unique(movies.movie_id.to_numpy())
+        genres = movies[["movie_id", "genres"]].assign(
+            feature=movies.genres.astype(str).str.split(GENRE_SEPARATOR)
+        )
+        genres = genres.explode("feature")
+        tags = tags[tags.tag.notna()]
+        # 映画データにない映画のタグは使わない
+        tags = tags[np.isin(tags.movie_id.to_numpy(), movie_ids)]
+
+        feature_movie_ids = np.concatenate(
+            [genres.movie_id.to_numpy(), tags.movie_id.to_numpy()]
+        )
+        features = np.concatenate(
+            [
+                ("genre:" + genres.feature.astype(str)).to_numpy(),
+                ("tag:" + tags.tag.astype(str)).to_numpy(),
+            ]
+        )
+        vocabulary, feature_index = np.unique(features, return_inverse=True)
+        # 同じ映画と特徴の組は足し合わせ、タグが付けられた回数にする
+        counts = sparse.csr_matrix(
+            (
+                np.ones(len(features), dtype=np.float32),
+                (np.searchsorted(movie_ids, feature_movie_ids), feature_index),
+            ),
+            shape=(len(movie_ids), len(vocabulary)),
+        )
+        counts.sum_duplicates()
+        return cls(movie_ids, vocabulary.astype(str), counts)
+
+    def tfidf(self, movie_ids: Optional[np.ndarray] = None) -> sparse.csr_matrix:
+        """出現回数をTF-IDFで重み付けし、映画ごとにL2正規化した行列
+
+        タグは一部のユーザーが何度も付けることがあるため、出現回数は対数で抑える。
+        IDFは全ての映画で計算してから、指定した映画の行を取り出す。
+
+        Args:
+            movie_ids (Optional[np.ndarray]): 行として取り出す映画ID。特徴のない映画は空の行とする。
+                Noneの場合は全ての映画
+
+        Returns:
+            sparse.csr_matrix: 映画×特徴の行列
+        """
+        # scikit-learnは読み込みに時間がかかるため、TF-IDFを使うときだけ読み込む
+        from sklearn.feature_extraction.text import TfidfTransformer
+
+        weights = sparse.csr_matrix(
+            TfidfTransformer(sublinear_tf=True).fit_transform(self.counts),
+            dtype=np.float32,
+        )
+        if movie_ids is None:
+            return weights
+        return self._rows(weights, movie_ids)
+
+    def genres(self, movie_ids: np.ndarray) -> Tuple[np.ndarray, sparse.csr_matrix]:
+        """指定した映画のジャンルの行列
+
+        Args:
+            movie_ids (np.ndarray): 行として取り出す映画ID。特徴のない映画は空の行とする
+
+        Returns:
+            Tuple[np.ndarray, sparse.csr_matrix]: "genre:<ジャンル>"の名前と、映画×ジャンルの行列(値は1)
+        """
+        is_genre = np.char.startswith(self.vocabulary.astype(str), "genre:")
+        return self.vocabulary[is_genre], self._rows(
+            sparse.csr_matrix(self.counts[:, np.flatnonzero(is_genre)]), movie_ids
+        )
+
+    def _rows(
+        self, matrix: sparse.csr_matrix, movie_ids: np.ndarray
+    ) -> sparse.csr_matrix:
+        # 映画IDの行を取り出し、特徴のない映画は空の行とする
+        movie_ids = np.asarray(movie_ids)
+        position = np.minimum(
+            np.searchsorted(self.movie_ids, movie_ids), max(len(self.movie_ids) - 1, 0)
+        )
+        found = np.zeros(len(movie_ids), dtype=bool)
+        if len(self.movie_ids) > 0:
+            found = self.movie_ids[position] == movie_ids
+        rows = matrix[position]
+        if not found.all():
+            rows = sparse.diags(found.astype(np.float32)) @ rows
+            rows.eliminate_zeros()
+        return sparse.csr_matrix(rows)
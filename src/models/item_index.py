@@ -0,0 +1,147 @@
+import json
+import os
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+# 保存形式を変更した場合はインクリメントし、古いインデックスを読み込まないようにする
+INDEX_VERSION = 1
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+
+class ItemIndex:
+    """アイテムの埋め込みベクトルに対する内積の近傍探索インデックス
+
+    index_typeは以下から選ぶ。
+    - flat: 全件の内積を計算する厳密な探索
+    - ivf: ベクトルをnlist個のクラスタに分け、近いnprobe個のクラスタだけを探索する
+    - hnsw: グラフを辿って探索する。ef_searchが大きいほど正確で遅い
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        index_type: str = "flat",
+        nlist: int = 100,
+        nprobe: int = 10,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"index_type must be one of {INDEX_TYPES}, got {index_type}"
+            )
+        self.dim = dim
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.index = None
+
+    def build(self, item_vectors: np.ndarray) -> "ItemIndex":
+        """アイテムのベクトルからインデックスを作成する
+
+        Args:
+            item_vectors (np.ndarray): アイテム数×dimのベクトル
+
+        Returns:
+            ItemIndex: 作成したインデックス
+        """
+        item_vectors = np.ascontiguousarray(item_vectors, dtype=np.float32)
+        if item_vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"item_vectors must have {self.dim} dims, got {item_vectors.shape[1]}"
+            )
+
+        if self.index_type == "flat":
+            index = faiss.IndexFlatIP(self.dim)
+        elif self.index_type == "ivf":
+            # faissはクラスタあたり39件以上の学習データを推奨しているため、アイテム数に合わせて減らす
+            nlist = max(1, min(self.nlist, len(item_vectors) // 39))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(
+                quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(item_vectors)
+        else:
+            index = faiss.IndexHNSWFlat(
+                self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT
+            )
+        index.add(item_vectors)
+        self.index = index
+        self._set_search_params()
+        return self
+
+    def search(self, user_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ユーザーのベクトルとの内積が大きいアイテムをまとめて探索する
+
+        Args:
+            user_vectors (np.ndarray): ユーザー数×dimのベクトル
+            k (int): ユーザーごとに取得するアイテム数
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: ユーザー×k件の内積と、アイテムのインデックス(見つからない場合は-1)
+        """
+        if self.index is None:
+            raise ValueError("index is not built")
+        user_vectors = np.ascontiguousarray(user_vectors, dtype=np.float32)
+        return self.index.search(user_vectors, k)
+
+    def save(self, path: str) -> None:
+        """インデックスをディレクトリに保存する
+
+        Args:
+            path (str): 保存先のディレクトリ
+        """
+        if self.index is None:
+            raise ValueError("index is not built")
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(path, "index.faiss"))
+        meta = {
+            "version": INDEX_VERSION,
+            "dim": self.dim,
+            "index_type": self.index_type,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "hnsw_m": self.hnsw_m,
+            "ef_search": self.ef_search,
+            "num_items": self.index.ntotal,
+        }
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str) -> "ItemIndex":
+        """保存したインデックスを読み込む
+
+        Args:
+            path (str): 保存先のディレクトリ
+
+        Returns:
+            ItemIndex: 読み込んだインデックス
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] != INDEX_VERSION:
+            raise ValueError(
+                f"index version {meta['version']} is not supported (expected {INDEX_VERSION})"
+            )
+        item_index = cls(
+            dim=meta["dim"],
+            index_type=meta["index_type"],
+            nlist=meta["nlist"],
+            nprobe=meta["nprobe"],
+            hnsw_m=meta["hnsw_m"],
+            ef_search=meta["ef_search"],
+        )
+        item_index.index = faiss.read_index(os.path.join(path, "index.faiss"))
+        item_index._set_search_params()
+        return item_index
+
+    def _set_search_params(self) -> None:
+        if self.index_type == "ivf":
+            self.index.nprobe = self.nprobe
+        elif self.index_type == "hnsw":
+            self.index.hnsw.efSearch = self.ef_search
@@ -0,0 +1,150 @@
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.base_recommender import BaseRecommender
+from src.models.dataset import Dataset
+from src.models.neighbors import (
+    reindex_neighbors,
+    top_k_neighbors,
+    update_neighbors,
+)
+from src.models.top_k import seen_rows, to_user2items, top_k_unseen
+
+
+class ItemKNNRecommender(BaseRecommender):
+    def fit(self, dataset: Dataset, **kwargs) -> "ItemKNNRecommender":
+        """映画ごとに評価値のコサイン類似度が高い映画を求め、上位num_neighbors件の近傍表として保持する
+
+        映画×ユーザーの評価値の行列を映画ごとにL2正規化し、ブロックごとの疎行列の積で類似度を計算する。
+        映画×映画の密な類似度行列は作らない。
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            ItemKNNRecommender: 学習済みのモデル
+        """
+        # 映画ごとに保持する近傍の数
+        num_neighbors = kwargs.get("num_neighbors", 50)
+        # 類似度を計算するスレッド数
+        num_threads = kwargs.get("num_threads", os.cpu_count() or 1)
+        # 一度に類似度を計算する映画の数
+        block_size = kwargs.get("block_size", 1024)
+        self.params = {
+            "num_neighbors": num_neighbors,
+            "num_threads": num_threads,
+            "block_size": block_size,
+        }
+        self.interaction_matrix = dataset.interaction_matrix
+
+        self.neighbors = top_k_neighbors(
+            self._item_vectors(),
+            num_neighbors,
+            block_size=block_size,
+            num_threads=num_threads,
+        )
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "ItemKNNRecommender":
+        """新しい評価のあった映画の類似度だけを計算し直し、近傍表を更新する
+
+        類似度が変わるのは新しい評価のあった映画との組だけのため、update_neighborsで全ての映画の近傍は求め直さない。
+        全ての評価でfitし直した場合と同じ近傍表になる。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            ItemKNNRecommender: 更新したモデル
+        """
+        old_movie_ids = self.interaction_matrix.movie_ids
+        ratings, _ = self._append_ratings(ratings)
+        num_movies = len(self.interaction_matrix.movie_ids)
+        neighbors = reindex_neighbors(
+            self.neighbors,
+            self.interaction_matrix.movie_index(old_movie_ids),
+            num_movies,
+        )
+        self.neighbors = update_neighbors(
+            neighbors,
+            self._item_vectors(),
+            self.interaction_matrix.movie_index(np.unique(ratings.movie_id.to_numpy())),
+            self.params["num_neighbors"],
+            block_size=self.params["block_size"],
+            num_threads=self.params["num_threads"],
+        )
+        return self
+
+    def _item_vectors(self) -> sparse.csr_matrix:
+        """映画×ユーザーの評価値の行列を、映画ごとにL2正規化した行列"""
+        item_vectors = self.interaction_matrix.rating_csc.T.tocsr()
+        norms = np.sqrt(np.asarray(item_vectors.multiply(item_vectors).sum(axis=1)))
+        return (
+            sparse.diags(
+                np.divide(
+                    1, norms.ravel(), out=np.zeros(len(norms)), where=norms.ravel() > 0
+                )
+            )
+            @ item_vectors
+        )
+
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
+        # ユーザーが評価した映画の近傍を集め、評価値で重み付けした類似度の和をスコアとする
+        # ユーザーのブロックごとに、評価値の行×近傍表の疎行列の積で計算する
+        user_ids = np.asarray(user_ids)
+        rating = self.interaction_matrix.rating
+        num_movies = len(self.interaction_matrix.movie_ids)
+
+        def scores(user_index: np.ndarray) -> np.ndarray:
+            block_scores = (seen_rows(rating, user_index) @ self.neighbors).tocsr()
+            # 近傍に現れない映画は推薦しない
+            block = np.full((len(user_index), num_movies), -np.inf, dtype=np.float32)
+            rows = np.repeat(np.arange(len(user_index)), np.diff(block_scores.indptr))
+            block[rows, block_scores.indices] = block_scores.data
+            return block
+
+        top_items = top_k_unseen(
+            scores,
+            rating,
+            k=k,
+            user_index=self.interaction_matrix.user_index(user_ids),
+        )
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # 予測する映画の近傍のうちユーザーが評価した映画について、類似度で重み付けした評価値の平均を予測値とする
+        # 近傍に評価した映画がない場合はユーザーの平均評価値、学習データにないユーザーは全体の平均とする
+        user_index = self.interaction_matrix.user_index(user_ids)
+        movie_index = self.interaction_matrix.movie_index(movie_ids)
+        pred_results = self.interaction_matrix.average_rating(user_index)
+
+        known = np.flatnonzero((user_index >= 0) & (movie_index >= 0))
+        neighbor_rows = self.neighbors[movie_index[known]]
+        user_rows = self.interaction_matrix.rating[user_index[known]]
+        weighted = np.asarray(neighbor_rows.multiply(user_rows).sum(axis=1)).ravel()
+        weights = np.asarray(neighbor_rows.multiply(user_rows > 0).sum(axis=1)).ravel()
+        found = weights > 0
+        pred_results[known[found]] = weighted[found] / weights[found]
+        return pred_results.astype(np.float32)
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "neighbor_indptr": self.neighbors.indptr,
+            "neighbor_indices": self.neighbors.indices,
+            "neighbor_scores": self.neighbors.data,
+        }
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        num_movies = len(self.interaction_matrix.movie_ids)
+        self.neighbors = sparse.csr_matrix(
+            (
+                arrays["neighbor_scores"],
+                arrays["neighbor_indices"],
+                arrays["neighbor_indptr"],
+            ),
+            shape=(num_movies, num_movies),
+        )
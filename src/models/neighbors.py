@@ -0,0 +1,234 @@
+"""疎なベクトルの近傍を、アイテム×アイテムの疎行列として事前計算する
+
+行ベクトルどうしの内積をブロックごとに疎行列の積で計算し、各行について内積の大きい上位k件だけを残す。
+ユーザーの評価した映画×近傍の行列との積で、全ユーザー分の「評価した映画に似た映画」のスコアをまとめて計算できる。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+def top_k_neighbors(
+    vectors: sparse.spmatrix,
+    k: int,
+    block_size: int = 1024,
+    num_threads: int = 1,
+    rows: Optional[np.ndarray] = None,
+) -> sparse.csr_matrix:
+    """各行について、内積が正で大きい上位k件の行(自分自身を除く)を求める
+
+    行ベクトルをL2正規化しておけば、内積はコサイン類似度になる。
+    ブロックごとの計算は独立しているため、num_threads個のスレッドで並列に計算する
+    (疎行列の積とargpartitionはGILを解放する)。
+
+    Args:
+        vectors (sparse.spmatrix): 行×特徴の行列
+        k (int): 残す近傍の数
+        block_size (int): 一度に内積を計算する行数
+        num_threads (int): 並列に計算するスレッド数
+        rows (Optional[np.ndarray]): 近傍を求める行。Noneの場合は全ての行で、
+            指定した場合はそれ以外の行を空の行とする
+
+    Returns:
+        sparse.csr_matrix: 行×行の行列。値は内積(float32)で、各行は内積の降順に並ぶ
+    """
+    vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+    num_rows = vectors.shape[0]
+    vectors_t = vectors.T.tocsc()
+    query = np.arange(num_rows) if rows is None else np.unique(rows)
+    starts = range(0, len(query), block_size)
+
+    def run(start: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return _block_neighbors(
+            vectors, vectors_t, query[start : start + block_size], k
+        )
+
+    blocks = _map_blocks(run, starts, num_threads)
+    num_neighbors = np.zeros(num_rows, dtype=np.int64)
+    num_neighbors[query] = np.concatenate(
+        [counts for counts, _, _ in blocks] or [np.zeros(0, np.int64)]
+    )
+    return sparse.csr_matrix(
+        (
+            np.concatenate(
+                [data for _, _, data in blocks] or [np.zeros(0, np.float32)]
+            ),
+            np.concatenate(
+                [indices for _, indices, _ in blocks] or [np.zeros(0, np.int32)]
+            ),
+            np.concatenate([[0], np.cumsum(num_neighbors)]),
+        ),
+        shape=(num_rows, num_rows),
+    )
+
+
+def reindex_neighbors(
+    neighbors: sparse.csr_matrix, index: np.ndarray, num_rows: int
+) -> sparse.csr_matrix:
+    """近傍表の行と列を、行が増えた後の並びでの位置に移す
+
+    各行の近傍の順番(内積の降順)は変えない。新しく加わった行は空の行とする。
+
+    Args:
+        neighbors (sparse.csr_matrix): 行×行の近傍表
+        index (np.ndarray): 既存の各行の、行が増えた後の位置
+        num_rows (int): 行が増えた後の行数
+
+    Returns:
+        sparse.csr_matrix: num_rows×num_rowsの近傍表
+    """
+    num_neighbors = np.zeros(num_rows, dtype=np.int64)
+    num_neighbors[index] = np.diff(neighbors.indptr)
+    return sparse.csr_matrix(
+        (
+            neighbors.data,
+            np.asarray(index, dtype=np.int32)[neighbors.indices],
+            np.concatenate([[0], np.cumsum(num_neighbors)]),
+        ),
+        shape=(num_rows, num_rows),
+    )
+
+
+def update_neighbors(
+    neighbors: sparse.csr_matrix,
+    vectors: sparse.spmatrix,
+    changed: np.ndarray,
+    k: int,
+    block_size: int = 1024,
+    num_threads: int = 1,
+) -> sparse.csr_matrix:
+    """一部の行ベクトルが変わった(または加わった)場合に、近傍表を全ての行で求め直さずに更新する
+
+    内積が変わるのは、少なくとも一方のベクトルが変わった組だけである。変わった行は全ての行との内積で求め直す。
+    変わっていない行は、これまでの近傍のうち変わっていない行と、変わった行との新しい内積を候補とする。
+    候補にない行との内積はこれまでのk番目の近傍の内積以下のため、その値以上の候補がk件あれば
+    候補から上位k件を選べばよく、足りない行だけを求め直す。
+    内積が同じ近傍の順番を除いて、全ての行で求め直した場合と同じ近傍表になる。
+
+    Args:
+        neighbors (sparse.csr_matrix): 変わる前のベクトルで求めた近傍表(reindex_neighborsで新しい並びに移したもの)
+        vectors (sparse.spmatrix): 変わった後の行×特徴の行列
+        changed (np.ndarray): ベクトルが変わった行
+        k (int): 残す近傍の数
+        block_size (int): 一度に内積を計算する行数
+        num_threads (int): 並列に計算するスレッド数
+
+    Returns:
+        sparse.csr_matrix: 行×行の行列。値は内積(float32)で、各行は内積の降順に並ぶ
+    """
+    vectors = sparse.csr_matrix(vectors, dtype=np.float32)
+    num_rows = vectors.shape[0]
+    vectors_t = vectors.T.tocsc()
+    changed = np.unique(changed)
+    is_changed = np.zeros(num_rows, dtype=bool)
+    is_changed[changed] = True
+    # 近傍がk件あった行はk番目の内積を閾値とする。k件なかった行は内積が正の行を全て近傍に持っていた
+    full = np.diff(neighbors.indptr) >= k
+    threshold = np.zeros(num_rows, dtype=np.float32)
+    threshold[full] = neighbors.data[neighbors.indptr[1:][full] - 1]
+
+    def run(start: int) -> Tuple[np.ndarray, ...]:
+        block_rows = changed[start : start + block_size]
+        block = (vectors[block_rows] @ vectors_t).toarray()
+        # 内積は対称なため、変わった行の行ベクトルとの内積から、変わっていない行の候補も取り出す
+        rows, cols = np.nonzero((block >= threshold) & (block > 0) & ~is_changed)
+        candidates = (cols, block_rows[rows], block[rows, cols])
+        counts, indices, data = _block_top_k(block, block_rows, k)
+        return (np.repeat(block_rows, counts), indices, data), candidates
+
+    old = neighbors.tocoo()
+    kept = ~is_changed[old.row] & ~is_changed[old.col]
+    changed_entries = [(np.zeros(0, np.int64), np.zeros(0, np.int32), old.data[:0])]
+    candidate_entries = [(old.row[kept], old.col[kept], old.data[kept])]
+    starts = range(0, len(changed), block_size)
+    for top_k, candidates in _map_blocks(run, starts, num_threads):
+        changed_entries.append(top_k)
+        candidate_entries.append(candidates)
+    changed_rows, changed_cols, changed_scores = map(
+        np.concatenate, zip(*changed_entries)
+    )
+    rows, cols, scores = map(np.concatenate, zip(*candidate_entries))
+
+    # 閾値以上の候補がk件に足りない行だけを、全ての行との内積で求め直す
+    num_candidates = np.bincount(rows[scores >= threshold[rows]], minlength=num_rows)
+    recompute = ~is_changed & full & (num_candidates < k)
+    recomputed = top_k_neighbors(
+        vectors,
+        k,
+        block_size=block_size,
+        num_threads=num_threads,
+        rows=np.flatnonzero(recompute),
+    ).tocoo()
+    candidate = ~recompute[rows]
+    return _top_k_entries(
+        np.concatenate([rows[candidate], changed_rows, recomputed.row]),
+        np.concatenate([cols[candidate], changed_cols, recomputed.col]),
+        np.concatenate([scores[candidate], changed_scores, recomputed.data]),
+        k,
+        num_rows,
+    )
+
+
+def _map_blocks(run: Callable[[int], Any], starts: range, num_threads: int) -> list:
+    """ブロックの先頭の位置ごとにrunを実行する。num_threadsが2以上の場合はスレッドで並列に実行する"""
+    if num_threads > 1:
+        with ThreadPoolExecutor(num_threads) as executor:
+            return list(executor.map(run, starts))
+    return [run(start) for start in starts]
+
+
+def _top_k_entries(
+    rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, k: int, num_rows: int
+) -> sparse.csr_matrix:
+    """行、列、内積の組から、各行について内積の大きい上位k件を内積の降順に並べた近傍表を作る"""
+    # top_k_neighborsと同じく、内積の降順、同じ内積なら列番号の昇順に並べる
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    num_entries = np.bincount(rows, minlength=num_rows)
+    starts = np.concatenate([[0], np.cumsum(num_entries)])
+    top = np.arange(len(rows)) - starts[rows] < k
+    return sparse.csr_matrix(
+        (
+            scores[top],
+            cols[top].astype(np.int32),
+            np.concatenate([[0], np.cumsum(np.minimum(num_entries, k))]),
+        ),
+        shape=(num_rows, num_rows),
+    )
+
+
+def _block_neighbors(
+    vectors: sparse.csr_matrix,
+    vectors_t: sparse.csc_matrix,
+    rows: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """指定した各行について、上位k件の近傍の数、行番号、内積を返す"""
+    block = (vectors[rows] @ vectors_t).toarray()
+    return _block_top_k(block, rows, k)
+
+
+def _block_top_k(
+    block: np.ndarray, rows: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """内積のブロック(指定した行×全ての行)から、各行の上位k件の近傍の数、行番号、内積を返す"""
+    num_rows = block.shape[1]
+    block[np.arange(len(rows)), rows] = 0
+    width = min(k, num_rows)
+    if width < num_rows:
+        candidates = np.argpartition(block, num_rows - width, axis=1)[:, -width:]
+    else:
+        candidates = np.broadcast_to(np.arange(num_rows), block.shape)
+    scores = np.take_along_axis(block, candidates, axis=1)
+    # 内積の降順、同じ内積なら行番号の昇順に並べ、内積が正の近傍だけを残す
+    order = np.lexsort((candidates, -scores))
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    positive = scores > 0
+    return (
+        positive.sum(axis=1),
+        candidates[positive].astype(np.int32),
+        scores[positive].astype(np.float32),
+    )
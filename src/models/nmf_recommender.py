@@ -1,47 +1,145 @@
-from collections import defaultdict
-
-import faiss
 import numpy as np
-from loguru import logger
-from sklearn.decomposition import NMF
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import NMF, non_negative_factorization
 
-from models.dataset import Dataset
-from models.recommend_result import RecommendResult
-from src.models.base_recommender import BaseRecommender
 from src.models.dataset import Dataset
-from src.models.recommend_result import RecommendResult
+from src.models.factor_recommender import FactorRecommender
+
+
+class NMFRecommender(FactorRecommender):
+    def fit(self, dataset: Dataset, **kwargs) -> "NMFRecommender":
+        """非負値行列分解でユーザーと映画の因子を学習する
 
+        Args:
+            dataset (Dataset): データセット
 
-class NMFRecommender(BaseRecommender):
-    def recommend(self, dataset: Dataset, **kwargs) -> RecommendResult:
+        Returns:
+            NMFRecommender: 学習済みのモデル
+        """
         fillna_with_zero = kwargs.get("fillna_with_zero", True)
         factors = kwargs.get("factors", 5)
+        # 予測評価値をユーザーのブロックごとに計算する際に使うメモリの上限(MB)
+        memory_budget_mb = kwargs.get("memory_budget_mb", 256)
+        # 映画の埋め込みの近傍探索インデックスの種類(flat, ivf, hnsw)
+        index_type = kwargs.get("index_type", "flat")
+        # 指定した場合は、近傍探索で取得した候補の中から推薦する。Noneの場合は全映画から推薦する
+        num_candidates = kwargs.get("num_candidates")
+        self.params = {
+            "fillna_with_zero": fillna_with_zero,
+            "factors": factors,
+            "memory_budget_mb": memory_budget_mb,
+            "index_type": index_type,
+            "num_candidates": num_candidates,
+        }
+
+        self.interaction_matrix = dataset.interaction_matrix
+        self.average_score = float(dataset.train.rating.mean())
+
+        nmf = NMF(n_components=factors)
+        self.user_factors = nmf.fit_transform(
+            self._training_matrix(self.interaction_matrix.rating)
+        ).astype(np.float32)
+        self.item_factors = nmf.components_.T.astype(np.float32)
+
+        self._build_item_index()
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "NMFRecommender":
+        """新しい評価の分だけ因子を更新する
+
+        既定では映画の因子を固定したまま、新しい評価のあったユーザーの因子だけを解き直し(fold-in)、
+        新しい映画の因子はユーザーの因子を固定して解く。refit=Trueの場合は、更新した因子を初期値にして
+        全体を分解し直す(warm start)。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
 
-        user_movie_matrix = dataset.train.pivot_table(
-            index="user_id", columns="movie_id", values="rating"
+        Returns:
+            NMFRecommender: 更新したモデル
+        """
+        # 全体を分解し直すかどうかと、その場合の反復回数の上限
+        refit = kwargs.get("refit", False)
+        max_iter = kwargs.get("max_iter", 200)
+
+        old_matrix = self.interaction_matrix
+        ratings, previous = self._append_ratings(ratings)
+        matrix = self.interaction_matrix.rating
+        # 評価し直した組は、元の評価値を新しい評価値に置き換えて平均し直す
+        num_old_ratings = old_matrix.rating.nnz
+        self.average_score = (
+            self.average_score * num_old_ratings
+            + float((ratings.rating.to_numpy(dtype=np.float64) - previous).sum())
+        ) / max(matrix.nnz, 1)
+
+        # 既存の因子を、新しいユーザーと映画の並びでの位置に移す
+        user_factors = np.zeros((matrix.shape[0], self.params["factors"]), np.float32)
+        user_factors[
+            self.interaction_matrix.user_index(old_matrix.user_ids)
+        ] = self.user_factors
+        item_factors = np.zeros((matrix.shape[1], self.params["factors"]), np.float32)
+        item_factors[
+            self.interaction_matrix.movie_index(old_matrix.movie_ids)
+        ] = self.item_factors
+
+        # 新しい評価のあったユーザーの因子を、映画の因子を固定して解き直す
+        user_index = self.interaction_matrix.user_index(
+            np.unique(ratings.user_id.to_numpy())
         )
-        user_id2index = dict(
-            zip(user_movie_matrix.index, range(len(user_movie_matrix)))
+        user_factors[user_index] = _fold_in(
+            self._training_matrix(matrix[user_index]), item_factors
         )
-        movie_id2index = dict(
-            zip(user_movie_matrix.columns, range(len(user_movie_matrix.columns)))
+        # 新しい映画の因子を、ユーザーの因子を固定して解く
+        new_movies = np.flatnonzero(
+            ~np.isin(self.interaction_matrix.movie_ids, old_matrix.movie_ids)
         )
+        if len(new_movies) > 0:
+            item_factors[new_movies] = _fold_in(
+                self._training_matrix(matrix[:, new_movies]).T, user_factors
+            )
 
-        if fillna_with_zero:
-            matrix = user_movie_matrix.fillna(0).to_numpy()
-        else:
-            matrix = user_movie_matrix.fillna(dataset.train.rating.mean()).to_numpy()
+        if refit:
+            nmf = NMF(
+                n_components=self.params["factors"], init="custom", max_iter=max_iter
+            )
+            training_matrix = self._training_matrix(matrix).astype(np.float32)
+            user_factors = nmf.fit_transform(
+                training_matrix, W=user_factors, H=np.ascontiguousarray(item_factors.T)
+            ).astype(np.float32)
+            item_factors = nmf.components_.T.astype(np.float32)
 
-        nmf = NMF(n_components=factors)
-        nmf.fit(matrix)
-        P = nmf.fit_transform(matrix)
-        Q = nmf.components_
-        movie_mat = nmf.components_.T
-
-        pred_matrix = np.dot(P, Q)
-        average_score = dataset.train.rating.mean()
-
-        movie_index = faiss.IndexFlatIP(5)
-        logger.info(movie_mat.astype("float32"))
-        movie_index.add(movie_mat.astype("float32"))
-        faiss.write_index(movie_index, "features.index")
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        if refit or len(new_movies) > 0:
+            self._build_item_index()
+        return self
+
+    def _training_matrix(self, rating: sparse.spmatrix):
+        """学習に使う行列。欠損値を0とみなさない場合は、密行列にして平均評価値で埋める"""
+        if self.params["fillna_with_zero"]:
+            # 欠損値を0とみなす場合は疎行列のまま学習する
+            return rating
+        matrix = rating.toarray()
+        matrix[matrix == 0] = self.average_score
+        return matrix
+
+
+def _fold_in(matrix, fixed_factors: np.ndarray) -> np.ndarray:
+    """もう一方の因子を固定し、行列の各行の非負の因子を解く
+
+    Args:
+        matrix: 行×列の評価値の行列(疎行列または密行列)
+        fixed_factors (np.ndarray): 列×因子数の固定する因子
+
+    Returns:
+        np.ndarray: 行×因子数の因子
+    """
+    if matrix.shape[0] == 0:
+        return np.zeros((0, fixed_factors.shape[1]), np.float32)
+    factors, _, _ = non_negative_factorization(
+        matrix.astype(np.float32),
+        H=np.ascontiguousarray(fixed_factors.T, dtype=np.float32),
+        n_components=fixed_factors.shape[1],
+        update_H=False,
+    )
+    return factors.astype(np.float32)
@@ -1,54 +1,293 @@
-from collections import defaultdict
+from typing import Dict, List, Optional
 
 import numpy as np
-from loguru import logger
+import pandas as pd
+from scipy import sparse
 
 from src.models.base_recommender import BaseRecommender
 from src.models.dataset import Dataset
-from src.models.recommend_result import RecommendResult
+from src.models.item_features import ItemFeatures
+from src.models.streaming_aggregates import StreamingAggregates
+from src.models.top_k import to_user2items, top_k_ranked
 
 
 class PopularityRecommender(BaseRecommender):
-    def recommend(self, dataset: Dataset, **kwargs) -> RecommendResult:
+    def fit(self, dataset: Dataset, **kwargs) -> "PopularityRecommender":
+        """各映画の平均評価値を計算し、評価数が閾値以上の映画を平均評価値の高い順に並べる
+
+        全体のランキングに加えて、ジャンルごと、直近の期間ごと、時間で減衰させた評価によるランキング
+        (セグメント)も作成しておく。セグメントは"genre:<ジャンル>"、"last_<日数>d"、"trending"の名前で、
+        recommendのsegmentに指定する。期間と減衰の集計は新しい評価の分だけ更新できる形で保持する。
+
+        Args:
+            dataset (Dataset): データセット
+
+        Returns:
+            PopularityRecommender: 学習済みのモデル
+        """
         # 評価値の閾値
         minimum_num_rating = kwargs.get("minimum_num_rating", 200)
-        # 各アイテムごとの平均の評価値を計算し、その平均評価値を予測値とする。
+        # 直近の期間のランキングを作る日数と、減衰の半減期(日)
+        time_windows = list(kwargs.get("time_windows", [7, 30]))
+        half_life_days = kwargs.get("half_life_days", 7)
+        # 期間内の評価数(減衰させた評価数)の閾値
+        window_minimum_num_rating = kwargs.get("window_minimum_num_rating", 10)
+        self.params = {
+            "minimum_num_rating": minimum_num_rating,
+            "time_windows": time_windows,
+            "half_life_days": half_life_days,
+            "window_minimum_num_rating": window_minimum_num_rating,
+        }
+        self.interaction_matrix = dataset.interaction_matrix
+        num_movies = len(self.interaction_matrix.movie_ids)
+
+        # 各アイテムごとの評価数と評価値の合計を一度の集計で求めて保持し、新しい評価の分だけ足して更新できるようにする
+        movie_index = self.interaction_matrix.movie_index(
+            dataset.train.movie_id.to_numpy()
+        )
+        ratings = dataset.train.rating.to_numpy(dtype=np.float64)
+        self.movie_rating_count = np.bincount(movie_index, minlength=num_movies)
+        self.movie_rating_sum = np.bincount(
+            movie_index, weights=ratings, minlength=num_movies
+        )
 
-        movie_rating_average = dataset.train.groupby("movie_id").agg(
-            {"rating": np.mean}
+        # ジャンルごとの映画。ランキングは全体のランキングからジャンルの映画を抜き出して作る
+        self.genre_names, genre_matrix = dataset.item_features.genres(
+            self.interaction_matrix.movie_ids
+        )
+        genre_matrix = sparse.csc_matrix(genre_matrix)
+        self.genre_indptr = genre_matrix.indptr
+        self.genre_movies = genre_matrix.indices
+
+        # 直近の期間と減衰の集計。期間は学習データの最新の評価の時刻から数える
+        self.aggregates = StreamingAggregates.from_events(
+            movie_index,
+            ratings,
+            dataset.train.timestamp.to_numpy(),
+            num_movies,
+            half_life_days,
+            time_windows,
+        )
+
+        self._rank_movies()
+        return self
+
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "PopularityRecommender":
+        """新しい評価の分だけ、各映画の評価数と評価値の合計を足して並べ直す
+
+        評価し直した組は評価数を増やさず、評価値の合計の元の評価値を新しい評価値に置き換える。
+        直近の期間と減衰の集計も、新しい評価を足して最新の評価の時刻まで進める。期間と減衰の集計は
+        評価のイベントの数で、元の評価の時刻は保持していないため、評価し直した組は新しいイベントとして足す。
+        新しい映画は、item_featuresで渡したItemFeaturesのジャンルでジャンルごとのランキングに加える。
+        item_featuresを渡さない場合は、新しい映画はどのジャンルのランキングにも含めない。
+
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            PopularityRecommender: 更新したモデル
+        """
+        # 新しい映画のジャンル(ItemFeatures)
+        item_features = kwargs.get("item_features")
+
+        old_movie_ids = self.interaction_matrix.movie_ids
+        ratings, previous = self._append_ratings(ratings)
+        num_movies = len(self.interaction_matrix.movie_ids)
+        movie_index = self.interaction_matrix.movie_index(old_movie_ids)
+
+        count = np.zeros(num_movies, dtype=np.int64)
+        count[movie_index] = self.movie_rating_count
+        rating_sum = np.zeros(num_movies)
+        rating_sum[movie_index] = self.movie_rating_sum
+        new_index = self.interaction_matrix.movie_index(ratings.movie_id.to_numpy())
+        count += np.bincount(new_index[previous == 0], minlength=num_movies)
+        rating_sum += np.bincount(
+            new_index,
+            weights=ratings.rating.to_numpy(dtype=np.float64) - previous,
+            minlength=num_movies,
+        )
+        self.movie_rating_count = count
+        self.movie_rating_sum = rating_sum
+        # 保持している映画のインデックスを、新しい映画の並びでの位置に移す
+        self.genre_movies = movie_index[self.genre_movies]
+        new_movies = np.flatnonzero(
+            ~np.isin(self.interaction_matrix.movie_ids, old_movie_ids)
+        )
+        if len(new_movies) > 0 and item_features is not None:
+            self._add_genre_movies(item_features, new_movies)
+        self.aggregates.resize(movie_index, num_movies)
+        self.aggregates.update(
+            new_index,
+            ratings.rating.to_numpy(dtype=np.float64),
+            ratings.timestamp.to_numpy(),
+        )
+        self._rank_movies()
+        return self
+
+    def _add_genre_movies(
+        self, item_features: ItemFeatures, new_movies: np.ndarray
+    ) -> None:
+        """新しい映画を、そのジャンルの映画に加える(初めて現れたジャンルも加える)"""
+        genre_names, genre_matrix = item_features.genres(
+            self.interaction_matrix.movie_ids[new_movies]
+        )
+        names = np.union1d(self.genre_names.astype(str), genre_names.astype(str))
+        genre_matrix = sparse.coo_matrix(genre_matrix)
+        genres = np.concatenate(
+            [
+                np.repeat(
+                    np.searchsorted(names, self.genre_names.astype(str)),
+                    np.diff(self.genre_indptr),
+                ),
+                np.searchsorted(names, genre_names.astype(str))[genre_matrix.col],
+            ]
+        )
+        movies = np.concatenate([self.genre_movies, new_movies[genre_matrix.row]])
+        # fitと同じく、映画×ジャンルの行列をCSC形式にした区切り位置と行番号で持つ
+        genre_matrix = sparse.csc_matrix(
+            (np.ones(len(movies)), (movies, genres)),
+            shape=(len(self.interaction_matrix.movie_ids), len(names)),
+        )
+        self.genre_names = names
+        self.genre_indptr = genre_matrix.indptr
+        self.genre_movies = genre_matrix.indices
+
+    def _rank_movies(self) -> None:
+        """評価数と評価値の合計から、平均評価値と推薦する順番を計算する"""
+        # 各アイテムごとの平均の評価値を計算し、その平均評価値を予測値とする。
+        rated = self.movie_rating_count > 0
+        self.movie_rating_average = np.zeros(len(self.movie_rating_count))
+        self.movie_rating_average[rated] = (
+            self.movie_rating_sum[rated] / self.movie_rating_count[rated]
         )
 
-        # テストデータに予測値を格納する。
-        # テストデータのみに存在するアイテムの予測値評価は0とする。
-        movie_rating_predict = dataset.test.merge(
-            movie_rating_average, on="movie_id", how="left", suffixes=("_test", "_pred")
-        ).fillna(0)
         # 各ユーザーに対するおすすめ映画は、そのユーザーがまだ評価していない映画の中で、
         # 評価値が高いもの10作品とする。
         # ただし、評価値が閾値以上のもののみを対象とする。
-        pred_user2items = defaultdict(list)
-        user_watched_movies = (
-            dataset.train.groupby("user_id")
-            .agg({"movie_id": list})["movie_id"]
-            .to_dict()
+        self.ranked_movies = _rank_by_average(
+            self.movie_rating_count,
+            self.movie_rating_sum,
+            self.params["minimum_num_rating"],
+        )
+
+        # ジャンルごとのランキングは、全体のランキングの順番のままジャンルの映画を抜き出す
+        rankings = []
+        in_genre = np.zeros(len(self.movie_rating_count), dtype=bool)
+        for start, stop in zip(self.genre_indptr[:-1], self.genre_indptr[1:]):
+            in_genre[:] = False
+            in_genre[self.genre_movies[start:stop]] = True
+            rankings.append(self.ranked_movies[in_genre[self.ranked_movies]])
+
+        # 直近の期間ごとと減衰させた評価のランキングは、期間内の評価数が閾値以上の映画を平均評価値の順に並べる
+        minimum_num_rating = self.params["window_minimum_num_rating"]
+        windows_days = self.aggregates.windows_days.tolist()
+        for days in windows_days:
+            rankings.append(
+                _rank_by_average(*self.aggregates.window(days), minimum_num_rating)
+            )
+        rankings.append(
+            _rank_by_average(*self.aggregates.decayed(), minimum_num_rating)
         )
-        movie_stats = dataset.train.groupby("movie_id").agg(
-            {"rating": [np.size, np.mean]}
+
+        # 全てのセグメントのランキングを、区切り位置(indptr)で1つの配列にまとめる
+        self.segment_names = np.concatenate(
+            [
+                self.genre_names.astype(str),
+                np.array([f"last_{days}d" for days in windows_days], dtype=str),
+                np.array(["trending"]),
+            ]
+        )
+        self.segment_indptr = np.concatenate(
+            [[0], np.cumsum([len(ranking) for ranking in rankings], dtype=np.int64)]
         )
-        atleast_flg = movie_stats["rating"]["size"] >= minimum_num_rating
-        movies_sorted_by_rating = (
-            movie_stats[atleast_flg]
-            .sort_values(by=[("rating", "mean")], ascending=False)
-            .index.tolist()
+        self.segment_movies = np.concatenate(
+            rankings or [np.zeros(0, dtype=np.int64)]
+        ).astype(np.int64)
+
+    def recommend(
+        self, user_ids, k: int = 10, segment: Optional[str] = None
+    ) -> Dict[int, List[int]]:
+        """各ユーザーに、まだ評価していない映画を作成済みのランキングの順にk本推薦する
+
+        Args:
+            user_ids: ユーザーID
+            k (int): 推薦する映画の数
+            segment (Optional[str]): ランキングのセグメント名("genre:<ジャンル>"、"last_<日数>d"、"trending")。
+                Noneの場合は全体のランキング
+
+        Returns:
+            Dict[int, List[int]]: キーはユーザーIDで、値はおすすめの映画IDのリスト
+        """
+        # 学習データにないユーザーは評価済みの映画がないものとして推薦する
+        user_ids = np.asarray(user_ids)
+        top_items = top_k_ranked(
+            self._ranking(segment),
+            self.interaction_matrix.rating,
+            k=k,
+            user_index=self.interaction_matrix.user_index(user_ids),
         )
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
 
-        for user_id in dataset.train.user_id.unique():
-            for movie_id in movies_sorted_by_rating:
-                if movie_id not in user_watched_movies[user_id]:
-                    pred_user2items[user_id].append(movie_id)
-                    if len(pred_user2items[user_id]) >= 10:
-                        break
+    def _ranking(self, segment: Optional[str]) -> np.ndarray:
+        if segment is None:
+            return self.ranked_movies
+        position = np.flatnonzero(self.segment_names == segment)
+        if len(position) == 0:
+            raise ValueError(
+                f"unknown segment {segment}, expected one of {self.segment_names.tolist()}"
+            )
+        start, stop = self.segment_indptr[position[0] : position[0] + 2]
+        return self.segment_movies[start:stop]
 
-        return RecommendResult(
-            rating=movie_rating_predict.rating_pred, user2items=pred_user2items
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # テストデータのみに存在するアイテムの予測値評価は0とする。
+        movie_index = self.interaction_matrix.movie_index(movie_ids)
+        return np.where(
+            movie_index >= 0, self.movie_rating_average[movie_index], 0
+        ).astype(np.float32)
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "movie_rating_count": self.movie_rating_count,
+            "movie_rating_sum": self.movie_rating_sum,
+            "movie_rating_average": self.movie_rating_average,
+            "ranked_movies": self.ranked_movies,
+            "genre_names": self.genre_names,
+            "genre_indptr": self.genre_indptr,
+            "genre_movies": self.genre_movies,
+            "segment_names": self.segment_names,
+            "segment_indptr": self.segment_indptr,
+            "segment_movies": self.segment_movies,
+            **{
+                f"stream_{name}": array
+                for name, array in self.aggregates.to_arrays().items()
+            },
+        }
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.movie_rating_count = arrays["movie_rating_count"]
+        self.movie_rating_sum = arrays["movie_rating_sum"]
+        self.movie_rating_average = arrays["movie_rating_average"]
+        self.ranked_movies = arrays["ranked_movies"]
+        self.genre_names = arrays["genre_names"]
+        self.genre_indptr = arrays["genre_indptr"]
+        self.genre_movies = arrays["genre_movies"]
+        self.segment_names = arrays["segment_names"]
+        self.segment_indptr = arrays["segment_indptr"]
+        self.segment_movies = arrays["segment_movies"]
+        self.aggregates = StreamingAggregates.from_arrays(
+            {
+                name[len("stream_") :]: array
+                for name, array in arrays.items()
+                if name.startswith("stream_")
+            }
         )
+
+
+def _rank_by_average(
+    count: np.ndarray, rating_sum: np.ndarray, minimum_num_rating: int
+) -> np.ndarray:
+    """評価数が閾値以上の映画を、平均評価値の降順(同じなら映画のインデックスの昇順)に並べる"""
+    movie_index = np.flatnonzero((count > 0) & (count >= minimum_num_rating))
+    average = rating_sum[movie_index] / count[movie_index]
+    return movie_index[np.argsort(-average, kind="stable")]
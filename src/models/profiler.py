@@ -0,0 +1,306 @@
+import cProfile
+import datetime
+import json
+import os
+import platform
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# cProfileの結果のうち、レポートに載せる関数の数(累積時間の長い順)
+NUM_PROFILED_FUNCTIONS = 20
+# レポートの形式のバージョン。項目を変えたら上げる
+REPORT_VERSION = 1
+
+# 計測中のStageProfiler。Noneの場合、stageは何も計測しない
+_active: Optional["StageProfiler"] = None
+
+
+def peak_rss_mb() -> float:
+    """プロセスのピークRSS(MB)
+
+    spawnはforkしてからexecするため、ru_maxrssには親プロセスのピークが引き継がれる。
+    Linuxではexecで作り直され、reset_peak_rssで区間ごとに戻せる/proc/self/statusのVmHWMを使う。
+    """
+    status = _read_status()
+    if "VmHWM" in status:
+        return status["VmHWM"]
+    # macOSではru_maxrssの単位はバイト
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb() -> float:
+    """プロセスの現在のRSS(MB)。取得できない場合はピークRSSを返す"""
+    return _read_status().get("VmRSS", peak_rss_mb())
+
+
+def reset_peak_rss() -> bool:
+    """ピークRSSを現在のRSSに戻す。Linux以外などで戻せない場合はFalseを返す"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _read_status() -> Dict[str, float]:
+    # /proc/self/statusのメモリの項目(KB)をMBで読む
+    values = {}
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmHWM:", "VmRSS:")):
+                    key, value = line.split()[:2]
+                    values[key.rstrip(":")] = int(value) / 1024
+    return values
+
+
+class StageProfiler:
+    """パイプラインの段階(stage)ごとに時間とメモリを計測し、JSONのレポートにまとめる
+
+    withで有効にしている間、stage(name)で囲んだ区間ごとに、経過時間、CPU時間、RSSとピークRSS、
+    (trace_memoryの場合)tracemallocで追跡したメモリのピーク、呼び出し側が加えた行数やユーザー数を記録する。
+    区間は入れ子にでき、親の区間のピークには子の区間のピークも含める。
+    profile_stagesに指定した名前の区間はcProfileでも計測し、累積時間の長い関数をレポートに載せる。
+    """
+
+    def __init__(
+        self,
+        profile_stages: Sequence[str] = (),
+        trace_memory: bool = False,
+        profile_dir: Optional[str] = None,
+    ):
+        """
+        Args:
+            profile_stages (Sequence[str]): cProfileで計測する区間の名前
+            trace_memory (bool): tracemallocでメモリの割り当てを追跡するかどうか。追跡すると処理が遅くなる
+            profile_dir (Optional[str]): cProfileの結果(.prof)を書き出すディレクトリ。Noneの場合は書き出さない
+        """
+        self.profile_stages = set(profile_stages)
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.stages: List[Dict[str, Any]] = []
+        self.started_at: Optional[str] = None
+        self._stack: List[Dict[str, Any]] = []
+        self._profiling = False
+        # 区間ごとにピークRSSを戻すため、プロセス全体のピークは区間のピークの最大値で持つ
+        self._peak_rss = 0.0
+        self._previous: Optional["StageProfiler"] = None
+
+    def __enter__(self) -> "StageProfiler":
+        global _active
+        self._previous, _active = _active, self
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self._start = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _active
+        _active = self._previous
+        self.wall_sec = time.perf_counter() - self._start
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str, **counts) -> Iterator[Dict[str, Any]]:
+        """区間を計測する。返す辞書に、区間の中で分かった行数などを加えられる
+
+        Args:
+            name (str): 区間の名前
+            **counts: 区間の行数、ユーザー数などのレポートに載せる値
+
+        Yields:
+            Dict[str, Any]: 区間の記録
+        """
+        # 親の区間のここまでのピークを取り出してから、ピークを現在の値に戻す
+        if self._stack:
+            self._collect_peaks(self._stack[-1])
+        record = {
+            "name": name,
+            "path": f"{self._stack[-1]['path']}/{name}" if self._stack else name,
+            **counts,
+        }
+        rss_start = rss_mb()
+        state = {
+            "path": record["path"],
+            "rss_peak_resettable": reset_peak_rss(),
+            "rss_peak": rss_start,
+            "traced_start": 0,
+            "traced_peak": 0,
+        }
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            state["traced_start"] = state[
+                "traced_peak"
+            ] = tracemalloc.get_traced_memory()[0]
+        profile = None
+        if name in self.profile_stages and not self._profiling:
+            profile = cProfile.Profile()
+            self._profiling = True
+
+        self._stack.append(state)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            record["wall_sec"] = time.perf_counter() - wall_start
+            record["cpu_sec"] = time.process_time() - cpu_start
+            self._stack.pop()
+            self._collect_peaks(state)
+            record["rss_mb"] = rss_mb()
+            record["rss_delta_mb"] = record["rss_mb"] - rss_start
+            # ピークRSSを戻せない環境では、プロセス全体のピークになる
+            record["peak_rss_mb"] = state["rss_peak"]
+            record["peak_rss_is_stage"] = state["rss_peak_resettable"]
+            if tracemalloc.is_tracing():
+                record["traced_peak_delta_mb"] = (
+                    state["traced_peak"] - state["traced_start"]
+                ) / 1024**2
+            if profile is not None:
+                record["profile"] = self._summarize_profile(profile, record["path"])
+            self.stages.append(record)
+            self._peak_rss = max(self._peak_rss, state["rss_peak"])
+            # 子の区間のピークを親の区間のピークに含める
+            if self._stack:
+                parent = self._stack[-1]
+                parent["rss_peak"] = max(parent["rss_peak"], state["rss_peak"])
+                parent["traced_peak"] = max(parent["traced_peak"], state["traced_peak"])
+
+    def _collect_peaks(self, state: Dict[str, Any]) -> None:
+        # 区間のここまでのピークを反映する(ピークを戻す前に呼ぶ)
+        state["rss_peak"] = max(state["rss_peak"], peak_rss_mb())
+        if tracemalloc.is_tracing():
+            state["traced_peak"] = max(
+                state["traced_peak"], tracemalloc.get_traced_memory()[1]
+            )
+
+    def _summarize_profile(
+        self, profile: cProfile.Profile, path: str
+    ) -> List[Dict[str, Any]]:
+        # cProfileの結果を累積時間の長い順に並べ、上位の関数をJSONにできる形で返す
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile.dump_stats(
+                os.path.join(self.profile_dir, f"{path.replace('/', '.')}.prof")
+            )
+        stats = pstats.Stats(profile)
+        rows = []
+        for (filename, line, function), values in stats.stats.items():
+            _, num_calls, total_time, cumulative_time, _ = values
+            rows.append(
+                {
+                    "function": f"{filename}:{line}({function})",
+                    "ncalls": num_calls,
+                    "tottime": total_time,
+                    "cumtime": cumulative_time,
+                }
+            )
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:NUM_PROFILED_FUNCTIONS]
+
+    def report(self) -> Dict[str, Any]:
+        """計測結果をJSONにできる辞書にまとめる
+
+        stagesは区間を終了した順の記録で、summaryは同じパスの区間の回数と合計をまとめたもの。
+        実行ごとのレポートのsummaryを比べれば、どの区間が遅くなったか分かる。
+
+        Returns:
+            Dict[str, Any]: 計測結果
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        for record in self.stages:
+            total = summary.setdefault(
+                record["path"],
+                {"calls": 0, "wall_sec": 0.0, "cpu_sec": 0.0, "peak_rss_mb": 0.0},
+            )
+            total["calls"] += 1
+            total["wall_sec"] += record["wall_sec"]
+            total["cpu_sec"] += record["cpu_sec"]
+            total["peak_rss_mb"] = max(total["peak_rss_mb"], record["peak_rss_mb"])
+            if "traced_peak_delta_mb" in record:
+                total["traced_peak_delta_mb"] = max(
+                    total.get("traced_peak_delta_mb", 0.0),
+                    record["traced_peak_delta_mb"],
+                )
+        return {
+            "version": REPORT_VERSION,
+            "started_at": self.started_at,
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "wall_sec": getattr(self, "wall_sec", None),
+            "peak_rss_mb": max(self._peak_rss, peak_rss_mb()),
+            "summary": summary,
+            "stages": self.stages,
+        }
+
+    def write(self, path: str) -> None:
+        """計測結果をJSONファイルに書き出す
+
+        Args:
+            path (str): 書き出し先のパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False, default=str)
+
+
+@contextmanager
+def stage(name: str, **counts) -> Iterator[Dict[str, Any]]:
+    """有効なStageProfilerがあれば、その区間として計測する。なければ何も計測しない
+
+    Args:
+        name (str): 区間の名前
+        **counts: 区間の行数、ユーザー数などのレポートに載せる値
+
+    Yields:
+        Dict[str, Any]: 区間の記録。計測しない場合は捨てられる
+    """
+    if _active is None:
+        yield dict(counts)
+    else:
+        with _active.stage(name, **counts) as record:
+            yield record
+
+
+def compare_reports(
+    before: Dict[str, Any], after: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """2つのレポートのsummaryを区間のパスごとに比べる
+
+    Args:
+        before (Dict[str, Any]): 基準にするレポート
+        after (Dict[str, Any]): 比べるレポート
+
+    Returns:
+        List[Dict[str, Any]]: 区間ごとの経過時間、CPU時間、ピークRSSの前後の値と比
+    """
+    rows = []
+    for path in list(before["summary"]) + [
+        path for path in after["summary"] if path not in before["summary"]
+    ]:
+        row: Dict[str, Any] = {"path": path}
+        for key in ("wall_sec", "cpu_sec", "peak_rss_mb"):
+            old = before["summary"].get(path, {}).get(key)
+            new = after["summary"].get(path, {}).get(key)
+            row[f"{key}_before"] = old
+            row[f"{key}_after"] = new
+            row[f"{key}_ratio"] = new / old if old and new is not None else None
+        rows.append(row)
+    return rows
@@ -1,72 +1,77 @@
-from collections import defaultdict
+from typing import Dict, List
 
 import numpy as np
+import pandas as pd
 
 from src.models.base_recommender import BaseRecommender
 from src.models.dataset import Dataset
-from src.models.recommend_result import RecommendResult
+from src.models.top_k import to_user2items, top_k_unseen
 
 
 class RandomRecommender(BaseRecommender):
-    def recommend(self, dataset: Dataset, **kwargs) -> RecommendResult:
-        """ランダムにレコメンドする
+    def fit(self, dataset: Dataset, **kwargs) -> "RandomRecommender":
+        """ランダムにレコメンドするため、学習データの評価済みの映画だけを保持する
 
         Args:
             dataset (Dataset): データセット
 
         Returns:
-            RecommendResult: レコメンド結果
+            RandomRecommender: 学習済みのモデル
         """
+        # 乱数のシード
+        seed = kwargs.get("seed")
+        self.params = {"seed": seed}
+        self.interaction_matrix = dataset.interaction_matrix
+        self._rng = np.random.default_rng(seed)
+        return self
 
-        # ユーザーIDとアイテムIDに対して、O始まりのインデックスを割り当てる
-        unique_user_ids = sorted(dataset.train.user_id.unique())
-        unique_movie_ids = sorted(dataset.train.movie_id.unique())
-        # ユーザーIDとアイテムIDをインデックスに変換する
-        user_id2index = {user_id: i for i, user_id in enumerate(unique_user_ids)}
-        movie_id2index = {movie_id: i for i, movie_id in enumerate(unique_movie_ids)}
+    def partial_fit(self, ratings: pd.DataFrame, **kwargs) -> "RandomRecommender":
+        """新しい評価を評価済みの映画に加える
 
-        # ユーザー×アイテムの行列で、各セルの予測評価値はO.5〜5.0の一様分布からサンプリングする
-        pred_matrix = np.random.uniform(
-            0.5, 5.0, (len(unique_user_ids), len(unique_movie_ids))
-        )
+        Args:
+            ratings (pd.DataFrame): 新しい評価データ
+
+        Returns:
+            RandomRecommender: 更新したモデル
+        """
+        self._append_ratings(ratings)
+        return self
+
+    def reseed(self, stream: int) -> None:
+        """乱数列を、シードとstreamの番号から作り直す
+
+        書き出しのシャードごとなど、並列に推薦する単位ごとに異なる乱数列を使う場合に呼ぶ。
+        シードを指定した場合は、同じシードとstreamの番号で同じ乱数列になる。
 
-        # RMSE評価用にテストデータに出てくるユーザーとアイテムの予測評価値を格納する
-        movie_rating_predict = dataset.test.copy()
-        pred_results = []
-        for _, row in dataset.test.iterrows():
-            user_id = row["user_id"]
-            # テストデータのアイテムが学習データにない場合も乱数で予測する
-            if row["user_id"] not in user_id2index:
-                pred_results.append(np.random.uniform(0.5, 5.0))
-                continue
-
-            user_index = user_id2index[row["user_id"]]
-            movie_index = movie_id2index[row["movie_id"]]
-            pred_score = pred_matrix[user_index, movie_index]
-            pred_results.append(pred_score)
-        movie_rating_predict["rating"] = pred_results
-
-        # ランキング評価用のデータを作成
+        Args:
+            stream (int): 乱数列の番号
+        """
+        seed = self.params["seed"]
+        self._rng = np.random.default_rng(None if seed is None else [seed, stream])
+
+    def recommend(self, user_ids, k: int = 10) -> Dict[int, List[int]]:
         # 各ユーザーに対するおすすめ映画は、
         # そのユーザーがまだ評価していない映画の中からランダムに10作品を選ぶ
-        # キーはユーザーIDで、値はおすすめの映画IDのリスト
-        pred_user2items = defaultdict(list)
-        # キーはユーザーIDで、値はおすすめの映画IDのリスト
-        user_evaluated_movies = (
-            dataset.train.groupby("user_id")
-            .agg({"movie_id": list})["movie_id"]
-            .to_dict()
-        )
-        for user_id in unique_user_ids:
-            user_index = user_id2index[user_id]
-            movie_indexs = np.argsort(-pred_matrix[user_index, :])
-            for movie_index in movie_indexs:
-                movie_id = unique_movie_ids[movie_index]
-                if movie_id not in user_evaluated_movies[user_id]:
-                    pred_user2items[user_id].append(movie_id)
-                    if len(pred_user2items[user_id]) == 10:
-                        break
-
-        return RecommendResult(
-            rating=movie_rating_predict.rating, user2items=pred_user2items
+        # ユーザー×アイテムの予測評価値の行列は持たず、ブロックごとに乱数を生成する
+        user_ids = np.asarray(user_ids)
+        num_movies = len(self.interaction_matrix.movie_ids)
+        top_items = top_k_unseen(
+            lambda user_index: self._rng.uniform(
+                0.5, 5.0, (len(user_index), num_movies)
+            ),
+            self.interaction_matrix.rating,
+            k=k,
+            user_index=self.interaction_matrix.user_index(user_ids),
         )
+        return to_user2items(top_items, user_ids, self.interaction_matrix.movie_ids)
+
+    def predict(self, user_ids, movie_ids) -> np.ndarray:
+        # 各セルの予測評価値は0.5〜5.0の一様分布からサンプリングする
+        # テストデータのアイテムが学習データにない場合も乱数で予測する
+        return self._rng.uniform(0.5, 5.0, len(np.asarray(user_ids))).astype(np.float32)
+
+    def _to_arrays(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _from_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        self._rng = np.random.default_rng(self.params["seed"])
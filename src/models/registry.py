@@ -0,0 +1,63 @@
+import importlib
+from typing import Dict, List, Type
+
+from src.models.base_recommender import BaseRecommender
+
+# モデル名(クラス名)と、そのクラスを定義するモジュール
+# モジュールはget_model_classで初めて読み込むため、faiss、mlxtend、scikit-learnなどの重い依存は
+# そのモデルを使うときだけ読み込まれる
+MODEL_MODULES: Dict[str, str] = {
+    "ALSRecommender": "src.models.als_recommender",
+    "AssociationRecommender": "src.models.association_recommender",
+    "ContentRecommender": "src.models.content_recommender",
+    "ItemKNNRecommender": "src.models.item_knn_recommender",
+    "NMFRecommender": "src.models.nmf_recommender",
+    "PopularityRecommender": "src.models.popularity_recommender",
+    "RandomRecommender": "src.models.random_recommender",
+}
+
+# CLIなどで指定する短い名前
+MODEL_ALIASES: Dict[str, str] = {
+    "als": "ALSRecommender",
+    "association": "AssociationRecommender",
+    "content": "ContentRecommender",
+    "item_knn": "ItemKNNRecommender",
+    "nmf": "NMFRecommender",
+    "popularity": "PopularityRecommender",
+    "random": "RandomRecommender",
+}
+
+
+def model_names() -> List[str]:
+    """登録されているモデル名(クラス名)"""
+    return sorted(MODEL_MODULES)
+
+
+def resolve_model_name(name: str) -> str:
+    """短い名前またはクラス名から、モデル名(クラス名)を求める
+
+    Args:
+        name (str): 短い名前("popularity"など)またはクラス名
+
+    Returns:
+        str: モデル名(クラス名)
+    """
+    name = MODEL_ALIASES.get(name, name)
+    if name not in MODEL_MODULES:
+        raise ValueError(
+            f"unknown model {name}, expected one of {sorted(MODEL_ALIASES)} or {model_names()}"
+        )
+    return name
+
+
+def get_model_class(name: str) -> Type[BaseRecommender]:
+    """モデルのクラスを、定義するモジュールを読み込んで返す
+
+    Args:
+        name (str): 短い名前("popularity"など)またはクラス名
+
+    Returns:
+        Type[BaseRecommender]: モデルのクラス
+    """
+    name = resolve_model_name(name)
+    return getattr(importlib.import_module(MODEL_MODULES[name]), name)
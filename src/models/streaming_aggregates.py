@@ -0,0 +1,202 @@
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# 時刻(秒)を日に変換する際の1日の秒数
+SECONDS_PER_DAY = 24 * 60 * 60
+# 減衰の基準時刻からこの半減期の数だけ進んだら、基準時刻を進めて値を正規化する(float64の桁あふれを防ぐ)
+MAX_HALF_LIVES = 64
+# アイテムごとの値を持つ配列(最後の次元がアイテム)
+_ITEM_ARRAYS = (
+    "decayed_count",
+    "decayed_sum",
+    "bucket_count",
+    "bucket_sum",
+    "window_count",
+    "window_sum",
+)
+
+
+class StreamingAggregates:
+    """アイテムごとの評価数と評価値の合計を、時間で減衰させた値と直近の期間の値で保持する
+
+    評価のイベントを1件ずつ、または数件ずつまとめてupdateに渡せば、全件を集計し直さずに更新できる。
+    全てのイベントを一度にupdateに渡せば、ベクトル演算の1回の走査で作り直せる。
+
+    - 減衰: 評価の重みを、最新の時刻から半減期(half_life_days)が経つごとに半分にする。
+      基準時刻からの経過で重みを付けて足しておき(forward decay)、読み出す時刻で割り戻すため、
+      1件の更新で全アイテムの値を減衰させる必要はない。
+    - 期間: 日ごとのアイテムの値をリングバッファに持ち、期間ごとの合計に足す。
+      日が進んだら、期間から外れた日の値を合計から引く。期間は日単位で、最新の評価の日を含む。
+    """
+
+    def __init__(
+        self, num_items: int, half_life_days: float, windows_days: Sequence[int]
+    ):
+        self.half_life = half_life_days * SECONDS_PER_DAY
+        self.windows_days = np.asarray(windows_days, dtype=np.int64)
+        num_buckets = int(self.windows_days.max(initial=1))
+        # 減衰させた評価数と評価値の合計(基準時刻landmarkでの重み)
+        self.landmark = 0
+        self.decayed_count = np.zeros(num_items)
+        self.decayed_sum = np.zeros(num_items)
+        # 最新の評価の時刻と日
+        self.latest_timestamp = 0
+        self.latest_day = 0
+        # 日ごと(日 % バケット数)のアイテムの評価数と評価値の合計
+        self.bucket_count = np.zeros((num_buckets, num_items))
+        self.bucket_sum = np.zeros((num_buckets, num_items))
+        # 期間ごとのアイテムの評価数と評価値の合計
+        self.window_count = np.zeros((len(self.windows_days), num_items))
+        self.window_sum = np.zeros((len(self.windows_days), num_items))
+
+    @classmethod
+    def from_events(
+        cls,
+        item_index: np.ndarray,
+        ratings: np.ndarray,
+        timestamps: np.ndarray,
+        num_items: int,
+        half_life_days: float,
+        windows_days: Sequence[int],
+    ) -> "StreamingAggregates":
+        """全ての評価のイベントから、1回の走査で作成する
+
+        Args:
+            item_index (np.ndarray): 各評価のアイテムのインデックス
+            ratings (np.ndarray): 各評価の評価値
+            timestamps (np.ndarray): 各評価の時刻(秒)
+            num_items (int): アイテム数
+            half_life_days (float): 減衰の半減期(日)
+            windows_days (Sequence[int]): 集計する期間(日)
+
+        Returns:
+            StreamingAggregates: 集計した値
+        """
+        aggregates = cls(num_items, half_life_days, windows_days)
+        aggregates.update(item_index, ratings, timestamps)
+        return aggregates
+
+    def update(
+        self, item_index: np.ndarray, ratings: np.ndarray, timestamps: np.ndarray
+    ) -> None:
+        """新しい評価のイベントを足す。最新の時刻より古いイベントも、その時刻の重みで足す
+
+        Args:
+            item_index (np.ndarray): 各評価のアイテムのインデックス
+            ratings (np.ndarray): 各評価の評価値
+            timestamps (np.ndarray): 各評価の時刻(秒)
+        """
+        item_index = np.asarray(item_index, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(item_index) == 0:
+            return
+        self._advance(int(timestamps.max()))
+
+        # 減衰: 基準時刻からの経過に応じた重みで足す
+        weights = np.exp2((timestamps - self.landmark) / self.half_life)
+        np.add.at(self.decayed_count, item_index, weights)
+        np.add.at(self.decayed_sum, item_index, weights * ratings)
+
+        # 期間: リングバッファに残っている日のイベントだけを、日と期間の合計に足す
+        days = timestamps // SECONDS_PER_DAY
+        age = self.latest_day - days
+        in_buckets = age < len(self.bucket_count)
+        slots = days[in_buckets] % len(self.bucket_count)
+        np.add.at(self.bucket_count, (slots, item_index[in_buckets]), 1)
+        np.add.at(self.bucket_sum, (slots, item_index[in_buckets]), ratings[in_buckets])
+        for window, days_in_window in enumerate(self.windows_days):
+            in_window = age < days_in_window
+            np.add.at(self.window_count[window], item_index[in_window], 1)
+            np.add.at(
+                self.window_sum[window], item_index[in_window], ratings[in_window]
+            )
+
+    def decayed(self) -> Tuple[np.ndarray, np.ndarray]:
+        """最新の評価の時刻まで減衰させた、アイテムごとの評価数と評価値の合計"""
+        scale = np.exp2(-(self.latest_timestamp - self.landmark) / self.half_life)
+        return self.decayed_count * scale, self.decayed_sum * scale
+
+    def window(self, days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """最新の評価の日を含む直近days日の、アイテムごとの評価数と評価値の合計"""
+        position = np.flatnonzero(self.windows_days == days)
+        if len(position) == 0:
+            raise ValueError(
+                f"unknown window {days}, expected one of {self.windows_days.tolist()}"
+            )
+        return self.window_count[position[0]], self.window_sum[position[0]]
+
+    def resize(self, position: np.ndarray, num_items: int) -> None:
+        """アイテムの並びが変わった場合に、保持している値を新しい並びでの位置に移す
+
+        Args:
+            position (np.ndarray): 今までの各アイテムの、新しい並びでのインデックス
+            num_items (int): 新しいアイテム数
+        """
+        for name in _ITEM_ARRAYS:
+            values = getattr(self, name)
+            resized = np.zeros(values.shape[:-1] + (num_items,))
+            resized[..., position] = values
+            setattr(self, name, resized)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {
+            "half_life": np.array(self.half_life),
+            "windows_days": self.windows_days,
+            "landmark": np.array(self.landmark),
+            "latest_timestamp": np.array(self.latest_timestamp),
+            "latest_day": np.array(self.latest_day),
+        }
+        arrays.update({name: getattr(self, name) for name in _ITEM_ARRAYS})
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "StreamingAggregates":
+        aggregates = cls(0, 1, [])
+        aggregates.half_life = float(arrays["half_life"])
+        aggregates.windows_days = np.asarray(arrays["windows_days"])
+        aggregates.landmark = int(arrays["landmark"])
+        aggregates.latest_timestamp = int(arrays["latest_timestamp"])
+        aggregates.latest_day = int(arrays["latest_day"])
+        # 更新で書き換えるため、メモリマップされた配列はコピーする
+        for name in _ITEM_ARRAYS:
+            setattr(aggregates, name, np.array(arrays[name]))
+        return aggregates
+
+    def _advance(self, timestamp: int) -> None:
+        # 最新の時刻を進め、期間から外れた日の値を期間の合計から引き、リングバッファから消す
+        if timestamp <= self.latest_timestamp:
+            return
+        day = timestamp // SECONDS_PER_DAY
+        if self.latest_timestamp == 0:
+            # 最初のイベント。基準時刻を最新の時刻にし、過去のイベントの重みを1以下にする
+            self.landmark = timestamp
+        elif day > self.latest_day:
+            num_buckets = len(self.bucket_count)
+            for window, days_in_window in enumerate(self.windows_days):
+                if day - self.latest_day >= days_in_window:
+                    self.window_count[window] = 0
+                    self.window_sum[window] = 0
+                    continue
+                leaving = np.arange(
+                    self.latest_day - days_in_window + 1, day - days_in_window + 1
+                )
+                slots = leaving % num_buckets
+                self.window_count[window] -= self.bucket_count[slots].sum(axis=0)
+                self.window_sum[window] -= self.bucket_sum[slots].sum(axis=0)
+            # リングバッファから外れる日(新しい日と同じ位置を使う)の値を消す
+            cleared = np.arange(
+                self.latest_day + 1, min(day, self.latest_day + num_buckets) + 1
+            )
+            self.bucket_count[cleared % num_buckets] = 0
+            self.bucket_sum[cleared % num_buckets] = 0
+
+        # 基準時刻から離れすぎた場合は、基準時刻を進めて値を割り戻す
+        if (timestamp - self.landmark) / self.half_life > MAX_HALF_LIVES:
+            scale = np.exp2(-(timestamp - self.landmark) / self.half_life)
+            self.decayed_count *= scale
+            self.decayed_sum *= scale
+            self.landmark = timestamp
+        self.latest_timestamp = timestamp
+        self.latest_day = day
@@ -0,0 +1,240 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+# スコアの与え方
+# - 1次元配列: 全ユーザー共通のアイテムのスコア
+# - 2次元配列・疎行列: ユーザー×アイテムのスコア(疎行列の場合、値のないアイテムは推薦しない)
+# - 関数: ユーザーの行インデックス(-1を含む)を受け取り、そのユーザー×アイテムのスコアを新しい配列で返す
+Scores = Union[np.ndarray, sparse.spmatrix, Callable[[np.ndarray], np.ndarray]]
+
+
+def top_k_unseen(
+    scores: Scores,
+    seen: sparse.csr_matrix,
+    k: int = 10,
+    user_index: Optional[np.ndarray] = None,
+    block_size: int = 1024,
+) -> np.ndarray:
+    """各ユーザーについて、評価済みのアイテムを除いたスコア上位k件のアイテムを返す
+
+    ユーザーをblock_size人ずつのブロックに分け、ブロック単位でスコアの行列を作成し、
+    評価済みのアイテムのスコアを-infにしてからargpartitionで上位k件を選ぶ。
+    全ユーザー共通のスコアの場合は、スコア順に並べてtop_k_rankedで選ぶ。
+    同じスコアのアイテムはインデックスの小さい順に並べる。スコアが-infのアイテムは推薦しない。
+
+    Args:
+        scores (Scores): アイテムのスコア
+        seen (sparse.csr_matrix): ユーザー×アイテムの評価済みの行列
+        k (int): 推薦するアイテム数
+        user_index (Optional[np.ndarray]): 対象ユーザーの行インデックス。Noneの場合は全ユーザー。
+            -1は評価済みのアイテムがないユーザーとして扱う
+        block_size (int): 1ブロックあたりのユーザー数
+
+    Returns:
+        np.ndarray: ユーザー×k件のアイテムのインデックス。推薦できるアイテムがk件未満の場合は-1で埋める
+    """
+    if user_index is None:
+        user_index = np.arange(seen.shape[0])
+    num_items = seen.shape[1]
+    top_items = np.full((len(user_index), k), -1, dtype=np.int64)
+    if num_items == 0 or k == 0:
+        return top_items
+    if isinstance(scores, np.ndarray) and scores.ndim == 1:
+        return _top_k_ranked(scores, seen, k, user_index, block_size)
+
+    for start in range(0, len(user_index), block_size):
+        block_users = user_index[start : start + block_size]
+        block = _score_block(scores, block_users, num_items)
+
+        # 評価済みのアイテムのスコアを-infにする
+        block_seen = seen_rows(seen, block_users)
+        rows = np.repeat(np.arange(len(block_users)), np.diff(block_seen.indptr))
+        block[rows, block_seen.indices] = -np.inf
+
+        if k < num_items:
+            candidates = np.argpartition(block, num_items - k, axis=1)[:, -k:]
+        else:
+            candidates = np.broadcast_to(np.arange(num_items), block.shape)
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        # スコアの降順、同じスコアならインデックスの昇順に並べる
+        order = np.lexsort((candidates, -candidate_scores))
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+        width = candidates.shape[1]
+        top_items[start : start + len(block_users), :width] = np.where(
+            np.isneginf(candidate_scores), -1, candidates
+        )
+
+    return top_items
+
+
+def to_user2items(
+    top_items: np.ndarray, user_ids: np.ndarray, movie_ids: np.ndarray
+) -> Dict[int, List[int]]:
+    """top_k_unseenの結果をユーザーIDと映画IDの対応に変換する
+
+    Args:
+        top_items (np.ndarray): ユーザー×k件のアイテムのインデックス
+        user_ids (np.ndarray): 各行のユーザーID
+        movie_ids (np.ndarray): アイテムのインデックスに対応する映画ID
+
+    Returns:
+        Dict[int, List[int]]: キーはユーザーIDで、値はおすすめの映画IDのリスト
+    """
+    valid = top_items >= 0
+    top_movie_ids = np.where(valid, movie_ids[np.maximum(top_items, 0)], 0).tolist()
+    num_valid = valid.sum(axis=1).tolist()
+    return {
+        user_id: row[:n]
+        for user_id, row, n in zip(user_ids.tolist(), top_movie_ids, num_valid)
+    }
+
+
+def latest_per_row(
+    row_index: np.ndarray, timestamps: np.ndarray, num_rows: int, size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """行(ユーザーなど)ごとに、時刻の新しいsize件の要素を選ぶ
+
+    同じ時刻の要素は、後に並んでいるものを新しいとみなす。
+
+    Args:
+        row_index (np.ndarray): 各要素の行インデックス
+        timestamps (np.ndarray): 各要素の時刻
+        num_rows (int): 行数
+        size (int): 行ごとに選ぶ要素の数
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 行ごとの区切り位置(indptr)と、選んだ要素の入力での位置。
+            位置は行の昇順、同じ行の中では時刻の古い順に並ぶ
+    """
+    # 行ごとに時刻の古い順に並べ、末尾からsize個を残す
+    order = np.lexsort((timestamps, row_index))
+    sorted_rows = row_index[order]
+    num_elements = np.bincount(sorted_rows, minlength=num_rows)
+    position_from_end = np.cumsum(num_elements)[sorted_rows] - np.arange(len(order))
+    indptr = np.concatenate([[0], np.cumsum(np.minimum(num_elements, size))])
+    return indptr, order[position_from_end <= size]
+
+
+def seen_rows(seen: sparse.csr_matrix, user_index: np.ndarray) -> sparse.csr_matrix:
+    """評価済みの行列から指定したユーザーの行を取り出す
+
+    Args:
+        seen (sparse.csr_matrix): ユーザー×アイテムの評価済みの行列
+        user_index (np.ndarray): ユーザーの行インデックス。-1の場合は空の行とする
+
+    Returns:
+        sparse.csr_matrix: 指定したユーザー×アイテムの評価済みの行列
+    """
+    rows = seen[np.maximum(user_index, 0)]
+    if (user_index < 0).any():
+        rows = sparse.diags((user_index >= 0).astype(seen.dtype)) @ rows
+        rows.eliminate_zeros()
+    return rows
+
+
+def top_k_ranked(
+    ranked: np.ndarray,
+    seen: sparse.csr_matrix,
+    k: int = 10,
+    user_index: Optional[np.ndarray] = None,
+    block_size: int = 1024,
+) -> np.ndarray:
+    """全ユーザー共通の順位に並べたアイテムから、各ユーザーの評価済みのアイテムを除いた先頭k件を返す
+
+    ユーザーごとに、並べたアイテムの先頭から(k + 評価済みのうち順位の付いたアイテム数)件だけを走査する。
+    ユーザーを評価済み数の順に並べてからブロックに分けるため、評価済み数の多いユーザーが
+    同じブロックの他のユーザーの走査範囲を広げることはない。計算量は全アイテム数によらない。
+
+    Args:
+        ranked (np.ndarray): 推薦する順に並べたアイテムのインデックス
+        seen (sparse.csr_matrix): ユーザー×アイテムの評価済みの行列
+        k (int): 推薦するアイテム数
+        user_index (Optional[np.ndarray]): 対象ユーザーの行インデックス。Noneの場合は全ユーザー。
+            -1は評価済みのアイテムがないユーザーとして扱う
+        block_size (int): 1ブロックあたりのユーザー数
+
+    Returns:
+        np.ndarray: ユーザー×k件のアイテムのインデックス。推薦できるアイテムがk件未満の場合は-1で埋める
+    """
+    if user_index is None:
+        user_index = np.arange(seen.shape[0])
+    top_items = np.full((len(user_index), k), -1, dtype=np.int64)
+    if len(ranked) == 0 or k == 0:
+        return top_items
+    # 各アイテムの順位。順位の付いていないアイテムはlen(ranked)とする
+    rank = np.full(seen.shape[1], len(ranked))
+    rank[ranked] = np.arange(len(ranked))
+
+    num_seen = np.where(user_index >= 0, np.diff(seen.indptr)[user_index], 0)
+    user_order = np.argsort(num_seen, kind="stable")
+    for start in range(0, len(user_index), block_size):
+        positions = user_order[start : start + block_size]
+        block_seen = seen_rows(seen, user_index[positions])
+        rows = np.repeat(np.arange(len(positions)), np.diff(block_seen.indptr))
+        seen_rank = rank[block_seen.indices]
+
+        # 上位k件は、順位が(k + 順位の付いた評価済みのアイテム数)未満のアイテムに必ず含まれる
+        ranked_seen = np.bincount(
+            rows[seen_rank < len(ranked)], minlength=len(positions)
+        )
+        width = min(len(ranked), k + int(ranked_seen.max(initial=0)))
+        unseen = np.ones((len(positions), width), dtype=bool)
+        in_range = seen_rank < width
+        unseen[rows[in_range], seen_rank[in_range]] = False
+
+        # 未評価のアイテムを順位を保ったまま先頭に集める
+        columns = np.argsort(~unseen, axis=1, kind="stable")[:, :k]
+        is_unseen = np.take_along_axis(unseen, columns, axis=1)
+        top_items[positions, : columns.shape[1]] = np.where(
+            is_unseen, ranked[columns], -1
+        )
+
+    return top_items
+
+
+def _top_k_ranked(
+    scores: np.ndarray,
+    seen: sparse.csr_matrix,
+    k: int,
+    user_index: np.ndarray,
+    block_size: int,
+) -> np.ndarray:
+    # スコアの降順(同じスコアならインデックスの昇順)に並べ、スコアが-infのアイテムを除く
+    order = np.argsort(-scores, kind="stable")
+    order = order[~np.isneginf(scores[order])]
+    return top_k_ranked(order, seen, k=k, user_index=user_index, block_size=block_size)
+
+
+def _score_block(scores: Scores, block_users: np.ndarray, num_items: int) -> np.ndarray:
+    # 評価済みのアイテムを-infで上書きするため、必ず新しい浮動小数点数の配列を返す
+    if callable(scores):
+        block = np.asarray(scores(block_users))
+        return block.astype(_float_dtype(block), copy=False)
+    if scores.ndim == 1:
+        block = np.empty((len(block_users), num_items), dtype=_float_dtype(scores))
+        block[:] = scores
+        return block
+
+    # 行インデックスが-1のユーザーにはスコアがないものとする
+    rows = np.maximum(block_users, 0)
+    if sparse.issparse(scores):
+        block_scores = sparse.csr_matrix(scores)[rows]
+        block = np.full((len(block_users), num_items), -np.inf)
+        nonzero_rows = np.repeat(
+            np.arange(len(block_users)), np.diff(block_scores.indptr)
+        )
+        block[nonzero_rows, block_scores.indices] = block_scores.data
+    else:
+        block = scores[rows].astype(_float_dtype(scores), copy=False)
+    block[block_users < 0] = -np.inf
+    return block
+
+
+def _float_dtype(scores: np.ndarray) -> np.dtype:
+    if np.issubdtype(scores.dtype, np.floating):
+        return scores.dtype
+    return np.dtype(np.float64)
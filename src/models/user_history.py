@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def chronological_order(user_ids: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    """ユーザーの昇順、同じユーザーの中では時刻の古い順に並べる行の順番(安定ソート)
+
+    Args:
+        user_ids (np.ndarray): 各評価のユーザーID
+        timestamps (np.ndarray): 各評価の時刻
+
+    Returns:
+        np.ndarray: 並べ替えた行の位置
+    """
+    return np.lexsort((timestamps, user_ids))
+
+
+def is_chronological(user_ids: np.ndarray, timestamps: np.ndarray) -> bool:
+    """評価がすでにユーザーの昇順、同じユーザーの中では時刻の古い順に並んでいるか"""
+    user_step = np.diff(user_ids)
+    return bool(
+        ((user_step > 0) | ((user_step == 0) & (np.diff(timestamps) >= 0))).all()
+    )
+
+
+class UserHistory:
+    """ユーザーごとの評価を時刻の古い順に並べた履歴(CSR形式)
+
+    ユーザーIDを昇順に並べ、i番目のユーザーの評価は各配列のindptr[i]からindptr[i + 1]の範囲に
+    時刻の古い順で並ぶ。同じ時刻の評価は、後に並んでいるものを新しいとみなす。
+    並べ替えは作成時の1回の安定ソートだけで、すでに並んでいる評価データからはソートせずに作る。
+    ユーザーの直近の評価や、ユーザーごとの映画の一覧は範囲の切り出しで求める。
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        indptr: np.ndarray,
+        movie_ids: np.ndarray,
+        ratings: np.ndarray,
+        timestamps: np.ndarray,
+    ):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.movie_ids = movie_ids
+        self.ratings = ratings
+        self.timestamps = timestamps
+
+    @classmethod
+    def from_frame(cls, ratings: pd.DataFrame) -> "UserHistory":
+        """評価データから履歴を作成する
+
+        Args:
+            ratings (pd.DataFrame): user_id, movie_id, rating, timestampを持つ評価データ
+
+        Returns:
+            UserHistory: ユーザーごとの履歴
+        """
+        user_ids = ratings.user_id.to_numpy()
+        movie_ids = ratings.movie_id.to_numpy()
+        rating = ratings.rating.to_numpy()
+        timestamps = ratings.timestamp.to_numpy()
+        if not is_chronological(user_ids, timestamps):
+            order = chronological_order(user_ids, timestamps)
+            user_ids, movie_ids, rating, timestamps = (
+                user_ids[order],
+                movie_ids[order],
+                rating[order],
+                timestamps[order],
+            )
+        # ユーザーが切り替わる位置を区切りにする
+        user_start = np.flatnonzero(
+            np.concatenate([[True], user_ids[1:] != user_ids[:-1]])
+        )
+        return cls(
+            user_ids[user_start],
+            np.append(user_start, len(user_ids)).astype(np.int64),
+            movie_ids,
+            rating,
+            timestamps,
+        )
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    def user_rows(self) -> np.ndarray:
+        """各評価のユーザーのインデックス"""
+        return np.repeat(np.arange(len(self.user_ids)), np.diff(self.indptr))
+
+    def movies(self, user_index: int) -> np.ndarray:
+        """指定したユーザーが評価した映画ID(時刻の古い順)"""
+        return self.movie_ids[self.indptr[user_index] : self.indptr[user_index + 1]]
+
+    def latest(
+        self, size: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ユーザーごとに、時刻の新しいsize件の評価を選ぶ
+
+        Args:
+            size (int): ユーザーごとに選ぶ評価の数
+            mask (Optional[np.ndarray]): 対象にする評価(高評価など)。Noneの場合は全ての評価
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: ユーザーごとの区切り位置(indptr)と、選んだ評価の履歴での位置。
+                位置はユーザーの昇順、同じユーザーの中では時刻の古い順に並ぶ
+        """
+        positions = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        rows = self.user_rows()[positions]
+        num_elements = np.bincount(rows, minlength=len(self.user_ids))
+        # すでに時刻の順に並んでいるため、ユーザーの末尾からの順番で選ぶ
+        position_from_end = np.cumsum(num_elements)[rows] - np.arange(len(positions))
+        indptr = np.concatenate([[0], np.cumsum(np.minimum(num_elements, size))])
+        return indptr, positions[position_from_end <= size]
+
+    def to_user2items(self, mask: Optional[np.ndarray] = None) -> Dict[int, List[int]]:
+        """ユーザーIDごとに、評価した映画IDのリスト(時刻の古い順)を作る
+
+        Args:
+            mask (Optional[np.ndarray]): 対象にする評価(高評価など)。Noneの場合は全ての評価
+
+        Returns:
+            Dict[int, List[int]]: キーはユーザーIDで、値は映画IDのリスト。対象の評価がないユーザーは含めない
+        """
+        indptr, positions = self.latest(len(self), mask)
+        has_items = np.diff(indptr) > 0
+        movie_ids = np.split(self.movie_ids[positions], indptr[1:-1])
+        return {
+            user_id: items.tolist()
+            for user_id, items, keep in zip(
+                self.user_ids.tolist(), movie_ids, has_items
+            )
+            if keep
+        }
@@ -0,0 +1,70 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.dataset import Dataset
+from src.models.item_features import ItemFeatures
+
+GENRES = ["Action", "Comedy", "Drama", "Romance"]
+
+
+def _ratings(
+    num_users: int, num_movies: int, num_ratings: int, seed: int
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # 同じユーザーと映画の組は1つだけにする
+    pairs = rng.choice(num_users * num_movies, num_ratings, replace=False)
+    return pd.DataFrame(
+        {
+            "user_id": (pairs // num_movies + 1).astype(np.int32),
+            "movie_id": (pairs % num_movies + 1).astype(np.int32),
+            "rating": (rng.integers(1, 11, num_ratings) / 2).astype(np.float32),
+            "timestamp": rng.integers(
+                1_000_000_000, 1_000_000_000 + 60 * 86_400, num_ratings
+            ),
+        }
+    )
+
+
+@pytest.fixture
+def ratings() -> pd.DataFrame:
+    """200人のユーザーが80本の映画に付けた評価データ"""
+    return _ratings(num_users=200, num_movies=80, num_ratings=4_000, seed=0)
+
+
+@pytest.fixture
+def make_dataset() -> Callable[[pd.DataFrame], Dataset]:
+    """評価データを全て学習用データにしたDatasetを作る関数"""
+
+    def make(ratings: pd.DataFrame) -> Dataset:
+        movie_ids = np.arange(1, ratings.movie_id.max() + 1, dtype=np.int32)
+        movies = pd.DataFrame(
+            {
+                "movie_id": movie_ids,
+                "title": [f"movie {movie_id}" for movie_id in movie_ids],
+                "genres": [
+                    f"{GENRES[movie_id % 4]}|{GENRES[movie_id % 3]}"
+                    for movie_id in movie_ids
+                ],
+            }
+        )
+        tags = pd.DataFrame(
+            {
+                "user_id": np.ones(len(movie_ids), dtype=np.int32),
+                "movie_id": movie_ids,
+                "tag": [f"tag{movie_id % 5}" for movie_id in movie_ids],
+                "timestamp": np.zeros(len(movie_ids), dtype=np.int64),
+            }
+        )
+        ratings = ratings.sort_values(["user_id", "timestamp"], kind="stable")
+        return Dataset(
+            ratings=ratings.reset_index(drop=True),
+            num_train=len(ratings),
+            test_user2items={},
+            item_content=movies,
+            item_features=ItemFeatures.from_frames(movies, tags),
+        )
+
+    return make
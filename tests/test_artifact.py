@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.models.artifact import load_artifact, save_artifact
+
+
+def test_save_artifact_replaces_previous_artifact(tmp_path):
+    path = str(tmp_path / "model")
+    save_artifact(path, "Model", {"k": 1}, {"a": np.arange(3), "b": np.zeros(2)})
+    save_artifact(path, "Model", {"k": 2}, {"a": np.arange(5)})
+
+    params, arrays = load_artifact(path, "Model")
+    assert params == {"k": 2}
+    assert sorted(arrays) == ["a"]
+    np.testing.assert_array_equal(arrays["a"], np.arange(5))
+    # 一時ディレクトリと退避したディレクトリは残さない
+    assert sorted(os.listdir(tmp_path)) == ["model"]
+
+
+def test_save_artifact_refuses_to_overwrite_other_directory(tmp_path):
+    (tmp_path / "notes.txt").write_text("keep me")
+    (tmp_path / "sub").mkdir()
+
+    with pytest.raises(ValueError, match="not a model artifact"):
+        save_artifact(str(tmp_path), "Model", {}, {"a": np.arange(3)})
+
+    assert (tmp_path / "notes.txt").read_text() == "keep me"
+    assert (tmp_path / "sub").is_dir()
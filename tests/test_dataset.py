@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+
+def test_append_ratings_keeps_latest_rating_per_pair(ratings, make_dataset):
+    dataset = make_dataset(ratings)
+    # 疎行列を作成してから加え、作成済みの行列を更新する場合を確かめる
+    dataset.interaction_matrix
+    first, second = ratings.iloc[0], ratings.iloc[1]
+    new_ratings = pd.DataFrame(
+        {
+            "user_id": [first.user_id, second.user_id, 999],
+            "movie_id": [first.movie_id, second.movie_id, 1],
+            "rating": [5.0, 5.0, 3.0],
+            # 2行目は学習用データの評価より古いため加えない
+            "timestamp": [first.timestamp + 1, second.timestamp - 1, 0],
+        }
+    )
+
+    appended = dataset.append_ratings(new_ratings)
+
+    train = appended.train
+    assert len(train) == len(ratings) + 1
+    assert not train.duplicated(["user_id", "movie_id"]).any()
+    rating = train.set_index(["user_id", "movie_id"]).rating
+    assert rating[(first.user_id, first.movie_id)] == 5.0
+    assert rating[(second.user_id, second.movie_id)] == second.rating
+    # 更新した疎行列も、学習用データから作り直した行列と同じになる
+    expected = make_dataset(train).interaction_matrix
+    np.testing.assert_array_equal(
+        appended.interaction_matrix.rating.toarray(), expected.rating.toarray()
+    )
@@ -0,0 +1,68 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from src.models.frequent_itemsets import association_rules, frequent_itemsets
+
+
+def _transactions(seed: int, num_transactions: int = 150, num_items: int = 12):
+    rng = np.random.default_rng(seed)
+    probability = rng.uniform(0.1, 0.6, num_items)
+    return rng.random((num_transactions, num_items)) < probability
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_support_counts_match_brute_force(seed):
+    matrix = _transactions(seed)
+    item_names = np.arange(matrix.shape[1]) * 7 + 1
+
+    result = frequent_itemsets(
+        sparse.csr_matrix(matrix), min_support=0.1, max_len=3, item_names=item_names
+    )
+
+    expected = {}
+    for length in range(1, 4):
+        for items in itertools.combinations(range(matrix.shape[1]), length):
+            support = matrix[:, list(items)].all(axis=1).mean()
+            if support >= 0.1:
+                expected[frozenset(item_names[list(items)])] = support
+    actual = dict(zip(result.itemsets, result.support))
+    assert actual.keys() == expected.keys()
+    for itemset, support in expected.items():
+        assert actual[itemset] == pytest.approx(support)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_itemsets_and_rules_match_mlxtend(seed):
+    frequent_patterns = pytest.importorskip("mlxtend.frequent_patterns")
+    matrix = _transactions(seed)
+    item_names = np.arange(matrix.shape[1]) * 7 + 1
+
+    expected = frequent_patterns.apriori(
+        pd.DataFrame(matrix, columns=item_names), min_support=0.2, use_colnames=True
+    )
+    result = frequent_itemsets(
+        sparse.csr_matrix(matrix), min_support=0.2, item_names=item_names
+    )
+    assert dict(zip(result.itemsets, result.support)) == pytest.approx(
+        dict(zip(expected.itemsets, expected.support))
+    )
+
+    expected_rules = frequent_patterns.association_rules(
+        expected, metric="lift", min_threshold=1
+    )
+    rules = association_rules(result, metric="lift", min_threshold=1)
+    assert list(rules.columns) == list(expected_rules.columns)
+    assert dict(
+        zip(zip(rules.antecedents, rules.consequents), rules.lift)
+    ) == pytest.approx(
+        dict(
+            zip(
+                zip(expected_rules.antecedents, expected_rules.consequents),
+                expected_rules.lift,
+            )
+        )
+    )
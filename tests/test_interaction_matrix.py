@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from src.models.interaction_matrix import InteractionMatrix, latest_rating_mask
+from src.models.nmf_recommender import NMFRecommender
+from src.models.popularity_recommender import PopularityRecommender
+
+
+def _rating(user_id: int, movie_id: int, rating: float, timestamp: int) -> dict:
+    return {
+        "user_id": user_id,
+        "movie_id": movie_id,
+        "rating": rating,
+        "timestamp": timestamp,
+    }
+
+
+def test_append_replaces_rerated_pair():
+    matrix = InteractionMatrix.from_frame(
+        pd.DataFrame([_rating(1, 10, 3.0, 100), _rating(2, 20, 4.0, 100)])
+    )
+    appended = matrix.append(pd.DataFrame([_rating(1, 10, 1.0, 200)]))
+
+    assert appended.rating.nnz == 2
+    assert appended.rating_at([1, 2], [10, 20]).tolist() == [1.0, 4.0]
+    # 高評価の0/1の行列と評価済みの映画も、置き換えた評価値で作る
+    assert appended.binarized.nnz == 1
+    assert appended.seen_movie_index(0).tolist() == [0]
+
+
+def test_append_twice_is_idempotent():
+    matrix = InteractionMatrix.from_frame(pd.DataFrame([_rating(1, 10, 3.0, 100)]))
+    batch = pd.DataFrame([_rating(1, 10, 5.0, 200), _rating(1, 999, 2.0, 200)])
+    once = matrix.append(batch)
+    twice = once.append(batch)
+
+    assert twice.rating.nnz == 2
+    assert twice.rating_at([1, 1], [10, 999]).tolist() == [5.0, 2.0]
+    assert (twice.rating != once.rating).nnz == 0
+
+
+def test_latest_rating_mask_keeps_latest_timestamp():
+    ratings = pd.DataFrame(
+        [
+            _rating(1, 10, 2.0, 300),
+            _rating(1, 10, 4.0, 100),
+            _rating(1, 20, 1.0, 100),
+            _rating(1, 20, 3.0, 100),
+        ]
+    )
+    # 時刻が同じ場合は後の行を残す
+    assert latest_rating_mask(ratings).tolist() == [True, False, False, True]
+
+    matrix = InteractionMatrix.from_frame(pd.DataFrame([_rating(1, 10, 5.0, 50)]))
+    assert matrix.append(ratings).rating_at([1, 1], [10, 20]).tolist() == [2.0, 3.0]
+
+
+def test_partial_fit_with_rerating_matches_fit(ratings, make_dataset):
+    rerated = ratings.iloc[:100].assign(
+        rating=np.float32(0.5), timestamp=ratings.timestamp.max() + 1
+    )
+    full = pd.concat([ratings.iloc[100:], rerated], ignore_index=True)
+    expected = PopularityRecommender().fit(make_dataset(full), minimum_num_rating=1)
+
+    model = PopularityRecommender().fit(make_dataset(ratings), minimum_num_rating=1)
+    # 同じ評価を2回送っても、評価数と評価値の合計は1回分だけ変わる
+    model.partial_fit(rerated).partial_fit(rerated)
+
+    np.testing.assert_array_equal(model.movie_rating_count, expected.movie_rating_count)
+    np.testing.assert_allclose(model.movie_rating_sum, expected.movie_rating_sum)
+    np.testing.assert_array_equal(model.ranked_movies, expected.ranked_movies)
+
+
+def test_nmf_partial_fit_average_score_with_rerating(ratings, make_dataset):
+    model = NMFRecommender().fit(make_dataset(ratings), factors=3)
+    rerated = ratings.iloc[:50].assign(rating=np.float32(5.0))
+    model.partial_fit(rerated)
+
+    expected = pd.concat([ratings.iloc[50:], rerated]).rating.mean()
+    assert np.isclose(model.average_score, expected)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from src.models.item_knn_recommender import ItemKNNRecommender
+from src.models.neighbors import reindex_neighbors, top_k_neighbors, update_neighbors
+
+
+def _vectors(num_rows: int, seed: int) -> sparse.csr_matrix:
+    return sparse.random(
+        num_rows, 40, density=0.2, format="csr", random_state=seed, dtype=np.float32
+    )
+
+
+def test_top_k_neighbors_matches_brute_force():
+    vectors = _vectors(60, seed=0)
+    k = 5
+
+    neighbors = top_k_neighbors(vectors, k, block_size=16, num_threads=2)
+
+    scores = (vectors @ vectors.T).toarray()
+    np.fill_diagonal(scores, 0)
+    for row in range(vectors.shape[0]):
+        start, stop = neighbors.indptr[row], neighbors.indptr[row + 1]
+        expected = np.argsort(-scores[row], kind="stable")[:k]
+        expected = expected[scores[row, expected] > 0]
+        np.testing.assert_array_equal(neighbors.indices[start:stop], expected)
+        np.testing.assert_allclose(
+            neighbors.data[start:stop], scores[row, expected], rtol=1e-5
+        )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_update_neighbors_matches_recomputing(seed):
+    vectors = _vectors(80, seed=seed)
+    k = 5
+    neighbors = top_k_neighbors(vectors, k, block_size=16)
+
+    # 一部の行を変え、末尾に行を加える
+    rng = np.random.default_rng(seed)
+    changed = rng.choice(80, 6, replace=False)
+    updated = sparse.vstack(
+        [vectors.tolil(), _vectors(4, seed=seed + 100).tolil()]
+    ).tolil()
+    updated[changed] = _vectors(6, seed=seed + 200).toarray()
+    updated = updated.tocsr()
+    changed = np.concatenate([changed, np.arange(80, 84)])
+
+    result = update_neighbors(
+        reindex_neighbors(neighbors, np.arange(80), 84),
+        updated,
+        changed,
+        k,
+        block_size=16,
+    )
+
+    expected = top_k_neighbors(updated, k, block_size=16)
+    np.testing.assert_array_equal(result.indptr, expected.indptr)
+    np.testing.assert_array_equal(result.indices, expected.indices)
+    np.testing.assert_allclose(result.data, expected.data, rtol=1e-5)
+
+
+def test_item_knn_partial_fit_matches_fit(ratings, make_dataset):
+    base, delta = ratings.iloc[:3_600], ratings.iloc[3_600:]
+    params = {"num_neighbors": 10, "block_size": 32}
+
+    model = ItemKNNRecommender().fit(make_dataset(base), **params)
+    model.partial_fit(delta)
+    expected = ItemKNNRecommender().fit(make_dataset(ratings), **params)
+
+    np.testing.assert_array_equal(
+        model.interaction_matrix.movie_ids, expected.interaction_matrix.movie_ids
+    )
+    # 内積が同じ近傍の順番を除いて同じになるため、各行の近傍の内積を比べる
+    np.testing.assert_array_equal(model.neighbors.indptr, expected.neighbors.indptr)
+    np.testing.assert_allclose(model.neighbors.data, expected.neighbors.data, rtol=1e-5)
+    user_ids = ratings.user_id.unique()[:20]
+    assert model.recommend(user_ids) == expected.recommend(user_ids)
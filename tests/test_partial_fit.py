@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src.models.association_recommender import AssociationRecommender
+from src.models.content_recommender import ContentRecommender
+from src.models.popularity_recommender import PopularityRecommender
+
+
+@pytest.fixture
+def split(ratings):
+    """時刻の古い9割の評価と、それより後の1割の評価"""
+    ratings = ratings.sort_values("timestamp", kind="stable")
+    num_base = len(ratings) * 9 // 10
+    return ratings.iloc[:num_base], ratings.iloc[num_base:]
+
+
+def test_popularity_partial_fit_matches_fit(ratings, split, make_dataset):
+    base, delta = split
+    dataset = make_dataset(ratings)
+    params = {"minimum_num_rating": 20, "window_minimum_num_rating": 2}
+
+    model = PopularityRecommender().fit(make_dataset(base), **params)
+    model.partial_fit(delta, item_features=dataset.item_features)
+    expected = PopularityRecommender().fit(dataset, **params)
+
+    np.testing.assert_array_equal(model.movie_rating_count, expected.movie_rating_count)
+    np.testing.assert_allclose(model.movie_rating_sum, expected.movie_rating_sum)
+    np.testing.assert_array_equal(model.ranked_movies, expected.ranked_movies)
+    np.testing.assert_array_equal(model.segment_names, expected.segment_names)
+    np.testing.assert_array_equal(model.segment_indptr, expected.segment_indptr)
+    np.testing.assert_array_equal(model.segment_movies, expected.segment_movies)
+
+
+def test_content_partial_fit_matches_fit(ratings, split, make_dataset):
+    base, delta = split
+    dataset = make_dataset(ratings)
+    params = {"num_neighbors": 10}
+
+    model = ContentRecommender().fit(make_dataset(base), **params)
+    model.partial_fit(delta, item_features=dataset.item_features)
+    expected = ContentRecommender().fit(dataset, **params)
+
+    assert (model.recent != expected.recent).nnz == 0
+    user_ids = ratings.user_id.unique()[:20]
+    assert model.recommend(user_ids) == expected.recommend(user_ids)
+
+
+def test_association_partial_fit_with_refit_matches_fit(ratings, split, make_dataset):
+    base, delta = split
+    params = {"min_support": 0.02, "max_len": 2}
+
+    model = AssociationRecommender().fit(make_dataset(base), **params)
+    model.partial_fit(delta, refit=True)
+    expected = AssociationRecommender().fit(make_dataset(ratings), **params)
+
+    np.testing.assert_array_equal(model.itemset_movie_ids, expected.itemset_movie_ids)
+    np.testing.assert_array_equal(model.itemset_count, expected.itemset_count)
+    np.testing.assert_array_equal(model.recent_movie_ids, expected.recent_movie_ids)
+    user_ids = ratings.user_id.unique()[:20]
+    assert model.recommend(user_ids) == expected.recommend(user_ids)
+
+
+def test_association_partial_fit_counts_known_itemsets(ratings, split, make_dataset):
+    base, delta = split
+    params = {"min_support": 0.02, "max_len": 2, "max_drift": 1.0}
+
+    model = AssociationRecommender().fit(make_dataset(base), **params)
+    model.partial_fit(delta)
+
+    # 求め直さない場合も、保持している頻出アイテム集合の支持度は全ての評価で数えた値になる
+    binarized = make_dataset(ratings).interaction_matrix
+    for itemset in range(len(model.itemset_indptr) - 1):
+        movie_ids = model.itemset_movie_ids[
+            model.itemset_indptr[itemset] : model.itemset_indptr[itemset + 1]
+        ]
+        columns = binarized.binarized[:, binarized.movie_index(movie_ids)]
+        expected = np.sum(np.asarray(columns.sum(axis=1)).ravel() == len(movie_ids))
+        assert model.itemset_count[itemset] == expected
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from src.models.streaming_aggregates import SECONDS_PER_DAY, StreamingAggregates
+
+NUM_ITEMS = 5
+WINDOWS_DAYS = [7, 30]
+HALF_LIFE_DAYS = 7
+
+
+def _events(seed: int, num_events: int = 400):
+    rng = np.random.default_rng(seed)
+    # 60日間のイベントを時刻の順に並べ、期間より長い間隔も入れる
+    timestamps = np.sort(rng.integers(0, 60 * SECONDS_PER_DAY, num_events))
+    timestamps[num_events // 2 :] += 40 * SECONDS_PER_DAY
+    timestamps += 1_000_000_000
+    items = rng.integers(0, NUM_ITEMS, num_events)
+    ratings = rng.integers(1, 11, num_events) / 2
+    return items, ratings, timestamps
+
+
+def _expected_window(items, ratings, timestamps, days):
+    age = timestamps.max() // SECONDS_PER_DAY - timestamps // SECONDS_PER_DAY
+    in_window = age < days
+    return (
+        np.bincount(items[in_window], minlength=NUM_ITEMS),
+        np.bincount(items[in_window], weights=ratings[in_window], minlength=NUM_ITEMS),
+    )
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_updates_match_one_pass(seed):
+    items, ratings, timestamps = _events(seed)
+    one_pass = StreamingAggregates.from_events(
+        items, ratings, timestamps, NUM_ITEMS, HALF_LIFE_DAYS, WINDOWS_DAYS
+    )
+    incremental = StreamingAggregates(NUM_ITEMS, HALF_LIFE_DAYS, WINDOWS_DAYS)
+    batch_size = seed * 7 + 1
+    for start in range(0, len(items), batch_size):
+        stop = start + batch_size
+        incremental.update(
+            items[start:stop], ratings[start:stop], timestamps[start:stop]
+        )
+
+    for days in WINDOWS_DAYS:
+        expected_count, expected_sum = _expected_window(
+            items, ratings, timestamps, days
+        )
+        for aggregates in [one_pass, incremental]:
+            count, rating_sum = aggregates.window(days)
+            np.testing.assert_allclose(count, expected_count, atol=1e-9)
+            np.testing.assert_allclose(rating_sum, expected_sum, atol=1e-9)
+
+    weights = np.exp2(
+        -(timestamps.max() - timestamps) / (HALF_LIFE_DAYS * SECONDS_PER_DAY)
+    )
+    for aggregates in [one_pass, incremental]:
+        count, rating_sum = aggregates.decayed()
+        np.testing.assert_allclose(
+            count, np.bincount(items, weights=weights, minlength=NUM_ITEMS)
+        )
+        np.testing.assert_allclose(
+            rating_sum,
+            np.bincount(items, weights=weights * ratings, minlength=NUM_ITEMS),
+        )
+
+
+def test_window_is_emptied_after_long_gap():
+    aggregates = StreamingAggregates.from_events(
+        np.array([0, 1]),
+        np.array([4.0, 5.0]),
+        np.array([0, SECONDS_PER_DAY]) + 1_000_000_000,
+        NUM_ITEMS,
+        HALF_LIFE_DAYS,
+        WINDOWS_DAYS,
+    )
+    aggregates.update(
+        np.array([2]), np.array([3.0]), np.array([1_000_000_000 + 31 * SECONDS_PER_DAY])
+    )
+
+    for days in WINDOWS_DAYS:
+        count, rating_sum = aggregates.window(days)
+        np.testing.assert_array_equal(count, [0, 0, 1, 0, 0])
+        np.testing.assert_array_equal(rating_sum, [0, 0, 3, 0, 0])
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from src.jobs.update import select_new_ratings
+
+
+def test_select_new_ratings_skips_applied_and_unknown_movies():
+    stored = {
+        "user_id": np.array([1, 1, 2], dtype=np.int32),
+        "movie_id": np.array([10, 20, 10], dtype=np.int32),
+        "rating": np.array([3.0, 4.0, 5.0], dtype=np.float32),
+        "timestamp": np.array([100, 100, 100]),
+    }
+    ratings = pd.DataFrame(
+        {
+            "user_id": [1, 1, 1, 1, 2],
+            "movie_id": [10, 20, 20, 999, 30],
+            "rating": [3.0, 1.0, 2.0, 5.0, 4.0],
+            "timestamp": [100, 200, 300, 200, 200],
+        }
+    )
+
+    selected = select_new_ratings(ratings, stored, np.array([10, 20, 30]))
+
+    # 評価データにある評価、映画データにない映画、同じ組の古い評価を除く
+    assert selected.to_dict("records") == [
+        {"user_id": 1, "movie_id": 20, "rating": 2.0, "timestamp": 300},
+        {"user_id": 2, "movie_id": 30, "rating": 4.0, "timestamp": 200},
+    ]
+    # 同じイベントを再び選ぶ場合は、評価データに追加した評価を除く
+    appended = {
+        col: np.concatenate([stored[col], selected[col].to_numpy()]) for col in stored
+    }
+    assert len(select_new_ratings(ratings, appended, np.array([10, 20, 30]))) == 0